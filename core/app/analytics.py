@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .bulk import upsert_increment
+from .db import SessionLocal
+from .models import (
+    AnalyticsCheckpoint,
+    Order as DbOrder,
+    OrderDwellHistogram,
+    OrderEvent as DbOrderEvent,
+    OrderStateHourly,
+)
+from .order_counters import order_summary
+from .state_machine import order_sm
+
+
+# SLA de permanência por estado, em segundos: "A_SEPARAR=14400,EM_SEPARACAO=3600"
+ORDER_SLA_SECONDS = os.getenv("ORDER_SLA_SECONDS", "")
+ANALYTICS_ROLLUP_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL_SECONDS", "60"))
+# eventos mais novos que isso ficam para a próxima rodada (transações ainda em voo)
+ANALYTICS_SETTLE_SECONDS = float(os.getenv("ANALYTICS_SETTLE_SECONDS", "60"))
+# janela por transação no backfill inicial
+ANALYTICS_ROLLUP_WINDOW_HOURS = int(os.getenv("ANALYTICS_ROLLUP_WINDOW_HOURS", "24"))
+
+DWELL_CHECKPOINT = "order_dwell"
+# buckets log: erro relativo de ~5% no percentil (metade de 10%), de 1 s a anos em ~250 buckets
+_GROWTH = 1.1
+_LOG_GROWTH = math.log(_GROWTH)
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def parse_sla(spec: str) -> dict[str, float]:
+    sla: dict[str, float] = {}
+    for part in spec.split(","):
+        state, sep, value = part.partition("=")
+        if sep and state.strip():
+            sla[state.strip()] = float(value)
+    return sla
+
+
+SLA_BY_STATE = parse_sla(ORDER_SLA_SECONDS)
+
+
+def _utc(dt: datetime) -> datetime:
+    # SQLite devolve datetimes sem fuso (gravados em UTC)
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def hour_key(dt: datetime) -> str:
+    return _utc(dt).strftime("%Y-%m-%dT%H")
+
+
+def bucket_of(seconds: float) -> int:
+    """0 = menos de 1 s; b >= 1 cobre [1.1^(b-1), 1.1^b)."""
+    if seconds < 1:
+        return 0
+    return 1 + int(math.log(seconds) / _LOG_GROWTH)
+
+
+def bucket_value(bucket: int) -> float:
+    """Valor representativo do bucket (média geométrica dos limites)."""
+    if bucket <= 0:
+        return 0.5
+    return _GROWTH ** (bucket - 1) * math.sqrt(_GROWTH)
+
+
+# ============================================================
+# Rollup incremental
+# ============================================================
+
+def _timelines(lo: datetime, hi: datetime):
+    """
+    Eventos (gravados até `hi`) dos pedidos que receberam evento gravado em `(lo, hi]`, em ordem
+    de `occurred_at` por pedido, com a criação do pedido. A janela segue `recorded_at` (relógio
+    do servidor): um evento com `occurredAt` retroativo entra na rodada em que foi gravado.
+    """
+    e = DbOrderEvent
+    touched = select(e.order_id).where(e.recorded_at > lo, e.recorded_at <= hi)
+    return (
+        select(e.order_id, e.event_id, e.from_status, e.occurred_at, e.recorded_at, DbOrder.created_at)
+        .join(DbOrder, DbOrder.order_id == e.order_id)
+        .where(e.order_id.in_(touched), e.recorded_at <= hi)
+        .order_by(e.order_id, e.occurred_at, e.event_id)
+    )
+
+
+def _exits(events: list[tuple], created_at: datetime) -> dict[str, tuple[str, datetime, float]]:
+    """Saídas de estado de uma linha do tempo: cada evento fecha a permanência em `from_status`,
+    que começou no evento anterior (ou na criação do pedido)."""
+    out = {}
+    started = created_at
+    for event_id, state, at in events:
+        out[event_id] = (state, at, max((at - started).total_seconds(), 0.0))
+        started = at
+    return out
+
+
+def _rollup_window(db: Session, lo: datetime, hi: datetime) -> int:
+    """
+    Soma aos rollups a diferença entre as saídas dos pedidos tocados com os eventos gravados até
+    `hi` e até `lo`. Um evento novo entra; se ele cair no meio da linha do tempo (retroativo), a
+    saída seguinte, já contada com outro início, é desfeita e contada de novo.
+    """
+    histogram: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+    hourly: defaultdict[tuple[str, str], list] = defaultdict(lambda: [0, 0.0, 0])
+
+    def count(state: str, at: datetime, seconds: float, sign: int) -> None:
+        hour = hour_key(at)
+        histogram[(hour, state, bucket_of(seconds))] += sign
+        row = hourly[(hour, state)]
+        row[0] += sign
+        row[1] += sign * seconds
+        sla = SLA_BY_STATE.get(state)
+        row[2] += sign * (sla is not None and seconds > sla)
+
+    seen = 0
+    rows = db.execute(_timelines(lo, hi).execution_options(yield_per=5000))
+    for _order_id, group in groupby(rows, key=itemgetter(0)):
+        created_at = None
+        now_events, before_events = [], []
+        for _, event_id, state, at, recorded_at, created in group:
+            created_at = _utc(created)
+            event = (event_id, state, _utc(at))
+            now_events.append(event)
+            if _utc(recorded_at) <= lo:
+                before_events.append(event)
+        after, before = _exits(now_events, created_at), _exits(before_events, created_at)
+        for event_id, exit_ in after.items():
+            old = before.get(event_id)
+            if old == exit_:
+                continue
+            if old is not None:
+                count(*old, -1)
+            else:
+                seen += 1
+            count(*exit_, 1)
+
+    upsert_increment(db, OrderDwellHistogram, [
+        {"hour": h, "state": s, "bucket": b, "count": n} for (h, s, b), n in histogram.items() if n
+    ], ("hour", "state", "bucket"))
+    upsert_increment(db, OrderStateHourly, [
+        {"hour": h, "state": s, "exits": n, "dwell_seconds": round(total, 3), "sla_breaches": breaches}
+        for (h, s), (n, total, breaches) in hourly.items()
+        if n or round(total, 3) or breaches
+    ], ("hour", "state"))
+    return seen
+
+
+def _advance_checkpoint(db: Session, previous: datetime | None, watermark: datetime) -> bool:
+    """CAS do checkpoint: só avança se ninguém avançou antes (outro worker rodando o rollup)."""
+    now = datetime.now(timezone.utc)
+    if previous is None:
+        try:
+            with db.begin_nested():
+                db.execute(insert(AnalyticsCheckpoint).values(name=DWELL_CHECKPOINT, watermark=watermark, updated_at=now))
+            return True
+        except IntegrityError:
+            return False
+    res = db.execute(
+        update(AnalyticsCheckpoint)
+        .where(AnalyticsCheckpoint.name == DWELL_CHECKPOINT, AnalyticsCheckpoint.watermark == previous)
+        .values(watermark=watermark, updated_at=now)
+    )
+    return res.rowcount == 1
+
+
+def run_dwell_rollup(db: Session, now: datetime | None = None) -> int:
+    """
+    Processa os eventos gravados (`recorded_at`) desde o checkpoint até
+    `now - ANALYTICS_SETTLE_SECONDS`, em janelas de `ANALYTICS_ROLLUP_WINDOW_HOURS`; cada janela
+    grava rollups e checkpoint na mesma transação. Retorna quantas saídas de estado foram agregadas.
+    """
+    hi = (now or datetime.now(timezone.utc)) - timedelta(seconds=ANALYTICS_SETTLE_SECONDS)
+    watermark = db.execute(
+        select(AnalyticsCheckpoint.watermark).where(AnalyticsCheckpoint.name == DWELL_CHECKPOINT)
+    ).scalar_one_or_none()
+    if watermark is not None:
+        cursor = _utc(watermark)
+    else:
+        first = db.execute(select(func.min(DbOrderEvent.recorded_at))).scalar()
+        if first is None:
+            db.rollback()
+            return 0
+        cursor = _utc(first) - timedelta(microseconds=1)
+
+    total = 0
+    step = timedelta(hours=max(1, ANALYTICS_ROLLUP_WINDOW_HOURS))
+    while cursor < hi:
+        end = min(cursor + step, hi)
+        seen = _rollup_window(db, cursor, end)
+        if not _advance_checkpoint(db, cursor if watermark is not None else None, end):
+            db.rollback()
+            log.warning("Rollup de permanência concorrente; rodada descartada.")
+            return total
+        db.commit()
+        total += seen
+        watermark = cursor = end
+    return total
+
+
+class DwellRollupJob:
+    """Roda `run_dwell_rollup` periodicamente (mesmo padrão do sweeper de idempotência)."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if ANALYTICS_ROLLUP_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def run_once() -> int:
+        with SessionLocal() as db:
+            return run_dwell_rollup(db)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL_SECONDS)
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:  # noqa: BLE001
+                log.exception("Falha no rollup de permanência.")
+
+
+dwell_rollup = DwellRollupJob()
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _percentile(buckets: list[tuple[int, int]], total: int, p: float) -> float | None:
+    if not total:
+        return None
+    rank = p * total
+    seen = 0
+    for bucket, n in buckets:
+        seen += n
+        if seen >= rank:
+            return round(bucket_value(bucket), 1)
+    return round(bucket_value(buckets[-1][0]), 1)
+
+
+def dwell_report(db: Session, since: datetime, until: datetime) -> dict[str, Any]:
+    """
+    Permanência por estado (p50/p90/p99, média, estouros de SLA) e vazão por hora no intervalo,
+    lidos só dos rollups (custo proporcional a horas × estados × buckets). Inclui os pedidos
+    parados agora além do SLA (`openBreaches`).
+    """
+    lo, hi = hour_key(since), hour_key(until)
+    buckets: defaultdict[str, list[tuple[int, int]]] = defaultdict(list)
+    for state, bucket, n in db.execute(
+        select(OrderDwellHistogram.state, OrderDwellHistogram.bucket, func.sum(OrderDwellHistogram.count))
+        .where(OrderDwellHistogram.hour >= lo, OrderDwellHistogram.hour <= hi)
+        .group_by(OrderDwellHistogram.state, OrderDwellHistogram.bucket)
+        .order_by(OrderDwellHistogram.state, OrderDwellHistogram.bucket)
+    ):
+        buckets[state].append((bucket, int(n)))
+
+    hourly = db.execute(
+        select(OrderStateHourly)
+        .where(OrderStateHourly.hour >= lo, OrderStateHourly.hour <= hi)
+        .order_by(OrderStateHourly.hour)
+    ).scalars().all()
+    totals: defaultdict[str, list] = defaultdict(lambda: [0, 0.0, 0])
+    throughput: dict[str, dict[str, int]] = {}
+    for row in hourly:
+        t = totals[row.state]
+        t[0] += row.exits
+        t[1] += float(row.dwell_seconds)
+        t[2] += row.sla_breaches
+        throughput.setdefault(row.hour, {})[row.state] = row.exits
+
+    in_state = order_summary(db)["byStatus"]
+    now = datetime.now(timezone.utc)
+    states = []
+    for state in order_sm.states:
+        if order_sm.is_final(state):
+            continue
+        exits, dwell_total, breaches = totals.get(state, (0, 0.0, 0))
+        sla = SLA_BY_STATE.get(state)
+        open_breaches = None
+        if sla is not None:
+            # updated_at = última transição do pedido parado no estado (o sync SAP só o move em A_SEPARAR)
+            open_breaches = db.execute(
+                select(func.count()).select_from(DbOrder)
+                .where(DbOrder.status == state, DbOrder.updated_at < now - timedelta(seconds=sla))
+            ).scalar_one()
+        hist = buckets.get(state, [])
+        states.append({
+            "state": state,
+            "exits": exits,
+            "avgSeconds": round(dwell_total / exits, 1) if exits else None,
+            "p50Seconds": _percentile(hist, exits, 0.50),
+            "p90Seconds": _percentile(hist, exits, 0.90),
+            "p99Seconds": _percentile(hist, exits, 0.99),
+            "slaSeconds": sla,
+            "slaBreaches": breaches if sla is not None else None,
+            "inState": in_state.get(state, 0),
+            "openBreaches": open_breaches,
+        })
+
+    watermark = db.execute(
+        select(AnalyticsCheckpoint.watermark).where(AnalyticsCheckpoint.name == DWELL_CHECKPOINT)
+    ).scalar_one_or_none()
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "watermark": _utc(watermark).isoformat() if watermark is not None else None,
+        "states": states,
+        "throughput": [{"hour": hour, "exits": exits} for hour, exits in throughput.items()],
+    }
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import typing
+from collections.abc import AsyncGenerator, Callable
+from typing import Any
+
+import anyio.to_thread
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .db import DB_ASYNC, SessionLocal, get_async_session
+
+
+# Tamanho do threadpool do Starlette no modo síncrono (padrão do anyio: 40).
+SYNC_THREADPOOL_SIZE = int(os.getenv("SYNC_THREADPOOL_SIZE", "40"))
+
+
+def configure_threadpool() -> None:
+    """Chamar no startup (precisa do event loop rodando)."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = SYNC_THREADPOOL_SIZE
+
+
+def db_route(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Adapta um handler síncrono que recebe `db: Session` ao modo do processo.
+
+    Com `DB_ASYNC` ligado devolve um handler `async` com `db: AsyncSession` que executa o
+    corpo original via `AsyncSession.run_sync`: o mesmo código ORM roda no event loop, com o
+    I/O do banco feito pelo driver assíncrono, sem ocupar uma thread por requisição.
+
+    Nos dois modos a sessão é fechada assim que o corpo retorna, devolvendo a conexão ao pool
+    antes da serialização da resposta. No modo síncrono isso evita o impasse entre pool e
+    threadpool: a serialização de rotas `def` também espera uma thread, e com todas as threads
+    paradas no checkout as conexões só voltavam pelo timeout do pool.
+    """
+    hints = typing.get_type_hints(fn)
+    params = []
+    for p in inspect.signature(fn).parameters.values():
+        if p.name == "db" and DB_ASYNC:
+            p = p.replace(annotation=AsyncSession, default=Depends(get_async_session))
+        else:
+            # anotações resolvidas aqui: o wrapper não enxerga os globais do módulo das rotas
+            p = p.replace(annotation=hints.get(p.name, p.annotation))
+        params.append(p)
+
+    if DB_ASYNC:
+        @functools.wraps(fn)
+        async def handler(*args: Any, db: AsyncSession, **kwargs: Any) -> Any:
+            try:
+                return await db.run_sync(lambda session: fn(*args, db=session, **kwargs))
+            finally:
+                await db.close()
+    else:
+        @functools.wraps(fn)
+        def handler(*args: Any, db: Session, **kwargs: Any) -> Any:
+            try:
+                return fn(*args, db=db, **kwargs)
+            finally:
+                db.close()
+
+    handler.__signature__ = inspect.Signature(params, return_annotation=hints.get("return", inspect.Signature.empty))
+    del handler.__wrapped__
+    return handler
+
+
+class SessionRunner:
+    """
+    Executa funções síncronas `fn(db, *args)` com a sessão da requisição, para rotas `async`
+    (NDJSON): no threadpool com `Session`, ou via `AsyncSession.run_sync` no modo assíncrono.
+    """
+
+    def __init__(self, session: Session | AsyncSession):
+        self.session = session
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args)
+        return await run_in_threadpool(fn, self.session, *args)
+
+
+async def get_session_runner() -> AsyncGenerator[SessionRunner, None]:
+    if DB_ASYNC:
+        async for db in get_async_session():
+            yield SessionRunner(db)
+        return
+    db = SessionLocal()
+    try:
+        yield SessionRunner(db)
+    finally:
+        await run_in_threadpool(db.close)
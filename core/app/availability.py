@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Float, cast, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import (
+    InventoryStock as DbInventoryStock,
+    Order as DbOrder,
+    OrderEvent as DbOrderEvent,
+    OrderItem as DbOrderItem,
+)
+
+
+# pedidos cujos itens ainda vão sair do estoque (demanda em aberto)
+AVAILABILITY_OPEN_STATUSES = frozenset(
+    s.strip() for s in os.getenv("AVAILABILITY_OPEN_STATUSES", "A_SEPARAR,EM_SEPARACAO").split(",") if s.strip()
+)
+# depósito das linhas sem WarehouseCode (pedidos criados no WMS); vazio = "sem depósito"
+AVAILABILITY_DEFAULT_WAREHOUSE = os.getenv("AVAILABILITY_DEFAULT_WAREHOUSE", "") or None
+# releitura dos pedidos alterados por outros workers
+AVAILABILITY_REFRESH_SECONDS = float(os.getenv("AVAILABILITY_REFRESH_SECONDS", "5"))
+# sobreposição da releitura: cobre transações que carimbaram o relógio do servidor antes do último corte
+AVAILABILITY_SETTLE_SECONDS = float(os.getenv("AVAILABILITY_SETTLE_SECONDS", "10"))
+AVAILABILITY_MAX_SKUS = int(os.getenv("AVAILABILITY_MAX_SKUS", "10000"))
+
+_IN_CHUNK = 1000
+_EPSILON = 1e-9
+
+# (sku, depósito, quantidade)
+Line = tuple[str, str | None, float]
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def is_open(status: str) -> bool:
+    return status in AVAILABILITY_OPEN_STATUSES
+
+
+def _line(sku: str, warehouse_code: str | None, quantity: Any) -> Line:
+    return sku, warehouse_code or AVAILABILITY_DEFAULT_WAREHOUSE, float(quantity)
+
+
+def _chunks(values: Sequence[str]) -> Iterable[Sequence[str]]:
+    for start in range(0, len(values), _IN_CHUNK):
+        yield values[start : start + _IN_CHUNK]
+
+
+def order_lines(db: Session, order_ids: Sequence[str]) -> dict[str, list[Line]]:
+    """Linhas dos pedidos, em consultas `IN` por lote."""
+    lines: defaultdict[str, list[Line]] = defaultdict(list)
+    for chunk in _chunks(list(order_ids)):
+        for order_id, sku, warehouse_code, quantity in db.execute(
+            select(DbOrderItem.order_id, DbOrderItem.sku, DbOrderItem.warehouse_code, cast(DbOrderItem.quantity, Float))
+            .where(DbOrderItem.order_id.in_(chunk))
+        ):
+            lines[order_id].append(_line(sku, warehouse_code, quantity))
+    return lines
+
+
+def ensure_availability_schema(engine: Engine) -> None:
+    """Startup: `order_items.warehouse_code` em bancos criados antes da coluna (o `create_all` não altera tabela)."""
+    columns = {c["name"] for c in inspect(engine).get_columns(DbOrderItem.__tablename__)}
+    if "warehouse_code" in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {DbOrderItem.__tablename__} ADD COLUMN warehouse_code VARCHAR(64)"))
+    log.info("Coluna order_items.warehouse_code adicionada.")
+
+
+# ============================================================
+# Índice em memória
+# ============================================================
+
+class AvailabilityIndex:
+    """
+    Demanda em aberto por SKU e depósito, mantida em memória do processo.
+
+    Guarda as linhas de cada pedido aberto, então qualquer mudança (criação, sync, transição)
+    é aplicada como "substitui as linhas do pedido" ou "remove o pedido", sem recalcular o resto.
+    As escritas deste processo entram logo após o commit (`AvailabilityDelta.publish`); as de
+    outros workers, pela releitura periódica dos pedidos alterados desde o último corte.
+
+    O marcador de mudança é sempre do relógio do servidor: `recorded_at` dos eventos (transições)
+    e `updated_at` dos pedidos criados, sincronizados ou reparados. O `updated_at` de uma
+    transição vem do `occurredAt` do cliente e pode estar no passado, então não serve de corte.
+    """
+
+    def __init__(self) -> None:
+        self._orders: dict[str, tuple[Line, ...]] = {}
+        self._demand: defaultdict[str, defaultdict[str | None, float]] = defaultdict(lambda: defaultdict(float))
+        self._watermark: datetime | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._watermark is not None
+
+    @property
+    def watermark(self) -> datetime | None:
+        return self._watermark
+
+    def _add(self, lines: Iterable[Line], sign: int) -> None:
+        for sku, warehouse_code, quantity in lines:
+            by_wh = self._demand[sku]
+            value = by_wh[warehouse_code] + sign * quantity
+            if abs(value) < _EPSILON:
+                del by_wh[warehouse_code]
+                if not by_wh:
+                    del self._demand[sku]
+            else:
+                by_wh[warehouse_code] = value
+
+    def _set(self, order_id: str, lines: Sequence[Line] | None) -> None:
+        old = self._orders.pop(order_id, None)
+        if old:
+            self._add(old, -1)
+        if lines:
+            self._orders[order_id] = tuple(lines)
+            self._add(lines, 1)
+
+    def apply(self, changes: dict[str, Sequence[Line] | None]) -> None:
+        """`{order_id: linhas}` para pedido aberto, `{order_id: None}` para pedido que saiu da demanda."""
+        with self._lock:
+            for order_id, lines in changes.items():
+                self._set(order_id, lines)
+
+    def rebuild(self, db: Session) -> int:
+        """Carga completa: itens de todos os pedidos abertos. Retorna quantos pedidos."""
+        started = datetime.now(timezone.utc)
+        orders: defaultdict[str, list[Line]] = defaultdict(list)
+        rows = db.execute(
+            select(DbOrderItem.order_id, DbOrderItem.sku, DbOrderItem.warehouse_code, cast(DbOrderItem.quantity, Float))
+            .join(DbOrder, DbOrder.order_id == DbOrderItem.order_id)
+            .where(DbOrder.status.in_(AVAILABILITY_OPEN_STATUSES))
+            .execution_options(yield_per=5000)
+        )
+        for order_id, sku, warehouse_code, quantity in rows:
+            orders[order_id].append(_line(sku, warehouse_code, quantity))
+        with self._lock:
+            self._orders.clear()
+            self._demand.clear()
+            for order_id, lines in orders.items():
+                self._set(order_id, lines)
+            self._watermark = started
+        return len(orders)
+
+    def refresh(self, db: Session) -> int:
+        """Relê os pedidos alterados desde o último corte (menos a sobreposição). Retorna quantos."""
+        if self._watermark is None:
+            return self.rebuild(db)
+        started = datetime.now(timezone.utc)
+        since = self._watermark - timedelta(seconds=AVAILABILITY_SETTLE_SECONDS)
+        transitioned = select(DbOrderEvent.order_id).where(DbOrderEvent.recorded_at > since)
+        status_by_order = dict(db.execute(
+            select(DbOrder.order_id, DbOrder.status)
+            .where((DbOrder.updated_at > since) | DbOrder.order_id.in_(transitioned))
+        ).all())
+        if status_by_order:
+            open_ids = [oid for oid, status in status_by_order.items() if is_open(status)]
+            lines = order_lines(db, open_ids)
+            self.apply({oid: lines.get(oid) if is_open(status) else None for oid, status in status_by_order.items()})
+        self._watermark = started
+        return len(status_by_order)
+
+    def lines(self, order_ids: Iterable[str]) -> dict[str, tuple[Line, ...]]:
+        """Linhas indexadas dos pedidos (só os abertos e já carregados aparecem)."""
+        with self._lock:
+            return {oid: self._orders[oid] for oid in order_ids if oid in self._orders}
+
+    def demand(self, skus: Iterable[str]) -> dict[str, dict[str | None, float]]:
+        with self._lock:
+            return {sku: dict(self._demand[sku]) for sku in skus if sku in self._demand}
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "openOrders": len(self._orders),
+                "skus": len(self._demand),
+                "watermark": self._watermark.isoformat() if self._watermark else None,
+            }
+
+
+availability_index = AvailabilityIndex()
+
+
+class AvailabilityDelta:
+    """
+    Mudanças de demanda de uma transação, no mesmo estilo de `CounterDelta`: acumule durante a
+    transação e chame `publish(db)` depois do commit (rollback não deixa rastro no índice).
+    """
+
+    def __init__(self) -> None:
+        self._changes: dict[str, list[Line] | None] = {}
+        self._reload: set[str] = set()
+
+    def lines(self, order_id: str, items: Iterable[Any]) -> AvailabilityDelta:
+        """Pedido aberto com estes itens (objetos com `sku`, `quantity` e, opcionalmente, `warehouse_code`)."""
+        self._changes[order_id] = [_line(it.sku, getattr(it, "warehouse_code", None), it.quantity) for it in items]
+        self._reload.discard(order_id)
+        return self
+
+    def move(self, order_id: str, from_status: str, to_status: str) -> AvailabilityDelta:
+        if is_open(from_status) and not is_open(to_status):
+            self._changes[order_id] = None
+            self._reload.discard(order_id)
+        elif is_open(to_status) and not is_open(from_status):
+            # voltou a ser demanda (ex.: reabertura da separação): linhas lidas no publish
+            self._changes.pop(order_id, None)
+            self._reload.add(order_id)
+        return self
+
+    def publish(self, db: Session) -> None:
+        if self._reload:
+            reloaded = order_lines(db, sorted(self._reload))
+            for order_id in self._reload:
+                self._changes[order_id] = reloaded.get(order_id)
+        if self._changes and availability_index.loaded:
+            availability_index.apply(self._changes)
+        self._changes = {}
+        self._reload = set()
+
+
+class AvailabilityRefreshJob:
+    """Carrega o índice no startup e o relê periodicamente (mesmo padrão do sweeper de idempotência)."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        await run_in_threadpool(self.run_once)
+        if AVAILABILITY_REFRESH_SECONDS > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def run_once() -> int:
+        with SessionLocal() as db:
+            return availability_index.refresh(db)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(AVAILABILITY_REFRESH_SECONDS)
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:  # noqa: BLE001
+                log.exception("Falha na releitura do índice de disponibilidade.")
+
+
+availability_refresh = AvailabilityRefreshJob()
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _figures(on_hand: float, committed: float, ordered: float, demand: float) -> dict[str, float]:
+    # estoque vem do banco com 6 casas; só as somas de float em memória precisam de arredondamento
+    return {
+        "onHand": on_hand,
+        "committed": committed,
+        "ordered": ordered,
+        "openDemand": round(demand, 6),
+        # negativo = falta para atender os pedidos abertos
+        "available": round(on_hand - demand, 6),
+    }
+
+
+_NO_STOCK = (0.0, 0.0, 0.0)
+
+
+def availability_report(db: Session, skus: Sequence[str], warehouse_code: str | None = None) -> dict[str, Any]:
+    """
+    Disponibilidade em lote: estoque (`inventory_stock`, consultas `IN` por lote) menos a demanda
+    dos pedidos abertos (índice em memória). Um item por SKU, na ordem pedida.
+    """
+    if not availability_index.loaded:
+        availability_index.rebuild(db)
+    skus = list(dict.fromkeys(s for s in skus if s))
+
+    stock: defaultdict[str, dict[str | None, tuple[float, float, float]]] = defaultdict(dict)
+    columns = (
+        DbInventoryStock.sku,
+        DbInventoryStock.warehouse_code,
+        cast(DbInventoryStock.on_hand, Float),
+        cast(DbInventoryStock.committed, Float),
+        cast(DbInventoryStock.ordered, Float),
+    )
+    for chunk in _chunks(skus):
+        q = select(*columns).where(DbInventoryStock.sku.in_(chunk))
+        if warehouse_code:
+            q = q.where(DbInventoryStock.warehouse_code == warehouse_code)
+        for sku, wh, on_hand, committed, ordered in db.execute(q):
+            stock[sku][wh] = (on_hand or 0.0, committed or 0.0, ordered or 0.0)
+    demand = availability_index.demand(skus)
+
+    items = []
+    for sku in skus:
+        in_stock = stock.get(sku, {})
+        by_wh = demand.get(sku, {})
+        if warehouse_code:
+            by_wh = {wh: q for wh, q in by_wh.items() if wh == warehouse_code}
+        # depósitos em ordem de código; demanda "sem depósito" por último
+        codes = sorted(wh for wh in in_stock.keys() | by_wh.keys() if wh is not None)
+        if None in by_wh:
+            codes.append(None)
+        values = [(*in_stock.get(wh, _NO_STOCK), by_wh.get(wh, 0.0)) for wh in codes]
+        totals = [round(sum(col), 6) for col in zip(*values)] if values else [*_NO_STOCK, 0.0]
+        items.append({
+            "sku": sku,
+            **_figures(*totals),
+            "warehouses": [{"warehouseCode": wh, **_figures(*v)} for wh, v in zip(codes, values)],
+        })
+
+    return {
+        "asOf": availability_index.watermark.isoformat() if availability_index.watermark else None,
+        "items": items,
+    }
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import insert, literal_column, select, tuple_
+from sqlalchemy.orm import Session
+
+
+BULK_UPSERT_CHUNK_SIZE = int(os.getenv("BULK_UPSERT_CHUNK_SIZE", "1000"))
+
+# Limite conservador de bind params por lote do `IN (...)` de pré-consulta (SQLite >= 3.32: 32766).
+_MAX_BIND_PARAMS = 32000
+
+
+@dataclass
+class UpsertResult:
+    created: int = 0
+    updated: int = 0
+
+    @property
+    def upserted(self) -> int:
+        return self.created + self.updated
+
+    def add(self, other: UpsertResult) -> None:
+        self.created += other.created
+        self.updated += other.updated
+
+
+def _chunks(rows: Sequence[dict[str, Any]], size: int) -> Iterable[Sequence[dict[str, Any]]]:
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _dedupe(rows: Iterable[dict[str, Any]], key_cols: Sequence[str]) -> list[dict[str, Any]]:
+    # ON CONFLICT não aceita a mesma chave duas vezes no mesmo statement; a última ocorrência vence.
+    by_key: dict[tuple, dict[str, Any]] = {}
+    for row in rows:
+        k = tuple(row[c] for c in key_cols)
+        by_key.pop(k, None)
+        by_key[k] = row
+    return list(by_key.values())
+
+
+def _existing_keys(db: Session, model: type, key_cols: Sequence[str], chunk: Sequence[dict[str, Any]]) -> set[tuple]:
+    cols = [getattr(model, c) for c in key_cols]
+    keys = [tuple(row[c] for c in key_cols) for row in chunk]
+    if len(cols) == 1:
+        found = db.execute(select(cols[0]).where(cols[0].in_([k[0] for k in keys]))).all()
+    else:
+        found = db.execute(select(*cols).where(tuple_(*cols).in_(keys))).all()
+    return {tuple(r) for r in found}
+
+
+def _upsert_chunk_postgresql(
+    db: Session, model: type, key_cols: Sequence[str], update_cols: Sequence[str], chunk: Sequence[dict[str, Any]]
+) -> UpsertResult:
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    stmt = pg_insert(model.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_cols),
+        set_={c: stmt.excluded[c] for c in update_cols},
+    )
+    # xmax = 0 somente para linhas recém-inseridas (truque padrão do PostgreSQL).
+    stmt = stmt.returning(literal_column("(xmax = 0)").label("inserted"))
+    flags = db.connection().execute(stmt, list(chunk)).scalars().all()
+    created = sum(1 for f in flags if f)
+    return UpsertResult(created=created, updated=len(flags) - created)
+
+
+def _upsert_chunk_sqlite(
+    db: Session, model: type, key_cols: Sequence[str], update_cols: Sequence[str], chunk: Sequence[dict[str, Any]]
+) -> UpsertResult:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    existing = _existing_keys(db, model, key_cols, chunk)
+    stmt = sqlite_insert(model.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_cols),
+        set_={c: stmt.excluded[c] for c in update_cols},
+    )
+    db.connection().execute(stmt, list(chunk))
+    return UpsertResult(created=len(chunk) - len(existing), updated=len(existing))
+
+
+def _upsert_chunk_generic(
+    db: Session, model: type, key_cols: Sequence[str], update_cols: Sequence[str], chunk: Sequence[dict[str, Any]]
+) -> UpsertResult:
+    from sqlalchemy import bindparam, update
+
+    existing = _existing_keys(db, model, key_cols, chunk)
+    to_insert = [r for r in chunk if tuple(r[c] for c in key_cols) not in existing]
+    to_update = [r for r in chunk if tuple(r[c] for c in key_cols) in existing]
+    if to_insert:
+        db.connection().execute(insert(model.__table__), to_insert)
+    if to_update:
+        table = model.__table__
+        stmt = (
+            update(table)
+            .where(*[table.c[c] == bindparam(f"k_{c}") for c in key_cols])
+            .values({c: bindparam(f"v_{c}") for c in update_cols})
+        )
+        params = [
+            {**{f"k_{c}": r[c] for c in key_cols}, **{f"v_{c}": r[c] for c in update_cols}}
+            for r in to_update
+        ]
+        db.connection().execute(stmt, params)
+    return UpsertResult(created=len(to_insert), updated=len(to_update))
+
+
+_DIALECT_UPSERT = {
+    "postgresql": _upsert_chunk_postgresql,
+    "sqlite": _upsert_chunk_sqlite,
+}
+
+
+def bulk_upsert(
+    db: Session,
+    model: type,
+    rows: Iterable[dict[str, Any]],
+    key_cols: Sequence[str],
+    now: datetime,
+    chunk_size: int | None = None,
+) -> UpsertResult:
+    """
+    Upsert set-based (`INSERT ... ON CONFLICT DO UPDATE`) em chunks, chaveado pela
+    constraint única informada em `key_cols`. Cada chunk é um único executemany sobre
+    um statement compilado uma vez (cache do SQLAlchemy / insertmanyvalues no psycopg).
+
+    `created_at` só é gravado na inserção; `updated_at` recebe `now` em ambos os casos.
+    Não faz commit: a transação é do chamador.
+    """
+    prepared = _dedupe(({**r, "created_at": now, "updated_at": now} for r in rows), key_cols)
+    result = UpsertResult()
+    if not prepared:
+        return result
+
+    update_cols = [c for c in prepared[0] if c not in key_cols and c != "created_at"]
+    size = chunk_size or BULK_UPSERT_CHUNK_SIZE
+    size = max(1, min(size, _MAX_BIND_PARAMS // len(key_cols)))
+
+    upsert_chunk = _DIALECT_UPSERT.get(db.get_bind().dialect.name, _upsert_chunk_generic)
+    for chunk in _chunks(prepared, size):
+        result.add(upsert_chunk(db, model, key_cols, update_cols, chunk))
+    return result
+
+
+def upsert_increment(
+    db: Session,
+    model: type,
+    rows: Iterable[dict[str, Any]],
+    key_cols: Sequence[str],
+    chunk_size: int | None = None,
+) -> None:
+    """
+    Soma as colunas não-chave de `rows` às linhas existentes (`col = col + excluded.col`) ou
+    insere as que faltam; para contadores e rollups. As chaves devem vir sem repetição. A
+    gravação segue a ordem das chaves, então transações que tocam as mesmas linhas não
+    entram em deadlock. Não faz commit.
+    """
+    prepared = sorted(rows, key=lambda r: tuple(r[c] for c in key_cols))
+    if not prepared:
+        return
+
+    table = model.__table__
+    add_cols = [c for c in prepared[0] if c not in key_cols]
+    size = chunk_size or BULK_UPSERT_CHUNK_SIZE
+    size = max(1, min(size, _MAX_BIND_PARAMS // len(prepared[0])))
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_cols),
+            set_={c: table.c[c] + stmt.excluded[c] for c in add_cols},
+        )
+        for chunk in _chunks(prepared, size):
+            db.connection().execute(stmt, list(chunk))
+        return
+
+    from sqlalchemy import update
+
+    for row in prepared:
+        res = db.connection().execute(
+            update(table)
+            .where(*[table.c[c] == row[c] for c in key_cols])
+            .values({c: table.c[c] + row[c] for c in add_cols})
+        )
+        if res.rowcount == 0:
+            db.connection().execute(insert(table).values(**row))
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "1024"))
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "30"))
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+CacheKey = tuple[str, int, Hashable]
+
+
+class QueryCache:
+    """
+    Cache LRU + TTL de resultados de listagem, em memória do processo.
+
+    A chave inclui a geração da tabela no momento da leitura; `invalidate(table)` incrementa
+    a geração, então nada lido antes do commit do sync volta a ser servido (e as entradas
+    antigas da tabela são descartadas na hora).
+    Com vários workers, cada processo tem o seu cache: o TTL limita a defasagem entre eles.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.stats = CacheStats()
+        self._entries: OrderedDict[CacheKey, tuple[float, Any]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, table: str, params: dict[str, Any]) -> tuple[CacheKey, Any | None]:
+        """Retorna `(chave, valor)`; valor `None` em miss. Guarde o resultado com `store(chave, ...)`."""
+        key: CacheKey = (table, self._generations.get(table, 0), tuple(sorted(params.items())))
+        if not self.enabled:
+            return key, None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return key, None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return key, None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return key, value
+
+    def store(self, key: CacheKey, value: Any) -> Any:
+        if not self.enabled:
+            return value
+        table, generation, _ = key
+        with self._lock:
+            if generation != self._generations.get(table, 0):
+                # a tabela foi invalidada enquanto a consulta rodava
+                return value
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        return value
+
+    def invalidate(self, table: str) -> None:
+        """Chamar depois do commit que alterou `table`."""
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            self.stats.invalidations += 1
+            stale = [k for k in self._entries if k[0] == table]
+            for k in stale:
+                del self._entries[k]
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.stats.hits + self.stats.misses
+            return {
+                **asdict(self.stats),
+                "hitRatio": round(self.stats.hits / lookups, 4) if lookups else None,
+                "size": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "enabled": self.enabled,
+                "generations": dict(self._generations),
+            }
+
+
+read_cache = QueryCache(READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS, READ_CACHE_ENABLED)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .models import Order as DbOrder
+
+
+# novas tentativas quando outro worker avançou o pedido entre a leitura e o UPDATE
+ORDER_CAS_MAX_RETRIES = int(os.getenv("ORDER_CAS_MAX_RETRIES", "3"))
+
+
+class VersionConflict(Exception):
+    """O `UPDATE ... WHERE version = ?` não encontrou a versão lida (escrita concorrente)."""
+
+
+def cas_transition(
+    db: Session, order_id: str, expected_version: int, next_state: str, updated_at: datetime, steps: int = 1
+) -> None:
+    """
+    Compare-and-swap da transição: só grava se a versão ainda é `expected_version`
+    (`steps` > 1 quando várias transições do mesmo pedido são gravadas de uma vez).
+    Sem lock de linha; levanta `VersionConflict` se outra transação chegou antes.
+    """
+    res = db.execute(
+        update(DbOrder)
+        .where(DbOrder.order_id == order_id, DbOrder.version == expected_version)
+        .values(status=next_state, updated_at=updated_at, version=expected_version + steps)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount != 1:
+        raise VersionConflict(order_id)
+
+
+def if_match_satisfied(if_match: str, etag: str, version: int) -> bool:
+    """
+    `If-Match` aceita o ETag devolvido pelo GET do pedido ou a versão numérica (`"3"`).
+    Como nossos ETags são fracos, a comparação aqui também é fraca.
+    """
+    if if_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    for tag in if_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag == opaque or tag.strip('"') == str(version):
+            return True
+    return False
+
+
+def precondition_failed(current_version: int) -> HTTPException:
+    exc = HTTPException(status_code=412, detail="Pedido foi alterado (If-Match não confere).")
+    setattr(exc, "error_code", "WMS-CC-001")
+    setattr(exc, "details", {"currentVersion": current_version})
+    return exc
+
+
+def concurrent_conflict() -> HTTPException:
+    exc = HTTPException(status_code=409, detail="Conflito de concorrência no pedido; tente novamente.")
+    setattr(exc, "error_code", "WMS-CC-002")
+    return exc
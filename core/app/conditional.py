@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from collections.abc import Sequence
+from typing import Any
+
+from fastapi import Request, Response
+
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # SQLite devolve datetimes sem fuso; gravamos sempre em UTC.
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def weak_etag(*parts: Any) -> str:
+    # datetimes normalizados para UTC: o valor recém-gravado e o relido do banco geram o mesmo ETag
+    text = "|".join(_as_utc(p).isoformat() if isinstance(p, datetime) else str(p) for p in parts)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=10).hexdigest()
+    return f'W/"{digest}"'
+
+
+def http_date(dt: datetime) -> str:
+    return format_datetime(_as_utc(dt).replace(microsecond=0), usegmt=True)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # comparação fraca (RFC 9110 §13.1.2): ignora o prefixo W/
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    """
+    `If-None-Match` tem precedência; `If-Modified-Since` só é avaliado na ausência dele e com
+    `last_modified`. Listagens passam `None`: uma linha que sai do filtro não move data nenhuma,
+    então só o ETag da página diz se ela mudou.
+    """
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since)
+    return False
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, last_modified: datetime | None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def page_validators(
+    params: Sequence[Any],
+    rows: Sequence[Any],
+    row_fields: Sequence[str],
+    *extra: Any,
+) -> tuple[str, datetime | None]:
+    """
+    Validadores de uma página de listagem, derivados só do que a página devolve: parâmetros da
+    consulta, identidade e versão de cada linha (`row_fields`, ex.: id + `updated_at`/`version`)
+    e o resto do corpo que muda com o conjunto (`nextCursor`, `total`). Não há agregação sobre o
+    filtro inteiro: o custo é o da própria página. `Last-Modified` é o maior `updated_at` da
+    página, só informativo (ver `is_not_modified`).
+    """
+    etag = weak_etag(*params, *extra, *(getattr(r, f) for r in rows for f in row_fields))
+    stamps = [_as_utc(r.updated_at) for r in rows if r.updated_at is not None]
+    return etag, max(stamps) if stamps else None
@@ -1,20 +1,90 @@
+import hashlib
 import os
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
+from .db_metrics import TimedAsyncQueuePool, TimedQueuePool, install_idle_ping, instrument_engine
+
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+pysqlite:///./dev.db")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Modo assíncrono (opt-in): rotas com sessão rodam no event loop via AsyncSession em vez do threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+
+def async_database_url(url: str) -> str:
+    """Mesmo banco com driver assíncrono: psycopg (3) para PostgreSQL, aiosqlite para SQLite."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+psycopg")
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# Pool por processo (cada worker uvicorn tem o seu): conexões no banco = réplicas x workers x (size + overflow).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# recicla conexões mais velhas que isso (segundos; -1 desliga), abaixo do idle timeout do banco/PgBouncer
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# always: ping em todo checkout | idle: só após DB_POOL_PING_IDLE_SECONDS parada | never
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "idle").lower()
+DB_POOL_PING_IDLE_SECONDS = float(os.getenv("DB_POOL_PING_IDLE_SECONDS", "30"))
+
+
+def pool_options(url: str, poolclass: type) -> dict:
+    parsed = make_url(url)
+    options: dict = {"pool_pre_ping": DB_POOL_PRE_PING == "always"}
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options  # SQLite em memória usa pool de conexão única
+    return {
+        **options,
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def configure_engine(sync_engine: Engine) -> None:
+    instrument_engine(sync_engine)
+    if DB_POOL_PRE_PING == "idle":
+        install_idle_ping(sync_engine, DB_POOL_PING_IDLE_SECONDS)
+
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, TimedQueuePool))
+configure_engine(engine)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session)
 
+# Criados só com DB_ASYNC: o driver assíncrono (aiosqlite) é dependência opcional.
+async_engine = (
+    create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool)) if DB_ASYNC else None
+)
+if async_engine is not None:
+    configure_engine(async_engine.sync_engine)
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, class_=AsyncSession) if async_engine is not None else None
+)
+
 
 class Base(DeclarativeBase):
     pass
 
 
+def advisory_lock_key(name: str) -> int:
+    """Chave de `pg_advisory_lock`/`pg_advisory_xact_lock` igual em todos os workers (hash do nome em int64)."""
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
 def get_session() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
@@ -22,3 +92,7 @@ def get_session() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
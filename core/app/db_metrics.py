@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, Pool, QueuePool
+
+
+class PoolWaitStats:
+    """Espera no checkout do pool (inclui abrir conexão nova), por processo."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self) -> float:
+        with self._lock:
+            self.waiting += 1
+        return time.perf_counter()
+
+    def end(self, started: float, timed_out: bool) -> None:
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.waiting -= 1
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class _TimedPoolMixin:
+    wait_stats: PoolWaitStats
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = self.wait_stats.begin()
+        timed_out = False
+        try:
+            return super()._do_get()  # type: ignore[misc]
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.wait_stats.end(started, timed_out)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    wait_stats = PoolWaitStats()
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    wait_stats = PoolWaitStats()
+
+
+def pool_snapshot(pool: Pool) -> dict[str, Any]:
+    out: dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        out.update({
+            "size": pool.size(),
+            "inUse": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "maxOverflow": pool._max_overflow,
+        })
+    stats = getattr(pool, "wait_stats", None)
+    if stats is not None:
+        out.update({
+            "checkouts": stats.checkouts,
+            "waiting": stats.waiting,
+            "timeouts": stats.timeouts,
+            "waitSecondsTotal": round(stats.wait_seconds_total, 6),
+            "waitSecondsMax": round(stats.wait_seconds_max, 6),
+            "waitMsAvg": round(stats.wait_seconds_total / stats.checkouts * 1000, 3) if stats.checkouts else None,
+        })
+    return out
+
+
+# ============================================================
+# Tempo de banco por requisição
+# ============================================================
+
+@dataclass
+class RequestDbStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.queries} queries"'
+
+
+# O middleware cria um objeto por requisição; o contexto é copiado para o threadpool e para o
+# greenlet do `run_sync`, então os eventos do engine acumulam no mesmo objeto.
+request_db_stats: ContextVar[RequestDbStats | None] = ContextVar("request_db_stats", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Conta queries e tempo de execução no `RequestDbStats` da requisição corrente."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        if request_db_stats.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        stats = request_db_stats.get()
+        started = conn.info.get("query_started")
+        if stats is not None and started:
+            stats.queries += 1
+            stats.seconds += time.perf_counter() - started.pop()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):  # noqa: ANN001
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def install_idle_ping(engine: Engine, idle_seconds: float) -> None:
+    """
+    Pre-ping só para conexões paradas há mais de `idle_seconds`: conexões em uso contínuo
+    não pagam o round trip extra a cada checkout. Se o ping falhar, o pool descarta a
+    conexão e tenta outra (`DisconnectionError`).
+    """
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):  # noqa: ANN001
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):  # noqa: ANN001
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            alive = engine.dialect.do_ping(dbapi_connection)
+        except Exception as err:  # noqa: BLE001
+            raise exc.DisconnectionError() from err
+        if not alive:
+            raise exc.DisconnectionError()
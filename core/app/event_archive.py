@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, advisory_lock_key, engine
+from .models import Order as DbOrder, OrderEvent as DbOrderEvent, OrderEventArchive
+
+try:  # Parquet/zstd opcional; sem pyarrow o arquivo frio é NDJSON gzip
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+
+# pedidos DESPACHADO há mais de N dias têm os eventos movidos para o arquivo frio
+ORDER_EVENTS_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_EVENTS_ARCHIVE_AFTER_DAYS", "90"))
+# diretório persistente (volume) do arquivo frio, caminho absoluto; vazio = não arquiva. Os
+# eventos saem do banco, então um diretório que some com o container perde o histórico.
+ORDER_EVENTS_ARCHIVE_DIR = os.getenv("ORDER_EVENTS_ARCHIVE_DIR", "")
+# pedidos por arquivo (e por transação de delete)
+ORDER_EVENTS_ARCHIVE_BATCH = int(os.getenv("ORDER_EVENTS_ARCHIVE_BATCH", "5000"))
+ORDER_EVENTS_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ORDER_EVENTS_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# auto: parquet se pyarrow instalado | parquet | ndjson
+ORDER_EVENTS_ARCHIVE_FORMAT = os.getenv("ORDER_EVENTS_ARCHIVE_FORMAT", "auto").lower()
+# partições mensais criadas à frente (PostgreSQL)
+ORDER_EVENTS_PARTITIONS_AHEAD = int(os.getenv("ORDER_EVENTS_PARTITIONS_AHEAD", "3"))
+
+_PARQUET_ROW_GROUP = 2000
+_TIMESTAMPS = ("occurred_at", "recorded_at")
+_PARTITION_NAME = re.compile(r"^order_events_y(\d{4})m(\d{2})$")
+_COLUMNS = [c.key for c in DbOrderEvent.__table__.columns]
+# linha do tempo do pedido (`load_history`), declarado em `OrderEvent.__table_args__`
+_TIMELINE_INDEX = "ix_order_events_order_id_occurred_at"
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+# ============================================================
+# Partições mensais (PostgreSQL)
+# ============================================================
+
+def _month_start(d: date, offset: int = 0) -> date:
+    months = d.year * 12 + d.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('order_events')"
+    )).first() is not None
+
+
+def _create_month_partition(conn: Connection, month: date) -> None:
+    name = f"order_events_y{month.year:04d}m{month.month:02d}"
+    try:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF order_events "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_month_start(month, 1).isoformat()} 00:00:00+00')"
+        ))
+    except Exception:  # noqa: BLE001
+        # a DEFAULT já tem linhas desse mês: fica nela até uma migração manual
+        log.warning("Não foi possível criar a partição %s de order_events.", name)
+
+
+def ensure_event_schema(engine: Engine) -> None:
+    """
+    Startup: o que o `create_all` não faz em bancos criados antes (ele não altera tabela
+    existente). Adiciona `order_events.recorded_at`, com `occurred_at` nas linhas antigas (a
+    melhor aproximação disponível), e o índice `(order_id, occurred_at)` da linha do tempo.
+    """
+    insp = inspect(engine)
+    has_recorded_at = "recorded_at" in {c["name"] for c in insp.get_columns(DbOrderEvent.__tablename__)}
+    has_timeline_index = _TIMELINE_INDEX in {i["name"] for i in insp.get_indexes(DbOrderEvent.__tablename__)}
+    if has_recorded_at and has_timeline_index:
+        return
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # todos os workers chegam aqui no startup: um altera, os outros esperam e não fazem nada
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": advisory_lock_key("order-events-schema")})
+        if not has_recorded_at:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("ALTER TABLE order_events ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMPTZ"))
+            else:
+                conn.execute(text("ALTER TABLE order_events ADD COLUMN recorded_at DATETIME"))
+            conn.execute(text("UPDATE order_events SET recorded_at = occurred_at WHERE recorded_at IS NULL"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_events_recorded_at ON order_events (recorded_at)"))
+            log.info("Coluna order_events.recorded_at adicionada.")
+        if not has_timeline_index:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {_TIMELINE_INDEX} ON order_events (order_id, occurred_at)"))
+            log.info("Índice %s criado.", _TIMELINE_INDEX)
+
+
+def ensure_event_partitions(engine: Engine, today: date | None = None) -> None:
+    """Cria a partição DEFAULT e as mensais do mês anterior até `ORDER_EVENTS_PARTITIONS_AHEAD` à frente."""
+    if engine.dialect.name != "postgresql":
+        return
+    today = today or datetime.now(timezone.utc).date()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not _is_partitioned(conn):
+            log.info("order_events não é particionada; converta com `python -m app.event_archive migrate`.")
+            return
+        conn.execute(text("CREATE TABLE IF NOT EXISTS order_events_default PARTITION OF order_events DEFAULT"))
+        for offset in range(-1, ORDER_EVENTS_PARTITIONS_AHEAD + 1):
+            _create_month_partition(conn, _month_start(today, offset))
+
+
+def drop_empty_partitions(engine: Engine, before: date) -> list[str]:
+    """Remove partições mensais vazias (já arquivadas) inteiramente anteriores a `before`."""
+    if engine.dialect.name != "postgresql":
+        return []
+    dropped: list[str] = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('order_events')"
+        )).scalars().all()
+        for name in names:
+            m = _PARTITION_NAME.match(name)
+            if not m or _month_start(date(int(m[1]), int(m[2]), 1), 1) > before:
+                continue
+            if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None:
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+    return dropped
+
+
+def migrate_to_partitioned(engine: Engine) -> None:
+    """
+    Converte um `order_events` comum (criado antes do particionamento) em particionado: renomeia
+    a tabela antiga e seus índices, cria a nova com as partições dos meses existentes, copia as
+    linhas e remove a antiga. Tudo numa transação, com lock exclusivo: rodar em janela de manutenção.
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Particionamento de order_events só existe no PostgreSQL.")
+    ensure_event_schema(engine)  # a cópia leva todas as colunas do modelo
+    with engine.begin() as conn:
+        if _is_partitioned(conn):
+            log.info("order_events já é particionada.")
+            return
+        conn.execute(text("ALTER TABLE order_events RENAME TO order_events_legacy"))
+        for index in conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'order_events_legacy'"
+        )).scalars().all():
+            # renomear o índice da PK renomeia a constraint junto
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index[:50]}_legacy"'))
+        DbOrderEvent.__table__.create(conn)
+        first, last = conn.execute(text("SELECT min(occurred_at), max(occurred_at) FROM order_events_legacy")).one()
+        today = datetime.now(timezone.utc).date()
+        month = _month_start(_utc(first).date()) if first else _month_start(today, -1)
+        end = _month_start(max(_utc(last).date() if last else today, today), ORDER_EVENTS_PARTITIONS_AHEAD)
+        while month <= end:
+            _create_month_partition(conn, month)
+            month = _month_start(month, 1)
+        conn.execute(text("CREATE TABLE order_events_default PARTITION OF order_events DEFAULT"))
+        cols = ", ".join(_COLUMNS)
+        conn.execute(text(f"INSERT INTO order_events ({cols}) SELECT {cols} FROM order_events_legacy"))
+        conn.execute(text("DROP TABLE order_events_legacy"))
+    log.info("order_events convertida para particionada por mês.")
+
+
+# ============================================================
+# Arquivo frio
+# ============================================================
+
+class ArchiveUnavailable(RuntimeError):
+    """Arquivo frio registrado em `order_event_archive` que não está no disco."""
+
+
+def archive_dir() -> Path | None:
+    """Diretório do arquivo frio, ou `None` se o arquivamento não está configurado."""
+    if not ORDER_EVENTS_ARCHIVE_DIR:
+        return None
+    path = Path(ORDER_EVENTS_ARCHIVE_DIR)
+    if not path.is_absolute():
+        # relativo cai no diretório de trabalho do container, que não sobrevive a um rebuild
+        log.error("ORDER_EVENTS_ARCHIVE_DIR precisa ser um caminho absoluto (volume persistente); arquivamento desligado.")
+        return None
+    return path
+
+
+def archive_format() -> str:
+    if ORDER_EVENTS_ARCHIVE_FORMAT == "parquet" and pq is None:
+        raise RuntimeError("ORDER_EVENTS_ARCHIVE_FORMAT=parquet, mas o pacote pyarrow não está instalado.")
+    if ORDER_EVENTS_ARCHIVE_FORMAT == "ndjson" or pq is None:
+        return "ndjson"
+    return "parquet"
+
+
+def _write_file(path: Path, rows: list[dict[str, Any]]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        table = pa.Table.from_pylist(rows, schema=_parquet_schema())
+        # ordenado por order_id: as estatísticas de cada row group deixam a leitura pular os demais
+        pq.write_table(table, tmp, compression="zstd", row_group_size=_PARQUET_ROW_GROUP)
+    else:
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=lambda v: v.isoformat()) + "\n")
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _parquet_schema():
+    fields = [pa.field(c, pa.timestamp("us", tz="UTC") if c in _TIMESTAMPS else pa.string()) for c in _COLUMNS]
+    return pa.schema(fields)
+
+
+def read_archived_rows(path: str, order_ids: set[str]) -> list[dict[str, Any]]:
+    """
+    Linhas (dicts de `order_events`) de vários pedidos num arquivo frio, numa leitura só.
+    Levanta `ArchiveUnavailable` se o arquivo não existe (volume não montado, arquivo apagado).
+    """
+    if not os.path.exists(path):
+        raise ArchiveUnavailable(f"Arquivo de eventos não encontrado: {path}")
+    rows: list[dict[str, Any]]
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError("Arquivo Parquet de order_events, mas o pacote pyarrow não está instalado.")
+        rows = pq.read_table(path, filters=[("order_id", "in", sorted(order_ids))]).to_pylist()
+    else:
+        rows = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                # filtro barato antes do parse: order_id é a chave `"order_id": "..."` da linha
+                start = line.find('"order_id": "')
+                if start < 0 or line[start + 13:line.index('"', start + 13)] not in order_ids:
+                    continue
+                row = json.loads(line)
+                for col in _TIMESTAMPS:
+                    if row.get(col) is not None:  # arquivos anteriores a `recorded_at` não têm a coluna
+                        row[col] = datetime.fromisoformat(row[col])
+                rows.append(row)
+    return rows
+
+
+def read_archived_events(path: str, order_id: str) -> list[DbOrderEvent]:
+    """Eventos de um pedido no arquivo frio, como objetos `OrderEvent` soltos (fora da sessão)."""
+    return [DbOrderEvent(**row) for row in read_archived_rows(path, {order_id})]
+
+
+def load_history(db: Session, order_id: str) -> list[DbOrderEvent]:
+    """
+    Histórico completo do pedido: `order_events` mais o arquivo frio, em ordem de `occurred_at`.
+    Levanta `ArchiveUnavailable` se o arquivo do pedido sumiu (histórico parcial não é devolvido).
+    """
+    events = list(db.execute(
+        select(DbOrderEvent).where(DbOrderEvent.order_id == order_id).order_by(DbOrderEvent.occurred_at.asc())
+    ).scalars().all())
+    path = db.execute(select(OrderEventArchive.path).where(OrderEventArchive.order_id == order_id)).scalar_one_or_none()
+    if path is None:
+        return events
+    events.extend(read_archived_events(path, order_id))
+    events.sort(key=lambda e: _utc(e.occurred_at))
+    return events
+
+
+def archive_batch(db: Session, cutoff: datetime, root: Path) -> int:
+    """
+    Arquiva um lote de pedidos DESPACHADO com `updated_at < cutoff`: grava o arquivo (fsync +
+    rename) e só então, numa transação, registra o índice e apaga as linhas. Falha no banco
+    apaga o arquivo; queda entre os dois passos deixa só um arquivo órfão, nunca perde evento.
+    Retorna quantos pedidos foram arquivados.
+    """
+    order_ids = db.execute(
+        select(DbOrder.order_id)
+        .where(
+            DbOrder.status == "DESPACHADO",
+            DbOrder.updated_at < cutoff,
+            ~select(OrderEventArchive.order_id).where(OrderEventArchive.order_id == DbOrder.order_id).exists(),
+        )
+        .order_by(DbOrder.order_id)
+        .limit(ORDER_EVENTS_ARCHIVE_BATCH)
+    ).scalars().all()
+    if not order_ids:
+        return 0
+
+    table = DbOrderEvent.__table__
+    rows = [
+        {**dict(r), "occurred_at": _utc(r["occurred_at"]), "recorded_at": _utc(r["recorded_at"])}
+        for r in db.execute(
+            select(table).where(table.c.order_id.in_(order_ids)).order_by(table.c.order_id, table.c.occurred_at)
+        ).mappings()
+    ]
+    counts: dict[str, int] = {}
+    for r in rows:
+        counts[r["order_id"]] = counts.get(r["order_id"], 0) + 1
+
+    now = datetime.now(timezone.utc)
+    directory = root / now.strftime("%Y-%m")
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.{'parquet' if archive_format() == 'parquet' else 'ndjson.gz'}"
+    _write_file(path, rows)
+    try:
+        db.execute(insert(OrderEventArchive), [
+            {"order_id": oid, "path": str(path), "events": counts.get(oid, 0), "archived_at": now} for oid in order_ids
+        ])
+        db.execute(delete(DbOrderEvent).where(DbOrderEvent.order_id.in_(order_ids)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        path.unlink(missing_ok=True)
+        raise
+    return len(order_ids)
+
+
+def run_archive(db: Session, now: datetime | None = None) -> int:
+    """
+    Arquiva todos os pedidos elegíveis, lote a lote, se `ORDER_EVENTS_ARCHIVE_DIR` estiver
+    configurado; no PostgreSQL cria as partições à frente e remove as que ficaram vazias.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=ORDER_EVENTS_ARCHIVE_AFTER_DAYS)
+    root = archive_dir()
+    total = 0
+    while root is not None:
+        archived = archive_batch(db, cutoff, root)
+        total += archived
+        if archived < ORDER_EVENTS_ARCHIVE_BATCH:
+            break
+    bind = db.get_bind()
+    if isinstance(bind, Engine):
+        ensure_event_partitions(bind)
+        for name in drop_empty_partitions(bind, _month_start(cutoff.date())):
+            log.info("Partição vazia removida: %s.", name)
+    if total:
+        log.info("Eventos de pedidos despachados arquivados.", extra={"removed": total})
+    return total
+
+
+class EventArchiveJob:
+    """
+    Roda `run_archive` periodicamente (mesmo padrão do sweeper de idempotência). Sem
+    `ORDER_EVENTS_ARCHIVE_DIR` só mantém as partições.
+    """
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if archive_dir() is None:
+            log.info("Arquivo frio de order_events desligado (ORDER_EVENTS_ARCHIVE_DIR vazio ou relativo).")
+        if ORDER_EVENTS_ARCHIVE_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def run_once() -> int:
+        with SessionLocal() as db:
+            return run_archive(db)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(ORDER_EVENTS_ARCHIVE_INTERVAL_SECONDS)
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:  # noqa: BLE001
+                log.exception("Falha no arquivamento de order_events.")
+
+
+event_archive = EventArchiveJob()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manutenção de order_events (partições e arquivo frio).")
+    parser.add_argument("command", choices=("archive", "partitions", "migrate"))
+    args = parser.parse_args()
+    if args.command == "archive":
+        if archive_dir() is None:
+            raise SystemExit("Defina ORDER_EVENTS_ARCHIVE_DIR com o caminho absoluto de um diretório persistente.")
+        print(f"pedidos arquivados: {EventArchiveJob.run_once()}")
+    elif args.command == "partitions":
+        ensure_event_partitions(engine)
+    else:
+        migrate_to_partitioned(engine)
+
+
+if __name__ == "__main__":
+    main()
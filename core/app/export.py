@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from collections.abc import Iterator, Sequence
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Literal
+
+from sqlalchemy import Column, Select, select
+
+from .db import SessionLocal
+from .models import (
+    Customer as DbCustomer,
+    InventoryStock as DbInventoryStock,
+    Order as DbOrder,
+    OrderEvent as DbOrderEvent,
+    OrderItem as DbOrderItem,
+    Product as DbProduct,
+)
+
+
+ExportDataset = Literal["orders", "order-events", "inventory", "catalog", "customers"]
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+# recuo da marca d'água devolvida ao cliente: cobre transações que carimbaram o relógio do
+# servidor antes do export e só confirmaram depois
+EXPORT_SETTLE_SECONDS = float(os.getenv("EXPORT_SETTLE_SECONDS", "10"))
+
+MEDIA_TYPES: dict[str, str] = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# dataset -> (tabela, coluna de corte incremental, desempate da ordenação). `order-events` corta
+# em `recorded_at` (relógio do servidor), não no `occurred_at` do cliente
+_DATASETS: dict[str, tuple[Any, Column, Column]] = {
+    "orders": (DbOrder.__table__, DbOrder.__table__.c.updated_at, DbOrder.__table__.c.order_id),
+    "order-events": (DbOrderEvent.__table__, DbOrderEvent.__table__.c.recorded_at, DbOrderEvent.__table__.c.event_id),
+    "inventory": (DbInventoryStock.__table__, DbInventoryStock.__table__.c.updated_at, DbInventoryStock.__table__.c.id),
+    "catalog": (DbProduct.__table__, DbProduct.__table__.c.updated_at, DbProduct.__table__.c.id),
+    "customers": (DbCustomer.__table__, DbCustomer.__table__.c.updated_at, DbCustomer.__table__.c.id),
+}
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_columns(dataset: ExportDataset) -> list[str]:
+    table = _DATASETS[dataset][0]
+    cols = [c.name for c in table.columns]
+    return cols + ["items"] if dataset == "orders" else cols
+
+
+def export_watermark(now: datetime | None = None) -> datetime:
+    """
+    Próximo `updated_since` para o cliente, tirado do relógio do servidor antes da leitura.
+    Em `orders`, o maior `updated_at` exportado não serve de checkpoint: numa transição ele é o
+    `occurredAt` do cliente e pode estar no passado ou no futuro.
+    """
+    return (now or datetime.now(timezone.utc)) - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+
+
+def _export_query(dataset: ExportDataset, updated_since: datetime | None) -> Select:
+    table, cut_col, tie_col = _DATASETS[dataset]
+    q = select(table).order_by(cut_col.asc(), tie_col.asc())
+    if updated_since is not None:
+        if dataset == "orders":
+            # `updated_at` cobre criação e sync SAP; transições entram pelo `recorded_at` do evento,
+            # como na releitura do índice de disponibilidade
+            transitioned = select(DbOrderEvent.order_id).where(DbOrderEvent.recorded_at >= updated_since)
+            q = q.where((cut_col >= updated_since) | table.c.order_id.in_(transitioned))
+        else:
+            q = q.where(cut_col >= updated_since)
+    return q
+
+
+def iter_export_batches(dataset: ExportDataset, updated_since: datetime | None = None) -> Iterator[list[dict[str, Any]]]:
+    """
+    Lê o dataset com cursor do lado do servidor (`yield_per` -> `stream_results`) e devolve
+    lotes de linhas já convertidas para tipos JSON. A sessão é própria do gerador, pois o
+    streaming continua depois que o handler retornou.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            _export_query(dataset, updated_since).execution_options(yield_per=EXPORT_YIELD_PER)
+        ).mappings()
+        for partition in result.partitions():
+            rows = [{k: _plain(v) for k, v in row.items()} for row in partition]
+            if dataset == "orders":
+                _attach_items(db, rows)
+            yield rows
+    finally:
+        db.close()
+
+
+def _attach_items(db, rows: list[dict[str, Any]]) -> None:
+    # uma consulta IN por lote, em vez de selectinload por pedido
+    by_order: dict[str, list[dict[str, Any]]] = {r["order_id"]: [] for r in rows}
+    items = db.execute(
+        select(DbOrderItem.order_id, DbOrderItem.sku, DbOrderItem.quantity)
+        .where(DbOrderItem.order_id.in_(by_order))
+        .order_by(DbOrderItem.order_id, DbOrderItem.order_item_id)
+    ).all()
+    for order_id, sku, quantity in items:
+        by_order[order_id].append({"sku": sku, "quantity": float(quantity)})
+    for r in rows:
+        r["items"] = by_order[r["order_id"]]
+
+
+def stream_ndjson(batches: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows).encode("utf-8")
+
+
+def stream_csv(batches: Iterator[list[dict[str, Any]]], columns: Sequence[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(columns), extrasaction="ignore")
+    writer.writeheader()
+    for rows in batches:
+        for r in rows:
+            if "items" in r:
+                r = {**r, "items": json.dumps(r["items"], separators=(",", ":"))}
+            writer.writerow(r)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
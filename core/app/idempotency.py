@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import IdempotencyKey
+
+
+# Retenção das chaves: depois disso a mesma chave volta a ser aceita como requisição nova.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(48 * 3600)))
+IDEMPOTENCY_SWEEP_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL_SECONDS", "600"))
+IDEMPOTENCY_SWEEP_BATCH = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH", "5000"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+_KEY_MAX_LENGTH = 128  # idempotency_keys.key
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def request_hash(payload: Any) -> str:
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compose_key(*parts: str) -> str:
+    """Chave composta (ex.: pedido + evento + Idempotency-Key); vira hash se passar da coluna."""
+    key = ":".join(parts)
+    return key if len(key) <= _KEY_MAX_LENGTH else hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def key_reused() -> HTTPException:
+    exc = HTTPException(status_code=409, detail="Idempotency-Key já usada com payload diferente.")
+    setattr(exc, "error_code", "WMS-IDEM-001")
+    return exc
+
+
+@dataclass
+class Claim:
+    """Resultado de `IdempotencyStore.claim`: `replay` preenchido se a chave já foi usada."""
+
+    scope: str
+    key: str
+    request_hash: str
+    row_id: int | None = None
+    replay: Any | None = None
+    response_json: str | None = None
+
+
+class IdempotencyStore:
+    """
+    Idempotência por `(scope, key)` na tabela `idempotency_keys`.
+
+    `claim` faz insert-first (`ON CONFLICT DO NOTHING`) na mesma transação da escrita de
+    negócio: duplicatas concorrentes esperam no índice único até o commit da primeira e então
+    leem a resposta gravada, então só uma delas escreve. Falha ou rollback da primeira libera a
+    chave. Respostas confirmadas ficam num LRU em memória (por processo) até expirar o TTL, e o
+    sweeper apaga do banco as chaves mais velhas que o TTL.
+    """
+
+    def __init__(self, ttl_seconds: int, cache_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, str], tuple[float, str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper: asyncio.Task | None = None
+
+    # ---- cache em memória ----
+    def _cached(self, scope: str, key: str) -> tuple[str, str] | None:
+        with self._lock:
+            entry = self._cache.get((scope, key))
+            if entry is None:
+                return None
+            expires_at, req_hash, response_json = entry
+            if expires_at <= time.monotonic():
+                del self._cache[(scope, key)]
+                return None
+            self._cache.move_to_end((scope, key))
+            return req_hash, response_json
+
+    def remember(self, claim: Claim) -> None:
+        """Chamar depois do commit que gravou a resposta."""
+        if claim.response_json is None or self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[(claim.scope, claim.key)] = (
+                time.monotonic() + self.ttl_seconds, claim.request_hash, claim.response_json,
+            )
+            self._cache.move_to_end((claim.scope, claim.key))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def lookup(self, scope: str, key: str, req_hash: str) -> Any | None:
+        """Caminho rápido sem banco: a resposta já confirmada para a chave, ou `None`."""
+        cached = self._cached(scope, key)
+        if cached is None:
+            return None
+        if cached[0] != req_hash:
+            raise key_reused()
+        return json.loads(cached[1])
+
+    # ---- banco ----
+    def claim(self, db: Session, scope: str, key: str, req_hash: str) -> Claim:
+        """
+        Reserva a chave nesta transação. Se ela já existe (confirmada por outra transação),
+        devolve o `Claim` com `replay`; payload diferente levanta 409 (`WMS-IDEM-001`).
+        """
+        claim = Claim(scope=scope, key=key, request_hash=req_hash)
+        replay = self.lookup(scope, key, req_hash)
+        if replay is not None:
+            claim.replay = replay
+            return claim
+
+        values = {
+            "scope": scope, "key": key, "request_hash": req_hash,
+            "response_json": "", "created_at": datetime.now(timezone.utc),
+        }
+        claim.row_id = _insert_if_absent(db, values)
+        if claim.row_id is not None:
+            return claim
+
+        stored_hash, response_json = db.execute(
+            select(IdempotencyKey.request_hash, IdempotencyKey.response_json)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        ).one()
+        if stored_hash != req_hash:
+            raise key_reused()
+        claim.replay = json.loads(response_json)
+        claim.response_json = response_json
+        self.remember(claim)
+        return claim
+
+    def complete(self, db: Session, claim: Claim, response: Any) -> None:
+        """Grava a resposta na linha reservada (mesma transação; o commit é do chamador)."""
+        claim.response_json = json.dumps(response, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.id == claim.row_id)
+            .values(response_json=claim.response_json)
+            .execution_options(synchronize_session=False)
+        )
+
+    def sweep(self, db: Session) -> int:
+        """Apaga, em lotes, as chaves mais velhas que o TTL. Retorna quantas foram removidas."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+        removed = 0
+        while True:
+            ids = db.execute(
+                select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff).limit(IDEMPOTENCY_SWEEP_BATCH)
+            ).scalars().all()
+            if not ids:
+                break
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+            db.commit()
+            removed += len(ids)
+            if len(ids) < IDEMPOTENCY_SWEEP_BATCH:
+                break
+        return removed
+
+    # ---- sweeper ----
+    async def start(self) -> None:
+        if IDEMPOTENCY_SWEEP_INTERVAL_SECONDS > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def _sweep_once(self) -> int:
+        with SessionLocal() as db:
+            return self.sweep(db)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_SWEEP_INTERVAL_SECONDS)
+            try:
+                removed = await run_in_threadpool(self._sweep_once)
+                if removed:
+                    log.info("Chaves de idempotência expiradas removidas.", extra={"removed": removed})
+            except Exception:  # noqa: BLE001
+                log.exception("Falha no sweeper de idempotência.")
+
+
+def _insert_if_absent(db: Session, values: dict[str, Any]) -> int | None:
+    """INSERT da chave; `None` se `(scope, key)` já existe."""
+    table = IdempotencyKey.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = (
+            dialect_insert(table).values(**values)
+            .on_conflict_do_nothing(index_elements=["scope", "key"])
+            .returning(table.c.id)
+        )
+        return db.execute(stmt).scalar_one_or_none()
+
+    try:
+        with db.begin_nested():
+            return db.execute(insert(table).values(**values).returning(table.c.id)).scalar_one()
+    except IntegrityError:
+        return None
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_CACHE_SIZE)
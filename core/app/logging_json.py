@@ -1,40 +1,212 @@
+import atexit
 import json
 import logging
 import os
+import queue
+import random
 import sys
 from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+try:  # encoder rápido opcional
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# Pipeline assíncrono: o request só enfileira; uma thread formata e escreve no stdout.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# fila cheia: drop (descarta e conta) | block (espera espaço; nunca perde linha)
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop").lower()
+# auto: orjson se instalado | orjson | json
+LOG_JSON_ENCODER = os.getenv("LOG_JSON_ENCODER", "auto").lower()
+# amostragem por mensagem ou logger: "Evento aplicado.=0.1,Requisição concluída.=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+EXTRA_KEYS = (
+    "correlationId",
+    "requestId",
+    "orderId",
+    "eventType",
+    "sapDocEntry",
+    "method",
+    "path",
+    "status",
+    "durationMs",
+    "dbQueries",
+    "dbTimeMs",
+    "eventsApplied",
+    "eventsFailed",
+    "items_created",
+    "items_updated",
+    "removed",
+    "sampleRate",
+    # texto curto do erro sem traceback; com exc_info, o traceback prevalece
+    "error",
+)
+
+
+def _json_dumps(encoder: str):
+    if encoder != "json" and orjson is not None:
+        return lambda obj: orjson.dumps(obj, default=str).decode("utf-8")
+    if encoder == "orjson":
+        raise RuntimeError("LOG_JSON_ENCODER=orjson, mas o pacote orjson não está instalado.")
+    return lambda obj: json.dumps(obj, ensure_ascii=False, default=str)
 
 
 class JsonFormatter(logging.Formatter):
+    def __init__(self, encoder: str = LOG_JSON_ENCODER):
+        super().__init__()
+        # campos estáticos resolvidos uma vez, não por registro
+        self.service = os.getenv("SERVICE_NAME", "wms-core")
+        self.dumps = _json_dumps(encoder)
+
     def format(self, record: logging.LogRecord) -> str:
         base = {
-            "ts": datetime.now(timezone.utc).isoformat(),
+            # horário do evento (não da escrita, que no modo assíncrono acontece depois)
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
-            "service": os.getenv("SERVICE_NAME", "wms-core"),
+            "service": self.service,
             "message": record.getMessage(),
         }
         # extras comuns
-        for key in (
-            "correlationId",
-            "requestId",
-            "orderId",
-            "eventType",
-            "sapDocEntry",
-        ):
-            if hasattr(record, key):
-                base[key] = getattr(record, key)
-        if record.exc_info:
+        attrs = record.__dict__
+        for key in EXTRA_KEYS:
+            if key in attrs:
+                base[key] = attrs[key]
+        if record.exc_text:
+            base["error"] = record.exc_text
+        elif record.exc_info:
             base["error"] = self.formatException(record.exc_info)
-        return json.dumps(base, ensure_ascii=False)
+        return self.dumps(base)
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for part in spec.split(","):
+        key, sep, value = part.rpartition("=")
+        if sep and key.strip():
+            rates[key.strip()] = min(1.0, max(0.0, float(value)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Mantém só uma fração das linhas de alto volume, casando pelo template da mensagem
+    (`record.msg`) ou pelo nome do logger. WARNING ou acima nunca é amostrado; as linhas
+    mantidas levam `sampleRate` para reponderar contagens.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg) if isinstance(record.msg, str) else None
+        if rate is None:
+            rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sampleRate = rate
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Enfileira o registro para o `QueueListener`. No caller só a mensagem e o traceback são
+    renderizados; o JSON e a escrita ficam na thread do listener.
+    """
+
+    def __init__(self, q: queue.Queue, block: bool):
+        super().__init__(q)
+        self.block = block
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args podem ser objetos mutáveis e o traceback segura frames: resolve agora
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DropReportingHandler(logging.StreamHandler):
+    """StreamHandler do listener que avisa, em linha própria, quantos registros a fila descartou."""
+
+    def __init__(self, stream, source: BoundedQueueHandler):
+        super().__init__(stream)
+        self.source = source
+        self.reported = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        dropped = self.source.dropped
+        if dropped != self.reported:
+            notice = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                "Logs descartados: fila de log cheia (%d desde o último aviso).", (dropped - self.reported,), None,
+            )
+            self.reported = dropped
+            super().emit(notice)
+
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # a fila pode estar cheia no shutdown: espera espaço em vez de falhar
+        self.queue.put(self._sentinel)
+
+
+_listener: QueueListener | None = None
+
+
+def stop_logging() -> None:
+    """Drena a fila e para a thread de escrita (shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def configure_logging() -> None:
     level = os.getenv("LOG_LEVEL", "INFO").upper()
     root = logging.getLogger()
     root.setLevel(level)
+    stop_logging()
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JsonFormatter())
+    formatter = JsonFormatter()
+    sampling = SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES))
     root.handlers.clear()
-    root.addHandler(handler)
 
+    if not LOG_ASYNC:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(formatter)
+        handler.addFilter(sampling)
+        root.addHandler(handler)
+        return
+
+    global _listener
+    front = BoundedQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE), block=LOG_QUEUE_POLICY == "block")
+    front.addFilter(sampling)
+    writer = DropReportingHandler(sys.stdout, front)
+    writer.setFormatter(formatter)
+    _listener = DrainingQueueListener(front.queue, writer)
+    _listener.start()
+    root.addHandler(front)
+
+
+atexit.register(stop_logging)
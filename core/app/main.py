@@ -1,24 +1,84 @@
 from __future__ import annotations
 
-import hashlib
-import json
 import logging
 import os
+import time
 import uuid
-from datetime import datetime, timezone
-from typing import Any
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Literal
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session, selectinload
 
-from .db import Base, engine, get_session
-from .logging_json import configure_logging
+from .analytics import dwell_report, dwell_rollup, run_dwell_rollup
+from .availability import (
+    AVAILABILITY_MAX_SKUS,
+    AvailabilityDelta,
+    availability_refresh,
+    availability_report,
+    ensure_availability_schema,
+)
+from .async_routes import SessionRunner, configure_threadpool, db_route, get_session_runner
+from .bulk import UpsertResult, bulk_upsert
+from .cache import read_cache
+from .concurrency import (
+    ORDER_CAS_MAX_RETRIES,
+    VersionConflict,
+    cas_transition,
+    concurrent_conflict,
+    if_match_satisfied,
+    precondition_failed,
+)
+from .conditional import is_not_modified, not_modified, page_validators, validator_headers, weak_etag
+from .db import Base, async_engine, engine, get_session
+from .db_metrics import RequestDbStats, pool_snapshot, request_db_stats
+from .event_archive import ArchiveUnavailable, ensure_event_partitions, ensure_event_schema, event_archive, load_history
+from .export import (
+    MEDIA_TYPES as EXPORT_MEDIA_TYPES,
+    ExportDataset,
+    ExportFormat,
+    export_columns,
+    export_watermark,
+    iter_export_batches,
+    stream_csv,
+    stream_ndjson,
+)
+from .idempotency import Claim, compose_key, idempotency_store, request_hash
+from .logging_json import configure_logging, stop_logging
+from .metrics import (
+    HTTP_REQUESTS_IN_FLIGHT,
+    METRICS_CONTENT_TYPE,
+    observe_bulk,
+    observe_idempotency_hit,
+    observe_request,
+    observe_transition,
+    render_metrics,
+)
+from .ndjson import NdjsonIngestResult, ingest_ndjson, require_ndjson
+from .order_counters import CounterDelta, ensure_order_counters, order_summary
+from .order_feed import ORDER_CREATED, ORDER_STATUS_CHANGED, order_feed, sse_format
+from .outbox import SAP_OUTBOX_DISPATCH_IN_API, enqueue_order_events, outbox_dispatcher, outbox_stats, requeue_failed
+from .pagination import CountMode, count_total, paginate, paginate_ranked
+from .projection import PROJECTION_CHECK_CHUNK, verify_order_projections
+from .search import CUSTOMER_SEARCH, PRODUCT_SEARCH, apply_search, ensure_search_indexes
+from .serialization import (
+    CUSTOMER_COLUMNS,
+    INVENTORY_COLUMNS,
+    ORDER_COLUMNS,
+    PRODUCT_COLUMNS,
+    ApiJSONResponse,
+    FastJSONResponse,
+    dumps,
+    event_row,
+    inventory_row,
+    json_body,
+    order_rows,
+)
 from .models import (
-    IdempotencyKey,
     Order as DbOrder,
     OrderEvent as DbOrderEvent,
     OrderItem as DbOrderItem,
@@ -31,13 +91,24 @@ from .schemas import (
     ErrorResponse,
     Order,
     OrderEvent,
+    OrderEventBatchItem,
+    OrderEventBatchItemResult,
+    OrderEventBatchRequest,
+    OrderEventBatchResponse,
     OrderEventRequest,
     OrderEventResult,
     OrderHistoryResponse,
+    SapOrder,
+    SapOrdersSyncChunkResult,
     SapOrdersSyncRequest,
     SapOrdersSyncResponse,
+    WavePlanRequest,
+    WaveStartRequest,
+    WaveStartResponse,
 )
+from .sap_sync import SAP_SYNC_CHUNK_SIZE, sync_orders_batched
 from .state_machine import order_sm
+from .waves import WAVE_MAX_LINES, WAVE_MAX_ORDERS, WAVE_MAX_UNITS, load_backlog, plan_waves, wave_id
 
 
 SERVICE_NAME = os.getenv("SERVICE_NAME", "wms-core")
@@ -45,7 +116,8 @@ INTERNAL_SHARED_SECRET = os.getenv("INTERNAL_SHARED_SECRET", "dev-internal-secre
 
 log = logging.getLogger(SERVICE_NAME)
 
-app = FastAPI(title="WMS Core", version="0.1.0")
+# respostas dict/modelo também renderizadas pelo encoder rápido
+app = FastAPI(title="WMS Core", version="0.1.0", default_response_class=FastJSONResponse)
 
 # CORS - Permitir requisições do frontend via Nginx
 # Em produção, o Nginx faz proxy então o Origin pode variar
@@ -56,7 +128,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-Correlation-Id", "X-Request-Id"],
+    expose_headers=["X-Correlation-Id", "X-Request-Id", "ETag", "Last-Modified", "Server-Timing", "X-Export-Watermark"],
 )
 
 
@@ -64,27 +136,53 @@ def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def stable_json(value: Any) -> str:
-    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
-
-
-def sha256(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
-
-
 @app.on_event("startup")
 def on_startup() -> None:
     configure_logging()
+    configure_threadpool()
     Base.metadata.create_all(bind=engine)
+    ensure_availability_schema(engine)
+    ensure_event_schema(engine)
+    ensure_event_partitions(engine)
+    ensure_search_indexes(engine)
+    ensure_order_counters(engine)
     log.info("Core iniciado.")
 
 
+@app.on_event("startup")
+async def start_order_feed() -> None:
+    await order_feed.start()
+    await idempotency_store.start()
+    await dwell_rollup.start()
+    await event_archive.start()
+    await availability_refresh.start()
+    if SAP_OUTBOX_DISPATCH_IN_API:
+        await outbox_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_order_feed() -> None:
+    await order_feed.stop()
+    await idempotency_store.stop()
+    await dwell_rollup.stop()
+    await event_archive.stop()
+    await availability_refresh.stop()
+    await outbox_dispatcher.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+    stop_logging()
+
+
 @app.middleware("http")
 async def correlation_middleware(request: Request, call_next):
     incoming = request.headers.get("x-correlation-id")
     correlation_id = incoming if incoming else str(uuid.uuid4())
     request.state.correlation_id = correlation_id
     request.state.request_id = str(uuid.uuid4())
+    db_stats = RequestDbStats()
+    request_db_stats.set(db_stats)
+    started = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc()
     try:
         response: Response = await call_next(request)
     except HTTPException as exc:
@@ -94,7 +192,7 @@ async def correlation_middleware(request: Request, call_next):
             details=getattr(exc, "details", None),
             correlationId=correlation_id,
         )
-        return JSONResponse(status_code=exc.status_code, content=payload.model_dump(by_alias=True))
+        response = JSONResponse(status_code=exc.status_code, content=payload.model_dump(by_alias=True))
     except Exception as exc:  # noqa: BLE001
         log.exception("Erro inesperado.", extra={"correlationId": correlation_id})
         payload = ErrorResponse(
@@ -103,9 +201,31 @@ async def correlation_middleware(request: Request, call_next):
             details={"error": str(exc)[:200]} if str(exc) else None,
             correlationId=correlation_id,
         )
-        return JSONResponse(status_code=500, content=payload.model_dump(by_alias=True))
-
-    response.headers["X-Correlation-Id"] = correlation_id
+        response = JSONResponse(status_code=500, content=payload.model_dump(by_alias=True))
+    else:
+        response.headers["X-Correlation-Id"] = correlation_id
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    # template da rota (`/orders/{order_id}`), não o path: cardinalidade limitada
+    observe_request(request.method, route.path if route is not None else "unmatched", response.status_code, elapsed)
+    # em respostas streaming, só conta o que rodou até o início do corpo
+    response.headers["Server-Timing"] = db_stats.server_timing()
+    log.info(
+        "Requisição concluída.",
+        extra={
+            "correlationId": correlation_id,
+            "requestId": request.state.request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "durationMs": round(elapsed * 1000, 2),
+            "dbQueries": db_stats.queries,
+            "dbTimeMs": round(db_stats.seconds * 1000, 2),
+        },
+    )
     return response
 
 
@@ -114,139 +234,166 @@ def health():
     return {"ok": True, "service": SERVICE_NAME}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas Prometheus (agregadas entre workers com PROMETHEUS_MULTIPROC_DIR)."""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/v1/cache/stats")
+def cache_stats():
+    """Hits/misses/evictions do cache de leitura (catálogo, clientes, estoque) deste processo."""
+    return read_cache.snapshot()
+
+
+@app.get("/v1/db/pool")
+def db_pool_stats():
+    """Uso do pool de conexões deste processo: conexões em uso/ociosas/overflow e espera no checkout."""
+    out = {"sync": pool_snapshot(engine.pool)}
+    if async_engine is not None:
+        out["async"] = pool_snapshot(async_engine.pool)
+    return out
+
+
+def cached_list_response(request: Request, entry: tuple[str, datetime | None, bytes]) -> Response:
+    """Página guardada no cache com seus validadores: 304 se o cliente já tem essa versão (só pelo ETag)."""
+    etag, last_modified, body = entry
+    if is_not_modified(request, etag, None):
+        return not_modified(etag, last_modified)
+    return json_body(body, headers=validator_headers(etag, last_modified))
+
+
 @app.get("/v1/catalog/items")
+@db_route
 def list_catalog_items(
+    request: Request,
     db: Session = Depends(get_session),
     search: str | None = None,
     active: bool | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    count: CountMode = "exact",
 ):
-    """Listagem de produtos do catálogo."""
-    q = select(DbProduct).order_by(DbProduct.sku.asc())
+    """Listagem de produtos do catálogo. Suporta GET condicional (ETag / If-None-Match)."""
+    search = (search or "").strip() or None  # mesmo termo na chave do cache e na consulta
+    cache_key, cached = read_cache.lookup(DbProduct.__tablename__, {
+        "search": search, "active": active,
+        "limit": limit, "offset": offset, "cursor": cursor, "count": count,
+    })
+    if cached is not None:
+        return cached_list_response(request, cached)
+
+    q = select(*PRODUCT_COLUMNS)
+    ranking = None
     if search:
-        q = q.where(
-            DbProduct.sku.ilike(f"%{search}%")
-            | DbProduct.description.ilike(f"%{search}%")
-        )
+        q, ranking = apply_search(db, q, PRODUCT_SEARCH, search)
     if active is not None:
         q = q.where(DbProduct.is_active == active)
 
-    total_q = select(DbProduct)
-    if search:
-        total_q = total_q.where(
-            DbProduct.sku.ilike(f"%{search}%")
-            | DbProduct.description.ilike(f"%{search}%")
-        )
-    total = len(db.execute(total_q).scalars().all())
-
-    rows = db.execute(q.offset(offset).limit(min(max(limit, 1), 200))).scalars().all()
-    return {
-        "data": [
-            {
-                "id": p.id,
-                "sku": p.sku,
-                "description": p.description,
-                "ean": p.ean,
-                "category": p.category,
-                "unit_of_measure": p.unit_of_measure,
-                "is_active": p.is_active,
-                "is_inventory_item": p.is_inventory_item,
-                "is_sales_item": p.is_sales_item,
-                "sap_item_code": p.sap_item_code,
-                "created_at": p.created_at.isoformat() if p.created_at else None,
-                "updated_at": p.updated_at.isoformat() if p.updated_at else None,
-            }
-            for p in rows
-        ],
+    total = count_total(db, q, count)
+    if ranking:
+        rows, next_cursor = paginate_ranked(db, q, ranking, limit, offset, cursor)
+    else:
+        rows, next_cursor = paginate(db, q, (DbProduct.sku,), limit, offset, cursor)
+    etag, last_modified = page_validators(
+        ("v1/catalog/items", search, active, limit, offset, cursor, count), rows, ("id", "updated_at"), next_cursor, total,
+    )
+    return cached_list_response(request, read_cache.store(cache_key, (etag, last_modified, dumps({
+        "data": [r._asdict() for r in rows],
         "total": total,
         "limit": limit,
         "offset": offset,
-    }
+        "nextCursor": next_cursor,
+    }))))
 
 
 @app.get("/v1/inventory")
+@db_route
 def list_inventory(
+    request: Request,
     db: Session = Depends(get_session),
     sku: str | None = None,
     warehouseCode: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    count: CountMode = "exact",
 ):
-    """Listagem de estoque por depósito."""
-    q = select(DbInventoryStock).order_by(DbInventoryStock.sku.asc())
+    """Listagem de estoque por depósito. Suporta GET condicional (ETag / If-None-Match)."""
+    sku = (sku or "").strip() or None  # mesmo filtro na chave do cache e na consulta
+    cache_key, cached = read_cache.lookup(DbInventoryStock.__tablename__, {
+        "sku": sku, "warehouseCode": warehouseCode,
+        "limit": limit, "offset": offset, "cursor": cursor, "count": count,
+    })
+    if cached is not None:
+        return cached_list_response(request, cached)
+
+    q = select(*INVENTORY_COLUMNS)
     if sku:
         q = q.where(DbInventoryStock.sku.ilike(f"%{sku}%"))
     if warehouseCode:
         q = q.where(DbInventoryStock.warehouse_code == warehouseCode)
 
-    total = len(db.execute(select(DbInventoryStock)).scalars().all())
-    rows = db.execute(q.offset(offset).limit(min(max(limit, 1), 200))).scalars().all()
+    total = count_total(db, q, count)
+    rows, next_cursor = paginate(db, q, (DbInventoryStock.sku, DbInventoryStock.id), limit, offset, cursor)
+    etag, last_modified = page_validators(
+        ("v1/inventory", sku, warehouseCode, limit, offset, cursor, count), rows, ("id", "updated_at"), next_cursor, total,
+    )
 
-    return {
-        "data": [
-            {
-                "id": s.id,
-                "product_id": s.sku,
-                "warehouse_id": s.warehouse_code,
-                "quantity_available": float(s.on_hand),
-                "quantity_reserved": float(s.committed),
-                "quantity_free": max(float(s.on_hand) - float(s.committed), 0),
-                "quantity_on_order": float(s.ordered),
-                "sap_update_date": s.sap_update_date,
-                "updated_at": s.updated_at.isoformat() if s.updated_at else None,
-            }
-            for s in rows
-        ],
+    return cached_list_response(request, read_cache.store(cache_key, (etag, last_modified, dumps({
+        "data": [inventory_row(r) for r in rows],
         "total": total,
         "limit": limit,
         "offset": offset,
-    }
+        "nextCursor": next_cursor,
+    }))))
 
 
 @app.get("/v1/customers")
+@db_route
 def list_customers(
+    request: Request,
     db: Session = Depends(get_session),
     search: str | None = None,
     active: bool | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    count: CountMode = "exact",
 ):
-    """Listagem de clientes."""
-    q = select(DbCustomer).order_by(DbCustomer.card_name.asc())
+    """Listagem de clientes. Suporta GET condicional (ETag / If-None-Match)."""
+    search = (search or "").strip() or None  # mesmo termo na chave do cache e na consulta
+    cache_key, cached = read_cache.lookup(DbCustomer.__tablename__, {
+        "search": search, "active": active,
+        "limit": limit, "offset": offset, "cursor": cursor, "count": count,
+    })
+    if cached is not None:
+        return cached_list_response(request, cached)
+
+    q = select(*CUSTOMER_COLUMNS)
+    ranking = None
     if search:
-        q = q.where(
-            DbCustomer.card_code.ilike(f"%{search}%")
-            | DbCustomer.card_name.ilike(f"%{search}%")
-        )
+        q, ranking = apply_search(db, q, CUSTOMER_SEARCH, search)
     if active is not None:
         q = q.where(DbCustomer.is_active == active)
 
-    total = len(db.execute(select(DbCustomer)).scalars().all())
-    rows = db.execute(q.offset(offset).limit(min(max(limit, 1), 200))).scalars().all()
+    total = count_total(db, q, count)
+    if ranking:
+        rows, next_cursor = paginate_ranked(db, q, ranking, limit, offset, cursor)
+    else:
+        rows, next_cursor = paginate(db, q, (DbCustomer.card_name, DbCustomer.id), limit, offset, cursor)
+    etag, last_modified = page_validators(
+        ("v1/customers", search, active, limit, offset, cursor, count), rows, ("id", "updated_at"), next_cursor, total,
+    )
 
-    return {
-        "data": [
-            {
-                "id": c.id,
-                "card_code": c.card_code,
-                "card_name": c.card_name,
-                "card_type": c.card_type,
-                "phone": c.phone,
-                "email": c.email,
-                "address": c.address,
-                "city": c.city,
-                "state": c.state,
-                "is_active": c.is_active,
-                "created_at": c.created_at.isoformat() if c.created_at else None,
-                "updated_at": c.updated_at.isoformat() if c.updated_at else None,
-            }
-            for c in rows
-        ],
+    return cached_list_response(request, read_cache.store(cache_key, (etag, last_modified, dumps({
+        "data": [r._asdict() for r in rows],
         "total": total,
         "limit": limit,
         "offset": offset,
-    }
+        "nextCursor": next_cursor,
+    }))))
 
 
 # ========================================
@@ -270,55 +417,68 @@ class BulkProductsRequest(BaseModel):
     items: list[BulkProductItem]
 
 
+def claim_bulk(db: Session, scope: str, idempotency_key: str | None, req: BaseModel) -> Claim | None:
+    """`Idempotency-Key` opcional nos bulk JSON: repetir o mesmo payload devolve a resposta original."""
+    if not idempotency_key:
+        return None
+    return idempotency_store.claim(db, scope, idempotency_key, request_hash(req.model_dump()))
+
+
 @app.post("/v1/catalog/items/bulk")
+@db_route
 def bulk_upsert_products(
     req: BulkProductsRequest,
     request: Request,
     db: Session = Depends(get_session),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     """Bulk upsert de produtos vindos do SAP."""
     correlation_id = request.state.correlation_id
-    created = 0
-    updated = 0
+    claim = claim_bulk(db, "BULK_PRODUCTS", idempotency_key, req)
+    if claim and claim.replay is not None:
+        observe_idempotency_hit("bulk_products")
+        return claim.replay
+    started = time.perf_counter()
+    result = bulk_upsert(db, DbProduct, (item.model_dump() for item in req.items), key_cols=("sku",), now=now_utc())
+    out = {"upserted": result.upserted, "created": result.created, "updated": result.updated}
+    if claim:
+        idempotency_store.complete(db, claim, out)
+    db.commit()
+    if claim:
+        idempotency_store.remember(claim)
+    read_cache.invalidate(DbProduct.__tablename__)
+    observe_bulk("products", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk products sync.", extra={"correlationId": correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return out
 
-    for item in req.items:
-        existing = db.execute(
-            select(DbProduct).where(DbProduct.sku == item.sku)
-        ).scalar_one_or_none()
 
-        now = now_utc()
-        if existing:
-            existing.description = item.description
-            existing.ean = item.ean
-            existing.category = item.category
-            existing.unit_of_measure = item.unit_of_measure
-            existing.is_active = item.is_active
-            existing.is_inventory_item = item.is_inventory_item
-            existing.is_sales_item = item.is_sales_item
-            existing.sap_item_code = item.sap_item_code
-            existing.sap_update_date = item.sap_update_date
-            existing.updated_at = now
-            updated += 1
-        else:
-            db.add(DbProduct(
-                sku=item.sku,
-                description=item.description,
-                ean=item.ean,
-                category=item.category,
-                unit_of_measure=item.unit_of_measure,
-                is_active=item.is_active,
-                is_inventory_item=item.is_inventory_item,
-                is_sales_item=item.is_sales_item,
-                sap_item_code=item.sap_item_code,
-                sap_update_date=item.sap_update_date,
-                created_at=now,
-                updated_at=now,
-            ))
-            created += 1
+def ndjson_bulk_response(result: UpsertResult, ingest: NdjsonIngestResult) -> dict:
+    return {
+        "upserted": result.upserted,
+        "created": result.created,
+        "updated": result.updated,
+        "received": ingest.received,
+        "invalid": ingest.invalid,
+        "errors": ingest.errors,
+    }
 
-    db.commit()
-    log.info("Bulk products sync.", extra={"correlationId": correlation_id, "items_created": created, "items_updated": updated})
-    return {"upserted": created + updated, "created": created, "updated": updated}
+
+@app.post("/v1/catalog/items/bulk/ndjson")
+async def bulk_upsert_products_ndjson(request: Request, runner: SessionRunner = Depends(get_session_runner)):
+    """Bulk upsert de produtos em NDJSON (um `BulkProductItem` por linha), gravado em lotes."""
+    require_ndjson(request)
+    result = UpsertResult()
+    started = time.perf_counter()
+
+    def write(db: Session, batch: list[BulkProductItem]) -> None:
+        result.add(bulk_upsert(db, DbProduct, (item.model_dump() for item in batch), key_cols=("sku",), now=now_utc()))
+        db.commit()
+        read_cache.invalidate(DbProduct.__tablename__)
+
+    ingest = await ingest_ndjson(request, BulkProductItem, write, run=runner.run)
+    observe_bulk("products", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk products sync (ndjson).", extra={"correlationId": request.state.correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return ndjson_bulk_response(result, ingest)
 
 
 class BulkInventoryItem(BaseModel):
@@ -335,48 +495,53 @@ class BulkInventoryRequest(BaseModel):
 
 
 @app.post("/v1/inventory/bulk")
+@db_route
 def bulk_upsert_inventory(
     req: BulkInventoryRequest,
     request: Request,
     db: Session = Depends(get_session),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     """Bulk upsert de estoque vindo do SAP."""
     correlation_id = request.state.correlation_id
-    created = 0
-    updated = 0
-
-    for item in req.items:
-        existing = db.execute(
-            select(DbInventoryStock).where(
-                DbInventoryStock.sku == item.sku,
-                DbInventoryStock.warehouse_code == item.warehouse_code,
-            )
-        ).scalar_one_or_none()
+    claim = claim_bulk(db, "BULK_INVENTORY", idempotency_key, req)
+    if claim and claim.replay is not None:
+        observe_idempotency_hit("bulk_inventory")
+        return claim.replay
+    started = time.perf_counter()
+    result = bulk_upsert(
+        db, DbInventoryStock, (item.model_dump() for item in req.items), key_cols=("sku", "warehouse_code"), now=now_utc()
+    )
+    out = {"upserted": result.upserted, "created": result.created, "updated": result.updated}
+    if claim:
+        idempotency_store.complete(db, claim, out)
+    db.commit()
+    if claim:
+        idempotency_store.remember(claim)
+    read_cache.invalidate(DbInventoryStock.__tablename__)
+    observe_bulk("inventory", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk inventory sync.", extra={"correlationId": correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return out
 
-        now = now_utc()
-        if existing:
-            existing.on_hand = item.on_hand
-            existing.committed = item.committed
-            existing.ordered = item.ordered
-            existing.sap_update_date = item.sap_update_date
-            existing.updated_at = now
-            updated += 1
-        else:
-            db.add(DbInventoryStock(
-                sku=item.sku,
-                warehouse_code=item.warehouse_code,
-                on_hand=item.on_hand,
-                committed=item.committed,
-                ordered=item.ordered,
-                sap_update_date=item.sap_update_date,
-                created_at=now,
-                updated_at=now,
-            ))
-            created += 1
 
-    db.commit()
-    log.info("Bulk inventory sync.", extra={"correlationId": correlation_id, "items_created": created, "items_updated": updated})
-    return {"upserted": created + updated, "created": created, "updated": updated}
+@app.post("/v1/inventory/bulk/ndjson")
+async def bulk_upsert_inventory_ndjson(request: Request, runner: SessionRunner = Depends(get_session_runner)):
+    """Bulk upsert de estoque em NDJSON (um `BulkInventoryItem` por linha), gravado em lotes."""
+    require_ndjson(request)
+    result = UpsertResult()
+    started = time.perf_counter()
+
+    def write(db: Session, batch: list[BulkInventoryItem]) -> None:
+        result.add(bulk_upsert(
+            db, DbInventoryStock, (item.model_dump() for item in batch), key_cols=("sku", "warehouse_code"), now=now_utc()
+        ))
+        db.commit()
+        read_cache.invalidate(DbInventoryStock.__tablename__)
+
+    ingest = await ingest_ndjson(request, BulkInventoryItem, write, run=runner.run)
+    observe_bulk("inventory", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk inventory sync (ndjson).", extra={"correlationId": request.state.correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return ndjson_bulk_response(result, ingest)
 
 
 class BulkCustomerItem(BaseModel):
@@ -397,57 +562,53 @@ class BulkCustomersRequest(BaseModel):
 
 
 @app.post("/v1/customers/bulk")
+@db_route
 def bulk_upsert_customers(
     req: BulkCustomersRequest,
     request: Request,
     db: Session = Depends(get_session),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     """Bulk upsert de clientes vindos do SAP."""
     correlation_id = request.state.correlation_id
-    created = 0
-    updated = 0
+    claim = claim_bulk(db, "BULK_CUSTOMERS", idempotency_key, req)
+    if claim and claim.replay is not None:
+        observe_idempotency_hit("bulk_customers")
+        return claim.replay
+    started = time.perf_counter()
+    result = bulk_upsert(db, DbCustomer, (item.model_dump() for item in req.items), key_cols=("card_code",), now=now_utc())
+    out = {"upserted": result.upserted, "created": result.created, "updated": result.updated}
+    if claim:
+        idempotency_store.complete(db, claim, out)
+    db.commit()
+    if claim:
+        idempotency_store.remember(claim)
+    read_cache.invalidate(DbCustomer.__tablename__)
+    observe_bulk("customers", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk customers sync.", extra={"correlationId": correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return out
 
-    for item in req.items:
-        existing = db.execute(
-            select(DbCustomer).where(DbCustomer.card_code == item.card_code)
-        ).scalar_one_or_none()
 
-        now = now_utc()
-        if existing:
-            existing.card_name = item.card_name
-            existing.card_type = item.card_type
-            existing.phone = item.phone
-            existing.email = item.email
-            existing.address = item.address
-            existing.city = item.city
-            existing.state = item.state
-            existing.is_active = item.is_active
-            existing.sap_update_date = item.sap_update_date
-            existing.updated_at = now
-            updated += 1
-        else:
-            db.add(DbCustomer(
-                card_code=item.card_code,
-                card_name=item.card_name,
-                card_type=item.card_type,
-                phone=item.phone,
-                email=item.email,
-                address=item.address,
-                city=item.city,
-                state=item.state,
-                is_active=item.is_active,
-                sap_update_date=item.sap_update_date,
-                created_at=now,
-                updated_at=now,
-            ))
-            created += 1
+@app.post("/v1/customers/bulk/ndjson")
+async def bulk_upsert_customers_ndjson(request: Request, runner: SessionRunner = Depends(get_session_runner)):
+    """Bulk upsert de clientes em NDJSON (um `BulkCustomerItem` por linha), gravado em lotes."""
+    require_ndjson(request)
+    result = UpsertResult()
+    started = time.perf_counter()
 
-    db.commit()
-    log.info("Bulk customers sync.", extra={"correlationId": correlation_id, "items_created": created, "items_updated": updated})
-    return {"upserted": created + updated, "created": created, "updated": updated}
+    def write(db: Session, batch: list[BulkCustomerItem]) -> None:
+        result.add(bulk_upsert(db, DbCustomer, (item.model_dump() for item in batch), key_cols=("card_code",), now=now_utc()))
+        db.commit()
+        read_cache.invalidate(DbCustomer.__tablename__)
+
+    ingest = await ingest_ndjson(request, BulkCustomerItem, write, run=runner.run)
+    observe_bulk("customers", result.created, result.updated, time.perf_counter() - started)
+    log.info("Bulk customers sync (ndjson).", extra={"correlationId": request.state.correlation_id, "items_created": result.created, "items_updated": result.updated})
+    return ndjson_bulk_response(result, ingest)
 
 
 @app.get("/v1/orders")
+@db_route
 def list_orders_v1(
     request: Request,
     db: Session = Depends(get_session),
@@ -455,30 +616,114 @@ def list_orders_v1(
     externalOrderId: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    count: CountMode = "exact",
 ):
     """
     Endpoint v1 para listagem de pedidos (compatível com a interface).
-    Redireciona para o endpoint /orders existente.
+    Mesma ordenação do /orders (mais recentes primeiro), com `total` e paginação por offset ou cursor.
+    Suporta GET condicional (ETag / If-None-Match).
     """
-    q = select(DbOrder).options(selectinload(DbOrder.items)).order_by(DbOrder.updated_at.desc())
+    q = select(DbOrder)
     if status:
         q = q.where(DbOrder.status == status)
     if externalOrderId:
         q = q.where(DbOrder.external_order_id.ilike(f"%{externalOrderId}%"))
-    
-    # Aplicar offset e limit
-    q = q.offset(offset).limit(min(max(limit, 1), 200))
 
-    rows = db.execute(q).scalars().all()
-    total = db.execute(select(DbOrder)).scalars().all()
-    
-    return {
-        "items": [db_order_to_schema(o) for o in rows],
-        "total": len(total),
+    total = count_total(db, q, count)
+    rows, next_cursor = paginate(
+        db, q.with_only_columns(*ORDER_COLUMNS, DbOrder.version), (DbOrder.updated_at, DbOrder.order_id),
+        limit, offset, cursor, descending=True,
+    )
+    # validadores da página (versão cobre transições com `occurredAt` retroativo); 304 sem carregar itens
+    etag, last_modified = page_validators(
+        ("v1/orders", status, externalOrderId, limit, offset, cursor, count),
+        rows, ("order_id", "version", "updated_at"), next_cursor, total,
+    )
+    if is_not_modified(request, etag, None):
+        return not_modified(etag, last_modified)
+    headers = validator_headers(etag, last_modified)
+
+    return ApiJSONResponse({
+        "items": order_rows(db, rows),
+        "total": total,
         "limit": limit,
         "offset": offset,
-        "nextCursor": None
-    }
+        "nextCursor": next_cursor,
+    }, headers=headers)
+
+
+# ========================================
+# Export (BI / cargas incrementais)
+# ========================================
+
+@app.get("/v1/export/{dataset}")
+def export_dataset(
+    dataset: ExportDataset,
+    format: ExportFormat = "ndjson",
+    updated_since: datetime | None = None,
+):
+    """
+    Export completo (ou incremental via `updated_since`, inclusivo) em NDJSON ou CSV.
+    Em `order-events` o corte é por `recorded_at`; em `orders`, `updated_at` ou evento gravado
+    desde o corte. `X-Export-Watermark` traz o próximo `updated_since`. Memória constante:
+    cursor no servidor.
+    """
+    watermark = export_watermark()
+    batches = iter_export_batches(dataset, updated_since)
+    body = stream_csv(batches, export_columns(dataset)) if format == "csv" else stream_ndjson(batches)
+    filename = f"{dataset}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Watermark": watermark.isoformat(),
+        },
+    )
+
+
+# ========================================
+# Feed de mudanças de pedido (SSE / WebSocket)
+# ========================================
+
+@app.get("/v1/orders/stream")
+async def stream_order_changes(
+    request: Request,
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+    lastEventId: str | None = None,
+):
+    """
+    Server-Sent Events com `order.created`, `order.status_changed` e `order.sap_updated`.
+    Retoma após `Last-Event-ID` (header do EventSource ou `?lastEventId=`); se o id já saiu
+    do buffer, envia `feed.reset` e o cliente deve recarregar a listagem.
+    """
+
+    async def events():
+        async for message in order_feed.subscribe(last_event_id or lastEventId):
+            if await request.is_disconnected():
+                break
+            yield sse_format(message)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/v1/orders/stream")
+async def stream_order_changes_ws(websocket: WebSocket, lastEventId: str | None = None):
+    """Fallback WebSocket do feed: mesmas mensagens do SSE, uma por frame JSON."""
+    await websocket.accept()
+    try:
+        async for message in order_feed.subscribe(lastEventId):
+            if message is None:
+                await websocket.send_json({"type": "keep-alive"})
+            else:
+                await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
 
 
 def db_order_to_schema(o: DbOrder) -> Order:
@@ -506,6 +751,7 @@ def db_event_to_schema(e: DbOrderEvent) -> OrderEvent:
 
 
 @app.post("/orders", status_code=201, response_model=Order)
+@db_route
 def create_order(
     req: CreateOrderRequest,
     request: Request,
@@ -514,20 +760,13 @@ def create_order(
 ):
     correlation_id = request.state.correlation_id
 
-    # Idempotência por header
+    # Idempotência por header: a chave é reservada nesta transação (insert-first)
+    claim = None
     if idempotency_key:
-        scope = "ORDER_CREATE"
-        request_hash = sha256(stable_json(req.model_dump()))
-        existing = db.execute(
-            select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == idempotency_key)
-        ).scalar_one_or_none()
-        if existing:
-            if existing.request_hash != request_hash:
-                exc = HTTPException(status_code=409, detail="Idempotency-Key já usada com payload diferente.")
-                setattr(exc, "error_code", "WMS-IDEM-001")
-                raise exc
-            payload = json.loads(existing.response_json)
-            return payload
+        claim = idempotency_store.claim(db, "ORDER_CREATE", idempotency_key, request_hash(req.model_dump()))
+        if claim.replay is not None:
+            observe_idempotency_hit("create_order")
+            return claim.replay
 
     # Se já existir por externalOrderId, devolve (best-effort para sync SAP)
     if req.externalOrderId:
@@ -554,215 +793,615 @@ def create_order(
         order.items.append(DbOrderItem(order_id=oid, sku=it.sku, quantity=it.quantity))
 
     db.add(order)
-    db.commit()
-    db.refresh(order)
-
+    CounterDelta().add(order.status, order.customer_id, now).apply(db)
+    demand = AvailabilityDelta().lines(oid, order.items)
+    db.flush()
     out = db_order_to_schema(order)
-
-    if idempotency_key:
-        idem = IdempotencyKey(
-            scope="ORDER_CREATE",
-            key=idempotency_key,
-            request_hash=sha256(stable_json(req.model_dump())),
-            response_json=stable_json(out.model_dump(mode="json")),
-            created_at=now,
-        )
-        db.add(idem)
-        db.commit()
+    if claim:
+        # resposta gravada no mesmo commit do pedido
+        idempotency_store.complete(db, claim, out.model_dump(mode="json"))
+    changes = order_feed.stage(db, [order_feed.message(ORDER_CREATED, oid, status=order.status, version=order.version)])
+    db.commit()
+    if claim:
+        idempotency_store.remember(claim)
+    demand.publish(db)
+    order_feed.publish_many(changes)
 
     log.info("Pedido criado.", extra={"correlationId": correlation_id, "orderId": oid})
     return out
 
 
 @app.get("/orders")
+@db_route
 def list_orders(
     request: Request,
     db: Session = Depends(get_session),
     status: str | None = None,
     externalOrderId: str | None = None,
     limit: int = 50,
+    cursor: str | None = None,
 ):
-    q = select(DbOrder).options(selectinload(DbOrder.items)).order_by(DbOrder.updated_at.desc())
+    q = select(DbOrder)
     if status:
         q = q.where(DbOrder.status == status)
     if externalOrderId:
         # “search” do painel costuma passar DocNum parcial; usamos match parcial.
         q = q.where(DbOrder.external_order_id.ilike(f"%{externalOrderId}%"))
-    q = q.limit(min(max(limit, 1), 200))
 
-    rows = db.execute(q).scalars().all()
-    return {"items": [db_order_to_schema(o) for o in rows], "nextCursor": None}
+    rows, next_cursor = paginate(
+        db, q.with_only_columns(*ORDER_COLUMNS, DbOrder.version), (DbOrder.updated_at, DbOrder.order_id),
+        limit, cursor=cursor, descending=True,
+    )
+    # polling do painel: a mesma consulta indexada com LIMIT; 304 sem carregar itens nem serializar
+    etag, last_modified = page_validators(
+        ("orders", status, externalOrderId, limit, cursor), rows, ("order_id", "version", "updated_at"), next_cursor,
+    )
+    if is_not_modified(request, etag, None):
+        return not_modified(etag, last_modified)
+    headers = validator_headers(etag, last_modified)
+
+    return ApiJSONResponse({"items": order_rows(db, rows), "nextCursor": next_cursor}, headers=headers)
+
+
+@app.get("/v1/orders/summary")
+@db_route
+def get_orders_summary(
+    db: Session = Depends(get_session),
+    groupBy: Literal["customer", "day", "customer,day"] | None = None,
+    customerId: str | None = None,
+    dateFrom: date | None = None,
+    dateTo: date | None = None,
+):
+    """
+    Pedidos por status (painel), lidos da tabela de contadores mantida pelas escritas de
+    pedido. `groupBy` quebra por cliente e/ou dia de criação (UTC).
+    """
+    return order_summary(db, groupBy.split(",") if groupBy else None, customerId, dateFrom, dateTo)
+
+
+# documento estático (muda só com deploy): serializado e hasheado uma vez
+STATE_MACHINE_DOC = order_sm.describe()
+STATE_MACHINE_ETAG = weak_etag("state-machine", request_hash(STATE_MACHINE_DOC))
+_STATE_MACHINE_BODY = JSONResponse(STATE_MACHINE_DOC).body
+
+
+@app.get("/v1/state-machine")
+def get_state_machine(request: Request):
+    """
+    Máquina de estados compilada: códigos de estados/eventos, eventos permitidos por estado,
+    tabela de transições, alcançabilidade e caminhos mínimos. Suporta `If-None-Match`.
+    """
+    if is_not_modified(request, STATE_MACHINE_ETAG, None):
+        return not_modified(STATE_MACHINE_ETAG, None)
+    return Response(
+        content=_STATE_MACHINE_BODY,
+        media_type="application/json",
+        headers=validator_headers(STATE_MACHINE_ETAG, None),
+    )
+
+
+@app.get("/v1/analytics/dwell")
+@db_route
+def get_dwell_analytics(
+    db: Session = Depends(get_session),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    refresh: bool = False,
+):
+    """
+    Tempo de permanência por estado (p50/p90/p99), vazão por hora e estouros de SLA, lidos
+    dos rollups incrementais (padrão: últimas 24 h). `refresh=true` processa os eventos
+    pendentes antes de responder.
+    """
+    until = until or now_utc()
+    since = since or until - timedelta(hours=24)
+    if refresh:
+        run_dwell_rollup(db)
+    return dwell_report(db, since, until)
+
+
+class AvailabilityQuery(BaseModel):
+    skus: list[str]
+    warehouseCode: str | None = None
+
+
+def _availability(db: Session, skus: list[str], warehouse_code: str | None) -> dict:
+    if len(skus) > AVAILABILITY_MAX_SKUS:
+        exc = HTTPException(status_code=422, detail=f"Máximo de {AVAILABILITY_MAX_SKUS} SKUs por consulta.")
+        setattr(exc, "error_code", "WMS-AVL-001")
+        raise exc
+    return availability_report(db, skus, warehouse_code)
+
+
+@app.get("/v1/availability")
+@db_route
+def get_availability(db: Session = Depends(get_session), skus: str = "", warehouseCode: str | None = None):
+    """
+    Disponibilidade por SKU e depósito: estoque SAP menos a demanda dos pedidos abertos
+    (`A_SEPARAR`/`EM_SEPARACAO`), lida de um índice em memória. `skus` separados por vírgula.
+    """
+    return _availability(db, [s.strip() for s in skus.split(",") if s.strip()], warehouseCode)
+
+
+@app.post("/v1/availability:query")
+@db_route
+def query_availability(req: AvailabilityQuery, db: Session = Depends(get_session)):
+    """Mesma consulta do GET com os SKUs no corpo (listas grandes não cabem na URL)."""
+    return _availability(db, req.skus, req.warehouseCode)
+
+
+def order_etag(order_id: str, version: int, updated_at: datetime, sap_update_date: str | None, sap_update_time: str | None) -> str:
+    return weak_etag(order_id, version, updated_at, sap_update_date, sap_update_time)
 
 
 @app.get("/orders/{order_id}", response_model=Order)
-def get_order(order_id: str, db: Session = Depends(get_session)):
-    order = db.execute(select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.order_id == order_id)).scalar_one_or_none()
-    if not order:
+@db_route
+def get_order(order_id: str, request: Request, db: Session = Depends(get_session)):
+    # uma linha projetada serve para validar o cache e montar a resposta; itens só no 200
+    row = db.execute(
+        select(*ORDER_COLUMNS, DbOrder.version, DbOrder.sap_update_date, DbOrder.sap_update_time)
+        .where(DbOrder.order_id == order_id)
+    ).one_or_none()
+    if not row:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
-    return db_order_to_schema(order)
+    etag = order_etag(order_id, row.version, row.updated_at, row.sap_update_date, row.sap_update_time)
+    if is_not_modified(request, etag, row.updated_at):
+        return not_modified(etag, row.updated_at)
+    return ApiJSONResponse(order_rows(db, [row])[0], headers=validator_headers(etag, row.updated_at))
 
 
 @app.get("/orders/{order_id}/history", response_model=OrderHistoryResponse)
+@db_route
 def get_history(order_id: str, db: Session = Depends(get_session)):
-    order = db.execute(select(DbOrder).where(DbOrder.order_id == order_id)).scalar_one_or_none()
-    if not order:
+    if db.execute(select(DbOrder.order_id).where(DbOrder.order_id == order_id)).first() is None:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
-    events = db.execute(select(DbOrderEvent).where(DbOrderEvent.order_id == order_id).order_by(DbOrderEvent.occurred_at.asc())).scalars().all()
-    return OrderHistoryResponse(orderId=order_id, events=[db_event_to_schema(e) for e in events])
+    try:
+        events = load_history(db, order_id)
+    except ArchiveUnavailable as e:
+        log.error("Arquivo frio do pedido indisponível.", extra={"orderId": order_id, "error": str(e)})
+        exc = HTTPException(status_code=503, detail="Histórico arquivado do pedido indisponível.")
+        setattr(exc, "error_code", "WMS-ARC-001")
+        raise exc from None
+    return ApiJSONResponse({"orderId": order_id, "events": [event_row(e) for e in events]})
 
 
 @app.post("/orders/{order_id}/events", response_model=OrderEventResult)
+@db_route
 def post_event(
     order_id: str,
     req: OrderEventRequest,
     request: Request,
+    response: Response,
     db: Session = Depends(get_session),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    if_match: str | None = Header(default=None, alias="If-Match"),
 ):
+    """
+    Aplica uma transição com compare-and-swap em `Order.version` (sem lock de linha).
+    Com `If-Match`, a versão lida pelo cliente precisa ser a atual (senão 412). Sem ele, um
+    conflito com outro worker é refeito do zero até `ORDER_CAS_MAX_RETRIES` vezes: a nova
+    leitura revalida a transição e encontra o evento do vencedor em repetições idempotentes.
+    """
     correlation_id = request.state.correlation_id
-    order = db.execute(select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.order_id == order_id)).scalar_one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado.")
 
-    if order_sm.is_final(order.status):
-        exc = HTTPException(status_code=409, detail="Pedido em estado final.")
-        setattr(exc, "error_code", "WMS-SM-003")
-        raise exc
+    # INV-003: a chave é (orderId, type, Idempotency-Key); o restante do payload não é comparado
+    idem_key = compose_key(order_id, req.type, idempotency_key) if idempotency_key else None
+    idem_hash = request_hash(req.type)
+    if idem_key:
+        replay = idempotency_store.lookup("ORDER_EVENT", idem_key, idem_hash)
+        if replay is not None:
+            observe_idempotency_hit("post_event")
+            return replay
+
+    for _attempt in range(ORDER_CAS_MAX_RETRIES + 1):
+        order = db.execute(select(DbOrder).where(DbOrder.order_id == order_id)).scalar_one_or_none()
+        if not order:
+            raise HTTPException(status_code=404, detail="Pedido não encontrado.")
+
+        # repetição idempotente vence If-Match e estado final: devolve o resultado original
+        claim = None
+        if idem_key:
+            claim = idempotency_store.claim(db, "ORDER_EVENT", idem_key, idem_hash)
+            if claim.replay is not None:
+                observe_idempotency_hit("post_event")
+                return claim.replay
+            # eventos gravados pelo lote (ou antes do store) só existem em order_events
+            existing = db.execute(
+                select(DbOrderEvent).where(
+                    DbOrderEvent.order_id == order_id,
+                    DbOrderEvent.type == req.type,
+                    DbOrderEvent.idempotency_key == idempotency_key,
+                )
+            ).scalar_one_or_none()
+            if existing:
+                observe_idempotency_hit("post_event")
+                return OrderEventResult(
+                    orderId=order_id,
+                    previousStatus=existing.from_status,  # type: ignore[arg-type]
+                    currentStatus=existing.to_status,  # type: ignore[arg-type]
+                    applied=True,
+                    event=db_event_to_schema(existing),
+                )
+
+        etag = order_etag(order_id, order.version, order.updated_at, order.sap_update_date, order.sap_update_time)
+        if if_match is not None and not if_match_satisfied(if_match, etag, order.version):
+            raise precondition_failed(order.version)
+
+        if order_sm.is_final(order.status):
+            exc = HTTPException(status_code=409, detail="Pedido em estado final.")
+            setattr(exc, "error_code", "WMS-SM-003")
+            raise exc
+
+        next_state = order_sm.next_state(order.status, req.type)
+        if not next_state:
+            exc = HTTPException(status_code=409, detail="Transição inválida para o status atual.")
+            setattr(exc, "error_code", "WMS-SM-001")
+            setattr(exc, "details", {"from": order.status, "eventType": req.type})
+            raise exc
+
+        prev = order.status
+        version = order.version + 1
+        occurred_at = req.occurredAt or now_utc()
+
+        # itens imutáveis após iniciar separação (MVP)
+        # (este endpoint não altera itens; a guarda aqui é apenas conceitual)
+
+        try:
+            cas_transition(db, order_id, order.version, next_state, occurred_at)
+        except VersionConflict:
+            db.rollback()
+            if if_match is not None:
+                raise precondition_failed(order.version + 1) from None
+            continue
+        CounterDelta().move(prev, next_state, order.customer_id, order.created_at).apply(db)
+
+        ev = DbOrderEvent(
+            event_id=str(uuid.uuid4()),
+            order_id=order_id,
+            type=req.type,
+            from_status=prev,
+            to_status=next_state,
+            occurred_at=occurred_at,
+            recorded_at=now_utc(),
+            actor_kind=req.actor.kind,
+            actor_id=req.actor.id,
+            idempotency_key=idempotency_key,
+            correlation_id=correlation_id,
+            request_id=request.state.request_id,
+        )
+        db.add(ev)
+        outbox = enqueue_order_events(db, [(ev, order.sap_doc_entry)])
+        result = OrderEventResult(
+            orderId=order_id,
+            previousStatus=prev,  # type: ignore[arg-type]
+            currentStatus=next_state,  # type: ignore[arg-type]
+            applied=True,
+            event=db_event_to_schema(ev),
+        )
+        if claim:
+            idempotency_store.complete(db, claim, result.model_dump(mode="json", by_alias=True))
+        changes = order_feed.stage(db, [order_feed.message(
+            ORDER_STATUS_CHANGED, order_id,
+            status=next_state, previousStatus=prev, eventType=req.type, version=version,
+        )])
+        db.commit()
+        if claim:
+            idempotency_store.remember(claim)
+        break
+    else:
+        log.warning("Conflito de versão persistente.", extra={"correlationId": correlation_id, "orderId": order_id})
+        raise concurrent_conflict()
+
+    AvailabilityDelta().move(order_id, prev, next_state).publish(db)
+    if outbox:
+        outbox_dispatcher.notify()
+    order_feed.publish_many(changes)
+    observe_transition(prev, next_state, req.type)
+    response.headers["ETag"] = order_etag(order_id, version, occurred_at, order.sap_update_date, order.sap_update_time)
 
-    # idempotência simples por (orderId, type, idemKey)
-    if idempotency_key:
-        existing = db.execute(
-            select(DbOrderEvent).where(
-                DbOrderEvent.order_id == order_id,
-                DbOrderEvent.type == req.type,
-                DbOrderEvent.idempotency_key == idempotency_key,
-            )
-        ).scalar_one_or_none()
-        if existing:
-            event_schema = db_event_to_schema(existing)
-            return OrderEventResult(
-                orderId=order_id,
+    log.info("Evento aplicado.", extra={"correlationId": correlation_id, "orderId": order_id, "eventType": req.type})
+    return result
+
+
+@app.post("/v1/orders/events:batch", response_model=OrderEventBatchResponse)
+@db_route
+def post_events_batch(
+    req: OrderEventBatchRequest,
+    request: Request,
+    db: Session = Depends(get_session),
+):
+    """
+    Aplica várias transições (ondas de separação) numa única transação: uma consulta para os
+    pedidos, uma para a idempotência e um INSERT em lote dos eventos. Falhas são por item;
+    os itens válidos são aplicados mesmo que outros falhem. Cada pedido alterado é gravado
+    com compare-and-swap em `version`; havendo conflito, o lote inteiro é refeito
+    (até `ORDER_CAS_MAX_RETRIES` vezes).
+    """
+    return run_events_batch(db, req, request)
+
+
+def run_events_batch(db: Session, req: OrderEventBatchRequest, request: Request) -> OrderEventBatchResponse:
+    correlation_id = request.state.correlation_id
+    for _attempt in range(ORDER_CAS_MAX_RETRIES + 1):
+        try:
+            results, new_events, changes = apply_events_batch(db, req, correlation_id, request.state.request_id)
+            break
+        except VersionConflict:
+            db.rollback()
+    else:
+        raise concurrent_conflict()
+
+    order_feed.publish_many(changes)
+    failed = sum(1 for r in results if not r.ok)
+    for ev, _ in new_events:
+        observe_transition(ev.from_status, ev.to_status, ev.type)
+    observe_idempotency_hit("events_batch", len(results) - failed - len(new_events))
+    log.info(
+        "Lote de eventos aplicado.",
+        extra={"correlationId": correlation_id, "eventsApplied": len(new_events), "eventsFailed": failed},
+    )
+    return OrderEventBatchResponse(applied=len(new_events), failed=failed, results=results)
+
+
+@app.post("/v1/waves:plan")
+@db_route
+def plan_pick_waves(req: WavePlanRequest, db: Session = Depends(get_session)):
+    """
+    Agrupa o backlog `A_SEPARAR` em ondas de separação com o máximo de SKUs em comum, dentro
+    dos limites de linhas/unidades/pedidos. Só planeja: nada muda até `/v1/waves:start`.
+    """
+    plan = plan_waves(
+        load_backlog(db),
+        max_lines=req.maxLines or WAVE_MAX_LINES,
+        max_units=req.maxUnits or WAVE_MAX_UNITS,
+        max_orders=req.maxOrders or WAVE_MAX_ORDERS,
+    )
+    if req.limit is not None:
+        plan["waves"] = plan["waves"][: req.limit]
+    return plan
+
+
+@app.post("/v1/waves:start", response_model=WaveStartResponse)
+@db_route
+def start_pick_wave(req: WaveStartRequest, request: Request, db: Session = Depends(get_session)):
+    """
+    Inicia a separação da onda inteira numa transação (mesmo fluxo de `/v1/orders/events:batch`).
+    A chave de idempotência é derivada da onda: repetir o mesmo início não gera eventos novos.
+    """
+    wid = req.waveId or wave_id(req.orderIds)
+    batch = OrderEventBatchRequest(actor=req.actor, events=[
+        OrderEventBatchItem(orderId=oid, type="INICIAR_SEPARACAO", idempotencyKey=f"wave:{wid}")
+        for oid in dict.fromkeys(req.orderIds)
+    ])
+    result = run_events_batch(db, batch, request)
+    return WaveStartResponse(waveId=wid, applied=result.applied, failed=result.failed, results=result.results)
+
+
+def apply_events_batch(
+    db: Session, req: OrderEventBatchRequest, correlation_id: str, request_id: str
+) -> tuple[list[OrderEventBatchItemResult], list[tuple[DbOrderEvent, int]], list[dict[str, Any]]]:
+    order_ids = {e.orderId for e in req.events}
+
+    # estado em memória por pedido: [status, version, updated_at]; versão lida para o CAS
+    state: dict[str, list] = {}
+    read: dict[str, tuple[str, int, str, datetime]] = {}  # status/versão lidos, cliente, criação
+    doc_entries: dict[str, int | None] = {}
+    for oid, status, version, updated_at, customer_id, created_at, doc_entry in db.execute(
+        select(
+            DbOrder.order_id, DbOrder.status, DbOrder.version, DbOrder.updated_at,
+            DbOrder.customer_id, DbOrder.created_at, DbOrder.sap_doc_entry,
+        ).where(DbOrder.order_id.in_(order_ids))
+    ):
+        state[oid] = [status, version, updated_at]
+        read[oid] = (status, version, customer_id, created_at)
+        doc_entries[oid] = doc_entry
+
+    # idempotência por (orderId, eventType, idemKey), igual ao endpoint unitário
+    keys = {e.idempotencyKey for e in req.events if e.idempotencyKey}
+    seen: dict[tuple[str, str, str], DbOrderEvent] = {}
+    if keys:
+        for ev in db.execute(
+            select(DbOrderEvent).where(DbOrderEvent.order_id.in_(order_ids), DbOrderEvent.idempotency_key.in_(keys))
+        ).scalars():
+            seen[(ev.order_id, ev.type, ev.idempotency_key)] = ev
+
+    results: list[OrderEventBatchItemResult] = []
+    new_events: list[tuple[DbOrderEvent, int]] = []
+
+    def fail(index: int, order_id: str, code: str, message: str) -> None:
+        results.append(OrderEventBatchItemResult(index=index, orderId=order_id, ok=False, errorCode=code, message=message))
+
+    for index, item in enumerate(req.events):
+        current = state.get(item.orderId)
+        if not current:
+            fail(index, item.orderId, "WMS-ORD-404", "Pedido não encontrado.")
+            continue
+
+        # repetição antes do estado final, como no endpoint unitário: o DESPACHAR repetido
+        # encontra o pedido já em DESPACHADO
+        idem = (item.orderId, item.type, item.idempotencyKey) if item.idempotencyKey else None
+        if idem and idem in seen:
+            existing = seen[idem]
+            results.append(OrderEventBatchItemResult(index=index, orderId=item.orderId, ok=True, result=OrderEventResult(
+                orderId=item.orderId,
                 previousStatus=existing.from_status,  # type: ignore[arg-type]
                 currentStatus=existing.to_status,  # type: ignore[arg-type]
                 applied=True,
-                event=event_schema,
-            )
-
-    next_state = order_sm.next_state(order.status, req.type)
-    if not next_state:
-        exc = HTTPException(status_code=409, detail="Transição inválida para o status atual.")
-        setattr(exc, "error_code", "WMS-SM-001")
-        setattr(exc, "details", {"from": order.status, "eventType": req.type})
-        raise exc
+                event=db_event_to_schema(existing),
+            )))
+            continue
 
-    prev = order.status
-    occurred_at = req.occurredAt or now_utc()
-
-    # itens imutáveis após iniciar separação (MVP)
-    # (este endpoint não altera itens; a guarda aqui é apenas conceitual)
-
-    order.status = next_state
-    order.updated_at = occurred_at
-    order.version += 1
-
-    ev = DbOrderEvent(
-        order_id=order_id,
-        type=req.type,
-        from_status=prev,
-        to_status=next_state,
-        occurred_at=occurred_at,
-        actor_kind=req.actor.kind,
-        actor_id=req.actor.id,
-        idempotency_key=idempotency_key,
-        correlation_id=correlation_id,
-        request_id=request.state.request_id,
-    )
-    db.add(ev)
+        if order_sm.is_final(current[0]):
+            fail(index, item.orderId, "WMS-SM-003", "Pedido em estado final.")
+            continue
+
+        next_state = order_sm.next_state(current[0], item.type)
+        if not next_state:
+            fail(index, item.orderId, "WMS-SM-001", f"Transição inválida para o status atual ({current[0]}).")
+            continue
+
+        prev = current[0]
+        occurred_at = item.occurredAt or now_utc()
+        actor = item.actor or req.actor
+        current[0], current[1], current[2] = next_state, current[1] + 1, occurred_at
+
+        ev = DbOrderEvent(
+            event_id=str(uuid.uuid4()),
+            order_id=item.orderId,
+            type=item.type,
+            from_status=prev,
+            to_status=next_state,
+            occurred_at=occurred_at,
+            recorded_at=now_utc(),
+            actor_kind=actor.kind,
+            actor_id=actor.id,
+            idempotency_key=item.idempotencyKey,
+            correlation_id=correlation_id,
+            request_id=request_id,
+        )
+        new_events.append((ev, current[1]))
+        if idem:
+            seen[idem] = ev
+        results.append(OrderEventBatchItemResult(index=index, orderId=item.orderId, ok=True, result=OrderEventResult(
+            orderId=item.orderId,
+            previousStatus=prev,  # type: ignore[arg-type]
+            currentStatus=next_state,  # type: ignore[arg-type]
+            applied=True,
+            event=db_event_to_schema(ev),
+        )))
+
+    counters = CounterDelta()
+    demand = AvailabilityDelta()
+    for oid, (status, version, updated_at) in state.items():
+        read_status, read_version, customer_id, created_at = read[oid]
+        if version != read_version:
+            cas_transition(db, oid, read_version, status, updated_at, steps=version - read_version)
+            counters.move(read_status, status, customer_id, created_at)
+            demand.move(oid, read_status, status)
+    counters.apply(db)
+    if new_events:
+        db.execute(insert(DbOrderEvent), [
+            {c.key: getattr(ev, c.key) for c in DbOrderEvent.__table__.columns} for ev, _ in new_events
+        ])
+    outbox = enqueue_order_events(db, [(ev, doc_entries[ev.order_id]) for ev, _ in new_events])
+    changes = order_feed.stage(db, [
+        order_feed.message(
+            ORDER_STATUS_CHANGED, ev.order_id,
+            status=ev.to_status, previousStatus=ev.from_status, eventType=ev.type, version=version,
+        )
+        for ev, version in new_events
+    ])
     db.commit()
-    db.refresh(ev)
-
-    result = OrderEventResult(
-        orderId=order_id,
-        previousStatus=prev,  # type: ignore[arg-type]
-        currentStatus=next_state,  # type: ignore[arg-type]
-        applied=True,
-        event=db_event_to_schema(ev),
-    )
-    log.info("Evento aplicado.", extra={"correlationId": correlation_id, "orderId": order_id, "eventType": req.type})
-    return result
+    demand.publish(db)
+    if outbox:
+        outbox_dispatcher.notify()
+    return results, new_events, changes
 
 
 @app.post("/internal/sap/orders", response_model=SapOrdersSyncResponse)
+@db_route
 def sync_sap_orders(
     req: SapOrdersSyncRequest,
     request: Request,
     db: Session = Depends(get_session),
     internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+    chunkSize: int | None = None,
 ):
     if internal_secret != INTERNAL_SHARED_SECRET:
         raise HTTPException(status_code=403, detail="forbidden")
 
     correlation_id = request.state.correlation_id
-    created = 0
-    updated = 0
-
-    for o in req.orders:
-        external_id = str(o.DocNum)
-        existing = None
-        if o.DocEntry is not None:
-            existing = db.execute(
-                select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.sap_doc_entry == o.DocEntry)
-            ).scalar_one_or_none()
-        if not existing:
-            existing = db.execute(
-                select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.external_order_id == external_id)
-            ).scalar_one_or_none()
-
-        if not existing:
-            oid = str(uuid.uuid4())
-            now = now_utc()
-            order = DbOrder(
-                order_id=oid,
-                external_order_id=external_id,
-                customer_id=o.CardCode,
-                status=order_sm.initial_state,
-                created_at=now,
-                updated_at=now,
-                version=0,
-                sap_doc_entry=o.DocEntry,
-                sap_doc_num=o.DocNum,
-                sap_doc_status=o.DocStatus,
-                sap_update_date=o.UpdateDate,
-                sap_update_time=o.UpdateTime,
-            )
-            for line in o.DocumentLines or []:
-                order.items.append(DbOrderItem(order_id=oid, sku=line.ItemCode, quantity=line.Quantity))
-            db.add(order)
-            created += 1
-            continue
-
-        # Atualiza snapshot SAP
-        existing.sap_doc_entry = o.DocEntry
-        existing.sap_doc_num = o.DocNum
-        existing.sap_doc_status = o.DocStatus
-        existing.sap_update_date = o.UpdateDate
-        existing.sap_update_time = o.UpdateTime
-        if not existing.external_order_id:
-            existing.external_order_id = external_id
-
-        # Atualiza itens apenas antes de iniciar separação
-        if existing.status == "A_SEPARAR":
-            existing.customer_id = o.CardCode
-            existing.items.clear()
-            for line in o.DocumentLines or []:
-                existing.items.append(DbOrderItem(order_id=existing.order_id, sku=line.ItemCode, quantity=line.Quantity))
-            updated += 1
-
-    db.commit()
+    started = time.perf_counter()
+    chunks = sync_orders_batched(db, req.orders, chunk_size=chunkSize, correlation_id=correlation_id)
+    created = sum(c.created for c in chunks)
+    updated = sum(c.updated for c in chunks)
+    observe_bulk("sap_orders", created, updated, time.perf_counter() - started)
+    skipped = sum(c.skipped for c in chunks)
+    failed = sum(c.received for c in chunks if c.error)
 
     log.info(
         "Sync SAP concluído.",
         extra={"correlationId": correlation_id, "sapDocEntry": None},
     )
-    return SapOrdersSyncResponse(upserted=created + updated, created=created, updated=updated)
+    return SapOrdersSyncResponse(
+        upserted=created + updated, created=created, updated=updated, skipped=skipped, failed=failed, chunks=chunks
+    )
+
+
+@app.post("/internal/projections/orders:verify")
+def verify_projections(
+    internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+    repair: bool = False,
+    partitions: int | None = None,
+    chunkSize: int = PROJECTION_CHECK_CHUNK,
+):
+    """
+    Confere `status`/`version` de todos os pedidos contra o replay de `order_events` (com o
+    arquivo frio); `repair=true` corrige. Em bases grandes prefira `python -m app.projection`.
+    """
+    if internal_secret != INTERNAL_SHARED_SECRET:
+        raise HTTPException(status_code=403, detail="forbidden")
+    return verify_order_projections(repair=repair, partitions=partitions, chunk_size=chunkSize)
 
+
+@app.get("/v1/outbox/stats")
+@db_route
+def get_outbox_stats(
+    db: Session = Depends(get_session),
+    internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+):
+    """Mensagens da outbox SAP por status e idade da mais antiga ainda aberta."""
+    if internal_secret != INTERNAL_SHARED_SECRET:
+        raise HTTPException(status_code=403, detail="forbidden")
+    return outbox_stats(db)
+
+
+@app.post("/internal/outbox:retry-failed")
+@db_route
+def retry_failed_outbox(
+    db: Session = Depends(get_session),
+    internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+):
+    """Reprocessamento: mensagens FAILED voltam para a fila com as tentativas zeradas."""
+    if internal_secret != INTERNAL_SHARED_SECRET:
+        raise HTTPException(status_code=403, detail="forbidden")
+    requeued = requeue_failed(db)
+    if requeued:
+        outbox_dispatcher.notify()
+    return {"requeued": requeued}
+
+
+@app.post("/internal/sap/orders/ndjson")
+async def sync_sap_orders_ndjson(
+    request: Request,
+    runner: SessionRunner = Depends(get_session_runner),
+    internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+):
+    """Sync SAP em NDJSON (um `SapOrder` por linha); cada lote lido vira um chunk do sync."""
+    if internal_secret != INTERNAL_SHARED_SECRET:
+        raise HTTPException(status_code=403, detail="forbidden")
+    require_ndjson(request)
+
+    correlation_id = request.state.correlation_id
+    chunks: list[SapOrdersSyncChunkResult] = []
+    started = time.perf_counter()
+
+    def write(db: Session, batch: list[SapOrder]) -> None:
+        for c in sync_orders_batched(db, batch, chunk_size=len(batch), correlation_id=correlation_id):
+            chunks.append(c.model_copy(update={"index": len(chunks)}))
+
+    ingest = await ingest_ndjson(request, SapOrder, write, batch_size=SAP_SYNC_CHUNK_SIZE, run=runner.run)
+    created = sum(c.created for c in chunks)
+    updated = sum(c.updated for c in chunks)
+    observe_bulk("sap_orders", created, updated, time.perf_counter() - started)
+
+    log.info("Sync SAP concluído (ndjson).", extra={"correlationId": correlation_id, "sapDocEntry": None})
+    out = SapOrdersSyncResponse(
+        upserted=created + updated,
+        created=created,
+        updated=updated,
+        skipped=sum(c.skipped for c in chunks),
+        failed=sum(c.received for c in chunks if c.error),
+        chunks=chunks,
+    )
+    return {**out.model_dump(), "received": ingest.received, "invalid": ingest.invalid, "errors": ingest.errors}
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+
+# Com vários workers uvicorn, aponte PROMETHEUS_MULTIPROC_DIR para um diretório vazio por
+# container (limpo a cada start): cada processo grava suas séries em arquivos mmap e o
+# /metrics de qualquer worker agrega todos.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BULK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "wms_core_http_request_duration_seconds",
+    "Duração das requisições HTTP por rota (template).",
+    ("method", "route", "status"),
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "wms_core_http_requests_in_flight",
+    "Requisições HTTP em andamento.",
+    multiprocess_mode="livesum",
+)
+ORDER_TRANSITIONS = Counter(
+    "wms_core_order_transitions_total",
+    "Transições de estado de pedido aplicadas.",
+    ("from_status", "to_status", "event_type"),
+)
+IDEMPOTENCY_HITS = Counter(
+    "wms_core_idempotency_hits_total",
+    "Requisições respondidas por repetição idempotente (sem nova escrita).",
+    ("operation",),
+)
+BULK_ROWS = Counter(
+    "wms_core_bulk_rows_total",
+    "Linhas gravadas pelos endpoints de bulk/sync, por entidade e resultado.",
+    ("entity", "outcome"),
+)
+BULK_DURATION = Histogram(
+    "wms_core_bulk_duration_seconds",
+    "Duração das gravações de bulk/sync por entidade.",
+    ("entity",),
+    buckets=_BULK_BUCKETS,
+)
+OUTBOX_MESSAGES = Counter(
+    "wms_core_outbox_messages_total",
+    "Mensagens da outbox SAP processadas pelo dispatcher, por resultado.",
+    ("outcome",),
+)
+OUTBOX_DELIVERY_SECONDS = Histogram(
+    "wms_core_outbox_delivery_seconds",
+    "Tempo entre a gravação da mensagem na outbox e a confirmação do SAP.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0),
+)
+
+# filhos já rotulados: evita o `labels()` (lock + validação) a cada requisição
+_request_children: dict[tuple[str, str, int], Any] = {}
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    key = (method, route, status)
+    child = _request_children.get(key)
+    if child is None:
+        child = _request_children.setdefault(key, HTTP_REQUEST_DURATION.labels(method, route, str(status)))
+    child.observe(seconds)
+
+
+def observe_transition(from_status: str, to_status: str, event_type: str) -> None:
+    ORDER_TRANSITIONS.labels(from_status, to_status, event_type).inc()
+
+
+def observe_idempotency_hit(operation: str, count: int = 1) -> None:
+    if count:
+        IDEMPOTENCY_HITS.labels(operation).inc(count)
+
+
+def observe_bulk(entity: str, created: int, updated: int, seconds: float) -> None:
+    BULK_ROWS.labels(entity, "created").inc(created)
+    BULK_ROWS.labels(entity, "updated").inc(updated)
+    BULK_DURATION.labels(entity).observe(seconds)
+
+
+def observe_outbox(outcome: str, count: int = 1) -> None:
+    if count:
+        OUTBOX_MESSAGES.labels(outcome).inc(count)
+
+
+def observe_outbox_latency(seconds: float) -> None:
+    OUTBOX_DELIVERY_SECONDS.observe(seconds)
+
+
+def render_metrics() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
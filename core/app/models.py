@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, ForeignKey, Integer, String, DateTime, Numeric, UniqueConstraint
+from sqlalchemy import Boolean, ForeignKey, Index, Integer, String, DateTime, Numeric, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -15,6 +15,8 @@ from .db import Base
 
 class Order(Base):
     __tablename__ = "orders"
+    # ordenação das listagens (updated_at desc) + desempate para paginação por cursor
+    __table_args__ = (Index("ix_orders_updated_at_order_id", "updated_at", "order_id"),)
 
     order_id: Mapped[str] = mapped_column(String(40), primary_key=True)
     external_order_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
@@ -42,19 +44,33 @@ class OrderItem(Base):
     order_id: Mapped[str] = mapped_column(String(40), ForeignKey("orders.order_id", ondelete="CASCADE"), index=True)
     sku: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
     quantity: Mapped[float] = mapped_column(Numeric(18, 6), nullable=False)
+    # depósito da linha no SAP (WarehouseCode); nulo em pedidos criados no WMS
+    warehouse_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
     order: Mapped[Order] = relationship(back_populates="items")
 
 
 class OrderEvent(Base):
     __tablename__ = "order_events"
+    __table_args__ = (
+        # histórico do pedido em ordem (get_history) sem sort; também atende buscas só por order_id
+        Index("ix_order_events_order_id_occurred_at", "order_id", "occurred_at"),
+        # PostgreSQL: partições mensais (app/event_archive.py cria e remove as partições)
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
 
     event_id: Mapped[str] = mapped_column(String(64), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id: Mapped[str] = mapped_column(String(40), ForeignKey("orders.order_id", ondelete="CASCADE"), index=True)
+    order_id: Mapped[str] = mapped_column(String(40), ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
     type: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
     from_status: Mapped[str] = mapped_column(String(32), nullable=False)
     to_status: Mapped[str] = mapped_column(String(32), nullable=False)
-    occurred_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    # na PK porque é a chave de partição (exigência do PostgreSQL); event_id segue único (UUID)
+    occurred_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, index=True)
+    # relógio do servidor na gravação; `occurred_at` vem do cliente e pode ser retroativo, então
+    # o que é incremental ("eventos gravados desde o checkpoint") se guia por esta coluna
+    recorded_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True, default=lambda: datetime.now(timezone.utc)
+    )
 
     actor_kind: Mapped[str] = mapped_column(String(16), nullable=False)
     actor_id: Mapped[str] = mapped_column(String(64), nullable=False)
@@ -65,6 +81,73 @@ class OrderEvent(Base):
     order: Mapped[Order] = relationship(back_populates="events")
 
 
+class OrderStatusCounter(Base):
+    """
+    Contagem de pedidos por status, mantida na mesma transação das escritas de pedido.
+
+    Linhas de detalhe: `(status, customer_id, day)` com `shard = 0` (`day` = dia UTC de criação).
+    Linhas de total: `customer_id = ''` e `day = ''`, espalhadas em `shard` para não serializar
+    todas as transições na mesma linha.
+    """
+
+    __tablename__ = "order_status_counters"
+    __table_args__ = (Index("ix_order_status_counters_day", "day"),)
+
+    status: Mapped[str] = mapped_column(String(32), primary_key=True)
+    customer_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    day: Mapped[str] = mapped_column(String(10), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class OrderEventArchive(Base):
+    """Pedidos cujos eventos foram movidos de `order_events` para o arquivo frio (`path`)."""
+
+    __tablename__ = "order_event_archive"
+
+    order_id: Mapped[str] = mapped_column(String(40), ForeignKey("orders.order_id", ondelete="CASCADE"), primary_key=True)
+    path: Mapped[str] = mapped_column(String(512), nullable=False, index=True)
+    events: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+# ========================================
+# Analytics (rollups de tempo por estado)
+# ========================================
+
+class OrderDwellHistogram(Base):
+    """Histograma (buckets log) do tempo de permanência por estado, na hora UTC da saída."""
+
+    __tablename__ = "order_dwell_histograms"
+
+    hour: Mapped[str] = mapped_column(String(13), primary_key=True)  # YYYY-MM-DDTHH
+    state: Mapped[str] = mapped_column(String(32), primary_key=True)
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class OrderStateHourly(Base):
+    """Saídas de cada estado por hora UTC: vazão, soma de permanência e estouros de SLA."""
+
+    __tablename__ = "order_state_hourly"
+
+    hour: Mapped[str] = mapped_column(String(13), primary_key=True)
+    state: Mapped[str] = mapped_column(String(32), primary_key=True)
+    exits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    dwell_seconds: Mapped[float] = mapped_column(Numeric(18, 3), nullable=False, default=0)
+    sla_breaches: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class AnalyticsCheckpoint(Base):
+    """Até onde (`recorded_at`) cada rollup já processou `order_events`."""
+
+    __tablename__ = "analytics_checkpoints"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
 # ========================================
 # Produtos (catálogo)
 # ========================================
@@ -93,7 +176,10 @@ class Product(Base):
 
 class InventoryStock(Base):
     __tablename__ = "inventory_stock"
-    __table_args__ = (UniqueConstraint("sku", "warehouse_code", name="uq_stock_sku_wh"),)
+    __table_args__ = (
+        UniqueConstraint("sku", "warehouse_code", name="uq_stock_sku_wh"),
+        Index("ix_stock_sku_id", "sku", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     sku: Mapped[str] = mapped_column(String(128), nullable=False, index=True)
@@ -112,6 +198,7 @@ class InventoryStock(Base):
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (Index("ix_customers_card_name_id", "card_name", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     card_code: Mapped[str] = mapped_column(String(128), nullable=False, unique=True, index=True)
@@ -128,13 +215,50 @@ class Customer(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
 
 
+# ========================================
+# Outbox de integração (write-back SAP)
+# ========================================
+
+class IntegrationOutbox(Base):
+    """
+    Mensagens para sistemas externos, gravadas na mesma transação do evento que as origina
+    (`app/outbox.py`). `status`: PENDING → PROCESSING (lease até `next_retry_at`) → SENT, ou
+    FAILED (erro permanente / tentativas esgotadas), ou SUPERSEDED (uma mensagem mais nova do
+    mesmo agregado tornou esta obsoleta).
+    """
+
+    __tablename__ = "integration_outbox"
+    __table_args__ = (
+        Index("ix_outbox_status_next_retry", "status", "next_retry_at"),
+        Index("ix_outbox_aggregate", "aggregate_id", "status"),
+    )
+
+    outbox_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    aggregate_type: Mapped[str] = mapped_column(String(32), nullable=False)
+    aggregate_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    event_type: Mapped[str] = mapped_column(String(64), nullable=False)
+    # dedup: a mesma origem (ex.: event_id) nunca gera duas mensagens
+    dedup_key: Mapped[str] = mapped_column(String(128), nullable=False, unique=True)
+    payload: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_retry_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    lease_token: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
 # ========================================
 # Idempotência
 # ========================================
 
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
-    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idem_scope_key"),)
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_idem_scope_key"),
+        Index("ix_idem_created_at", "created_at"),  # sweeper de retenção
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     scope: Mapped[str] = mapped_column(String(32), nullable=False)
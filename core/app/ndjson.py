@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+NDJSON_BATCH_SIZE = int(os.getenv("NDJSON_BATCH_SIZE", "1000"))
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", str(1024 * 1024)))
+# quantos erros por linha voltam na resposta (o total vai em `invalid`)
+NDJSON_MAX_REPORTED_ERRORS = 100
+
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class NdjsonIngestResult:
+    received: int = 0
+    invalid: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def line_error(self, line: int, error: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < NDJSON_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+
+def require_ndjson(request: Request) -> None:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_MEDIA_TYPES:
+        exc = HTTPException(status_code=415, detail="Content-Type deve ser application/x-ndjson.")
+        setattr(exc, "error_code", "WMS-NDJSON-001")
+        raise exc
+
+
+async def iter_lines(request: Request, max_line_bytes: int = NDJSON_MAX_LINE_BYTES) -> AsyncIterator[tuple[int, bytes | None]]:
+    """
+    Lê o corpo da requisição em streaming e devolve `(número da linha, conteúdo)`.
+    Linhas maiores que `max_line_bytes` vêm como `None` (sem acumular o excesso em memória).
+    """
+    buf = bytearray()
+    overflow = False
+    line_no = 0
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            nl = chunk.find(b"\n", start)
+            if nl < 0:
+                if not overflow:
+                    buf += chunk[start:]
+                    if len(buf) > max_line_bytes:
+                        overflow = True
+                        buf.clear()
+                break
+            if not overflow:
+                buf += chunk[start:nl]
+            line_no += 1
+            yield line_no, None if overflow or len(buf) > max_line_bytes else bytes(buf)
+            buf.clear()
+            overflow = False
+            start = nl + 1
+    if buf or overflow:
+        yield line_no + 1, None if overflow else bytes(buf)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    err = exc.errors()[0]
+    loc = ".".join(str(p) for p in err.get("loc", ()))
+    return f"{loc}: {err['msg']}" if loc else err["msg"]
+
+
+async def ingest_ndjson(
+    request: Request,
+    model: type[M],
+    write_batch: Callable[..., None],
+    batch_size: int = NDJSON_BATCH_SIZE,
+    run: Callable[..., Awaitable[Any]] = run_in_threadpool,
+) -> NdjsonIngestResult:
+    """
+    Valida cada linha contra `model` e entrega lotes de até `batch_size` itens a
+    `write_batch` (síncrono), via `await run(write_batch, lote)`: por padrão no threadpool;
+    as rotas passam `SessionRunner.run`, que injeta a sessão como primeiro argumento.
+    Linhas inválidas são reportadas e não interrompem o restante do payload.
+    """
+    result = NdjsonIngestResult()
+    batch: list[M] = []
+
+    async for line_no, raw in iter_lines(request):
+        if raw is None:
+            result.received += 1
+            result.line_error(line_no, f"linha excede {NDJSON_MAX_LINE_BYTES} bytes")
+            continue
+        if not raw.strip():
+            continue
+        result.received += 1
+        try:
+            batch.append(model.model_validate_json(raw))
+        except ValidationError as exc:
+            result.line_error(line_no, _validation_message(exc))
+            continue
+        if len(batch) >= batch_size:
+            await run(write_batch, batch)
+            batch = []
+
+    if batch:
+        await run(write_batch, batch)
+    return result
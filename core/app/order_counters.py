@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Any
+
+from sqlalchemy import Engine, delete, func, select, text
+from sqlalchemy.orm import Session
+
+from .bulk import upsert_increment
+from .db import advisory_lock_key
+from .models import Order as DbOrder, OrderStatusCounter
+from .state_machine import order_sm
+
+
+# linhas de total por status espalhadas em N shards: transições concorrentes não disputam a mesma linha
+ORDER_COUNTER_SHARDS = max(1, int(os.getenv("ORDER_COUNTER_SHARDS", "8")))
+
+TOTAL = ""  # customer_id/day das linhas de total
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def day_key(dt: datetime) -> str:
+    """Dia UTC (`YYYY-MM-DD`); datetimes sem fuso (SQLite) já estão em UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.date().isoformat()
+
+
+class CounterDelta:
+    """
+    Variações de contagem de uma transação. `apply` grava tudo com `upsert_increment`
+    (`count = count + delta`, em ordem de chave).
+    """
+
+    def __init__(self) -> None:
+        self._delta: defaultdict[tuple[str, str, str], int] = defaultdict(int)
+
+    def add(self, status: str, customer_id: str, created_at: datetime, n: int = 1) -> CounterDelta:
+        self._delta[(status, customer_id, day_key(created_at))] += n
+        self._delta[(status, TOTAL, TOTAL)] += n
+        return self
+
+    def move(self, from_status: str, to_status: str, customer_id: str, created_at: datetime, n: int = 1) -> CounterDelta:
+        if from_status != to_status:
+            self.add(from_status, customer_id, created_at, -n)
+            self.add(to_status, customer_id, created_at, n)
+        return self
+
+    def apply(self, db: Session) -> None:
+        shard = random.randrange(ORDER_COUNTER_SHARDS)
+        upsert_increment(db, OrderStatusCounter, [
+            {
+                "status": status, "customer_id": customer_id, "day": day,
+                "shard": shard if customer_id == TOTAL and day == TOTAL else 0, "count": n,
+            }
+            for (status, customer_id, day), n in self._delta.items()
+            if n
+        ], ("status", "customer_id", "day", "shard"))
+        self._delta.clear()
+
+
+# ============================================================
+# Backfill
+# ============================================================
+
+def _lock_rebuild(db: Session) -> None:
+    """
+    No PostgreSQL, um recálculo por vez até o commit. O `SHARE` em `orders` não exclui outro
+    recálculo (workers no startup, reparo de projeção): o segundo somaria sobre as linhas do
+    primeiro no `ON CONFLICT` incremental.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": advisory_lock_key("order-status-counters")})
+
+
+def _has_counters(db: Session) -> bool:
+    return db.execute(select(OrderStatusCounter.status).limit(1)).first() is not None
+
+
+def rebuild_order_counters(db: Session) -> int:
+    """
+    Recalcula os contadores a partir de `orders` (sem commit; o chamador confirma).
+    No PostgreSQL bloqueia escritas em `orders` e outros recálculos até o commit para não
+    perder pedidos gravados no meio nem contar duas vezes. Retorna quantos pedidos foram contados.
+    """
+    _lock_rebuild(db)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE orders IN SHARE MODE"))
+    delta = CounterDelta()
+    counted = 0
+    rows = db.execute(
+        select(DbOrder.status, DbOrder.customer_id, DbOrder.created_at).execution_options(yield_per=5000)
+    )
+    for status, customer_id, created_at in rows:
+        delta.add(status, customer_id, created_at)
+        counted += 1
+    db.execute(delete(OrderStatusCounter))
+    delta.apply(db)
+    return counted
+
+
+def ensure_order_counters(engine: Engine) -> None:
+    """Startup: preenche os contadores de um banco que já tinha pedidos antes da tabela existir."""
+    with Session(engine) as db:
+        if _has_counters(db):
+            return
+        if db.execute(select(DbOrder.order_id).limit(1)).first() is None:
+            return
+        _lock_rebuild(db)
+        # outro worker pode ter feito o backfill enquanto este esperava o lock
+        if _has_counters(db):
+            return
+        counted = rebuild_order_counters(db)
+        db.commit()
+    log.info("Contadores de status de pedido recalculados (%d pedidos).", counted)
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _zero() -> dict[str, int]:
+    return {s: 0 for s in order_sm.states}
+
+
+def order_summary(
+    db: Session,
+    group_by: list[str] | None = None,
+    customer_id: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> dict[str, Any]:
+    """
+    Pedidos por status, lidos dos contadores (custo proporcional ao número de células, não
+    de pedidos). Sem filtros usa as linhas de total; com filtro ou `group_by`
+    (`customer`/`day`), as de detalhe.
+    """
+    c = OrderStatusCounter
+    group_by = group_by or []
+    dims = [{"customer": c.customer_id, "day": c.day}[g] for g in group_by]
+    q = select(c.status, *dims, func.sum(c.count))
+    if not (dims or customer_id or date_from or date_to):
+        q = q.where(c.customer_id == TOTAL, c.day == TOTAL)
+    else:
+        q = q.where(c.day != TOTAL)
+        if customer_id:
+            q = q.where(c.customer_id == customer_id)
+        if date_from:
+            q = q.where(c.day >= date_from.isoformat())
+        if date_to:
+            q = q.where(c.day <= date_to.isoformat())
+    q = q.group_by(c.status, *dims)
+
+    by_status = _zero()
+    groups: dict[tuple, dict[str, int]] = {}
+    for status, *keys, n in db.execute(q):
+        n = int(n or 0)
+        by_status[status] = by_status.get(status, 0) + n
+        if dims and n:
+            counts = groups.setdefault(tuple(keys), _zero())
+            counts[status] = counts.get(status, 0) + n
+
+    out: dict[str, Any] = {"total": sum(by_status.values()), "byStatus": by_status}
+    if dims:
+        names = {"customer": "customerId", "day": "day"}
+        out["groups"] = [
+            {**{names[g]: k for g, k in zip(group_by, keys)}, "total": sum(counts.values()), "byStatus": counts}
+            for keys, counts in sorted(groups.items())
+        ]
+    return out
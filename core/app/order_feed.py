@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .db import DATABASE_URL, engine
+
+
+ORDER_FEED_BACKEND = os.getenv("ORDER_FEED_BACKEND", "memory").lower()  # memory | postgres
+ORDER_FEED_BUFFER = int(os.getenv("ORDER_FEED_BUFFER", "1000"))
+ORDER_FEED_QUEUE_SIZE = int(os.getenv("ORDER_FEED_QUEUE_SIZE", "1000"))
+ORDER_FEED_HEARTBEAT_SECONDS = float(os.getenv("ORDER_FEED_HEARTBEAT_SECONDS", "15"))
+ORDER_FEED_CHANNEL = "wms_order_changes"
+
+ORDER_CREATED = "order.created"
+ORDER_STATUS_CHANGED = "order.status_changed"
+ORDER_SAP_UPDATED = "order.sap_updated"
+# enviado quando o Last-Event-ID já saiu do buffer (ou o cliente ficou lento): refaça a listagem
+FEED_RESET = "feed.reset"
+
+# um NOTIFY por mensagem, numa única ida ao banco
+_NOTIFY = text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload")
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+class _Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class OrderFeed:
+    """
+    Pub/sub em processo das mudanças de pedido, com buffer circular para retomada.
+
+    Dois passos, como `CounterDelta`: `stage(db, mensagens)` na transação do escritor, antes do
+    commit, e `publish_many(mensagens)` depois dele (de qualquer thread; handlers síncronos
+    rodam no threadpool). Com `ORDER_FEED_BACKEND=postgres`, o `stage` grava um `pg_notify` na
+    própria transação e cada worker entrega o que recebe via `LISTEN`, então todos os workers
+    uvicorn veem todas as mudanças; no backend em memória, só o `publish_many` entrega.
+    """
+
+    def __init__(self, backend: str, buffer_size: int, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._buffer: deque[dict[str, Any]] = deque(maxlen=buffer_size)
+        self._subscribers: set[_Subscriber] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._listener: asyncio.Task | None = None
+        self._origin = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # ---- ciclo de vida ----
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self.backend == "postgres" and engine.dialect.name == "postgresql":
+            self._listener = asyncio.create_task(self._listen_postgres())
+
+    async def stop(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+
+    # ---- publicação ----
+    def message(self, kind: str, order_id: str, **fields: Any) -> dict[str, Any]:
+        return {
+            "id": f"{int(time.time() * 1000)}-{self._origin}-{next(self._seq)}",
+            "type": kind,
+            "orderId": order_id,
+            "at": datetime.now(timezone.utc).isoformat(),
+            **fields,
+        }
+
+    def stage(self, db: Session, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Antes do commit, na sessão do escritor. No backend postgres, o NOTIFY vai na própria
+        transação: o Postgres só entrega no commit (rollback ou retry do CAS descartam), sem
+        conexão extra do pool e, no modo assíncrono, sem I/O síncrono no event loop.
+        Devolve as mensagens para o `publish_many` depois do commit.
+        """
+        if messages and self._listener is not None:
+            db.execute(_NOTIFY, {"channel": ORDER_FEED_CHANNEL, "payloads": [json.dumps(m) for m in messages]})
+        return messages
+
+    def publish_many(self, messages: list[dict[str, Any]]) -> None:
+        """Depois do commit. No backend postgres não faz nada: a entrega vem do `LISTEN`."""
+        if not messages or self._listener is not None:
+            return
+        for message in messages:
+            self._dispatch_threadsafe(message)
+
+    def _dispatch_threadsafe(self, message: dict[str, Any]) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(message)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message: dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append(message)
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # assinante lento: avisa com reset e para de enfileirar até ele drenar
+                sub.overflowed = True
+
+    async def _listen_postgres(self) -> None:
+        import psycopg
+        from sqlalchemy.engine import make_url
+
+        dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        delay = 1.0
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {ORDER_FEED_CHANNEL}")
+                    delay = 1.0
+                    async for notify in conn.notifies():
+                        self._dispatch(json.loads(notify.payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                log.exception("LISTEN do feed de pedidos caiu; reconectando.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    # ---- assinatura ----
+    def _replay(self, last_event_id: str | None) -> list[dict[str, Any]] | None:
+        """Mensagens após `last_event_id`; `None` se o id não está mais no buffer."""
+        if not last_event_id:
+            return []
+        with self._lock:
+            buffered = list(self._buffer)
+        for i, message in enumerate(buffered):
+            if message["id"] == last_event_id:
+                return buffered[i + 1 :]
+        return None
+
+    async def subscribe(self, last_event_id: str | None = None) -> AsyncIterator[dict[str, Any] | None]:
+        """
+        Itera as mensagens (retomando após `last_event_id`). Rende `None` a cada
+        `ORDER_FEED_HEARTBEAT_SECONDS` sem mensagens, para o transporte mandar um keep-alive.
+        """
+        sub = _Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        try:
+            replay = self._replay(last_event_id)
+            if replay is None:
+                yield {"id": None, "type": FEED_RESET}
+            else:
+                for message in replay:
+                    yield message
+            while True:
+                if sub.overflowed and sub.queue.empty():
+                    sub.overflowed = False
+                    yield {"id": None, "type": FEED_RESET}
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=ORDER_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(sub)
+
+
+order_feed = OrderFeed(ORDER_FEED_BACKEND, ORDER_FEED_BUFFER, ORDER_FEED_QUEUE_SIZE)
+
+
+def sse_format(message: dict[str, Any] | None) -> str:
+    if message is None:
+        return ": keep-alive\n\n"
+    head = f"id: {message['id']}\n" if message.get("id") else ""
+    return f"{head}event: {message['type']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
@@ -0,0 +1,583 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, advisory_lock_key, engine
+from .metrics import observe_outbox, observe_outbox_latency
+from .models import IntegrationOutbox, OrderEvent as DbOrderEvent
+
+try:  # cliente HTTP assíncrono; só o dispatcher precisa dele
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+# mesmas variáveis do worker Node (Service Layer do SAP B1)
+SAP_BASE_URL = os.getenv("SAP_BASE_URL", "").rstrip("/")
+SAP_COMPANY_DB = os.getenv("SAP_COMPANY_DB", "")
+SAP_USERNAME = os.getenv("SAP_USERNAME", "")
+SAP_PASSWORD = os.getenv("SAP_PASSWORD", "")
+SAP_VERIFY_TLS = os.getenv("SAP_VERIFY_TLS", "true").lower() == "true"
+
+# grava mensagens na outbox junto com cada evento de pedido que tem DocEntry; por padrão só
+# com SAP configurado (sem dispatcher, nada drena nem limpa a tabela)
+SAP_OUTBOX_ENABLED = os.getenv("SAP_OUTBOX_ENABLED", "true" if SAP_BASE_URL else "false").lower() == "true"
+# status que vão para o SAP (vazio = todos)
+SAP_OUTBOX_STATUSES = frozenset(s.strip() for s in os.getenv("SAP_OUTBOX_STATUSES", "").split(",") if s.strip())
+# dispatcher dentro do processo da API; `false` quando ele roda à parte (`python -m app.outbox`)
+SAP_OUTBOX_DISPATCH_IN_API = os.getenv("SAP_OUTBOX_DISPATCH_IN_API", "true").lower() == "true"
+SAP_OUTBOX_BATCH = int(os.getenv("SAP_OUTBOX_BATCH", "100"))
+# PATCHes simultâneos no Service Layer
+SAP_OUTBOX_CONCURRENCY = int(os.getenv("SAP_OUTBOX_CONCURRENCY", "8"))
+# espera máxima entre drenagens sem aviso de commit (o aviso acorda o dispatcher na hora)
+SAP_OUTBOX_POLL_SECONDS = float(os.getenv("SAP_OUTBOX_POLL_SECONDS", "2"))
+# mensagem em PROCESSING volta a ficar disponível depois disso (dispatcher que caiu no meio)
+SAP_OUTBOX_LEASE_SECONDS = float(os.getenv("SAP_OUTBOX_LEASE_SECONDS", "60"))
+SAP_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SAP_OUTBOX_MAX_ATTEMPTS", "12"))
+SAP_OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("SAP_OUTBOX_BACKOFF_BASE_SECONDS", "1"))
+SAP_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("SAP_OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+SAP_OUTBOX_TIMEOUT_SECONDS = float(os.getenv("SAP_OUTBOX_TIMEOUT_SECONDS", "10"))
+# SENT/SUPERSEDED mais velhas que isso são apagadas
+SAP_OUTBOX_RETENTION_HOURS = float(os.getenv("SAP_OUTBOX_RETENTION_HOURS", "72"))
+
+PENDING, PROCESSING, SENT, FAILED, SUPERSEDED = "PENDING", "PROCESSING", "SENT", "FAILED", "SUPERSEDED"
+SAP_ORDER_STATUS = "SAP_ORDER_STATUS"
+
+_SWEEP_INTERVAL_SECONDS = 600
+_SWEEP_BATCH = 5000
+_RETRYABLE = {408, 409, 425, 429, 500, 502, 503, 504}
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ============================================================
+# Escrita (na transação do evento)
+# ============================================================
+
+def enqueue_order_events(db: Session, events: Iterable[tuple[DbOrderEvent, int | None]]) -> int:
+    """
+    Grava, na transação corrente, uma mensagem de status para o SAP por evento de pedido que
+    tenha `DocEntry` (pedidos criados só no WMS não existem no SAP). O chamador confirma e,
+    depois do commit, chama `outbox_dispatcher.notify()`. Retorna quantas foram gravadas.
+    """
+    if not SAP_OUTBOX_ENABLED:
+        return 0
+    now = _now()
+    rows = [
+        {
+            "aggregate_type": "ORDER",
+            "aggregate_id": ev.order_id,
+            "event_type": SAP_ORDER_STATUS,
+            "dedup_key": f"order-event:{ev.event_id}",
+            "payload": json.dumps({
+                "docEntry": doc_entry,
+                "orderId": ev.order_id,
+                "eventId": ev.event_id,
+                "eventType": ev.type,
+                "status": ev.to_status,
+                "occurredAt": ev.occurred_at.isoformat(),
+                "correlationId": ev.correlation_id,
+            }, separators=(",", ":")),
+            "status": PENDING,
+            "attempts": 0,
+            "next_retry_at": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for ev, doc_entry in events
+        if doc_entry is not None and (not SAP_OUTBOX_STATUSES or ev.to_status in SAP_OUTBOX_STATUSES)
+    ]
+    if rows:
+        db.execute(insert(IntegrationOutbox), rows)
+    return len(rows)
+
+
+# ============================================================
+# Claim / resultado
+# ============================================================
+
+@dataclass
+class Claimed:
+    outbox_id: int
+    payload: dict[str, Any]
+    attempts: int
+    created_at: datetime
+    lease_token: str
+
+
+@dataclass
+class Outcome:
+    outbox_id: int
+    result: str  # sent | retry | failed
+    error: str | None = None
+    retry_after: float | None = None
+
+
+def claim_batch(db: Session, limit: int = SAP_OUTBOX_BATCH, now: datetime | None = None) -> list[Claimed]:
+    """
+    Reserva até `limit` mensagens vencidas (PENDING, ou PROCESSING com lease expirado).
+
+    - **Dedup por pedido:** só a mensagem mais nova de cada pedido é enviada (o SAP só precisa
+      do status atual); as mais velhas ainda abertas viram SUPERSEDED. Se a mais nova ainda está
+      em backoff, o pedido espera por ela.
+    - **Lease:** o `UPDATE` marca as linhas com um token só deste claim e empurra
+      `next_retry_at` para o fim do lease. Dois dispatchers nunca levam a mesma linha; no
+      PostgreSQL o `SKIP LOCKED` ainda evita que um espere pelo outro.
+    """
+    now = now or _now()
+    open_ = (PENDING, PROCESSING)
+    due = db.execute(
+        select(IntegrationOutbox.outbox_id, IntegrationOutbox.aggregate_id)
+        .where(IntegrationOutbox.status.in_(open_), IntegrationOutbox.next_retry_at <= now)
+        .order_by(IntegrationOutbox.outbox_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not due:
+        db.rollback()
+        return []
+
+    newest = dict(db.execute(
+        select(IntegrationOutbox.aggregate_id, func.max(IntegrationOutbox.outbox_id))
+        .where(IntegrationOutbox.aggregate_id.in_({agg for _, agg in due}), IntegrationOutbox.status.in_(open_))
+        .group_by(IntegrationOutbox.aggregate_id)
+    ).all())
+    stale = [oid for oid, agg in due if oid < newest[agg]]
+    wanted = [oid for oid, agg in due if oid == newest[agg]]
+    if stale:
+        db.execute(
+            update(IntegrationOutbox)
+            .where(IntegrationOutbox.outbox_id.in_(stale), IntegrationOutbox.status.in_(open_))
+            .values(status=SUPERSEDED, lease_token=None, updated_at=now)
+        )
+        observe_outbox("superseded", len(stale))
+
+    token = uuid.uuid4().hex
+    if wanted:
+        db.execute(
+            update(IntegrationOutbox)
+            .where(
+                IntegrationOutbox.outbox_id.in_(wanted),
+                IntegrationOutbox.status.in_(open_),
+                IntegrationOutbox.next_retry_at <= now,
+            )
+            .values(
+                status=PROCESSING,
+                lease_token=token,
+                attempts=IntegrationOutbox.attempts + 1,
+                next_retry_at=now + timedelta(seconds=SAP_OUTBOX_LEASE_SECONDS),
+                updated_at=now,
+            )
+        )
+    rows = db.execute(
+        select(
+            IntegrationOutbox.outbox_id, IntegrationOutbox.payload,
+            IntegrationOutbox.attempts, IntegrationOutbox.created_at,
+        ).where(IntegrationOutbox.lease_token == token)
+    ).all()
+    db.commit()
+    return [Claimed(r.outbox_id, json.loads(r.payload), r.attempts, r.created_at, token) for r in rows]
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponencial com jitter: base·2^(n-1), limitado ao teto, sorteado entre metade e o total."""
+    delay = min(SAP_OUTBOX_BACKOFF_MAX_SECONDS, SAP_OUTBOX_BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def record_outcomes(db: Session, claimed: list[Claimed], outcomes: list[Outcome], now: datetime | None = None) -> None:
+    """
+    Grava o resultado do envio (uma transação por lote). Só altera linhas que ainda estão com o
+    token do claim: se o lease venceu e outro dispatcher pegou a mensagem, o resultado dele vale.
+    """
+    now = now or _now()
+    by_id = {c.outbox_id: c for c in claimed}
+    sent_by_token: defaultdict[str, list[int]] = defaultdict(list)
+    for o in outcomes:
+        if o.result == "sent":
+            sent_by_token[by_id[o.outbox_id].lease_token].append(o.outbox_id)
+    sent = [oid for ids in sent_by_token.values() for oid in ids]
+    for token, ids in sent_by_token.items():
+        db.execute(
+            update(IntegrationOutbox)
+            .where(
+                IntegrationOutbox.outbox_id.in_(ids),
+                IntegrationOutbox.status == PROCESSING,
+                IntegrationOutbox.lease_token == token,
+            )
+            .values(status=SENT, lease_token=None, last_error=None, updated_at=now)
+        )
+    for o in outcomes:
+        if o.result == "sent":
+            continue
+        attempts = by_id[o.outbox_id].attempts
+        failed = o.result == "failed" or attempts >= SAP_OUTBOX_MAX_ATTEMPTS
+        delay = max(backoff_seconds(attempts), o.retry_after or 0.0)
+        db.execute(
+            update(IntegrationOutbox)
+            .where(
+                IntegrationOutbox.outbox_id == o.outbox_id,
+                IntegrationOutbox.status == PROCESSING,
+                IntegrationOutbox.lease_token == by_id[o.outbox_id].lease_token,
+            )
+            .values(
+                status=FAILED if failed else PENDING,
+                lease_token=None,
+                last_error=(o.error or "")[:512],
+                next_retry_at=now if failed else now + timedelta(seconds=delay),
+                updated_at=now,
+            )
+        )
+    db.commit()
+    observe_outbox("sent", len(sent))
+    retried = sum(1 for o in outcomes if o.result == "retry" and by_id[o.outbox_id].attempts < SAP_OUTBOX_MAX_ATTEMPTS)
+    observe_outbox("retry", retried)
+    observe_outbox("failed", len(outcomes) - len(sent) - retried)
+    for o in outcomes:
+        if o.result == "sent":
+            c = by_id[o.outbox_id]
+            created = c.created_at if c.created_at.tzinfo else c.created_at.replace(tzinfo=timezone.utc)
+            observe_outbox_latency((now - created).total_seconds())
+
+
+def sweep_outbox(db: Session, now: datetime | None = None) -> int:
+    """Apaga, em lotes, mensagens SENT/SUPERSEDED mais velhas que a retenção."""
+    cutoff = (now or _now()) - timedelta(hours=SAP_OUTBOX_RETENTION_HOURS)
+    removed = 0
+    while True:
+        ids = db.execute(
+            select(IntegrationOutbox.outbox_id)
+            .where(IntegrationOutbox.status.in_((SENT, SUPERSEDED)), IntegrationOutbox.updated_at < cutoff)
+            .limit(_SWEEP_BATCH)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(delete(IntegrationOutbox).where(IntegrationOutbox.outbox_id.in_(ids)))
+        db.commit()
+        removed += len(ids)
+        if len(ids) < _SWEEP_BATCH:
+            break
+    return removed
+
+
+def requeue_failed(db: Session) -> int:
+    """Reprocessamento manual: FAILED volta para PENDING com as tentativas zeradas."""
+    now = _now()
+    res = db.execute(
+        update(IntegrationOutbox)
+        .where(IntegrationOutbox.status == FAILED)
+        .values(status=PENDING, attempts=0, next_retry_at=now, updated_at=now)
+    )
+    db.commit()
+    return res.rowcount or 0
+
+
+def outbox_stats(db: Session) -> dict[str, Any]:
+    counts = {s: 0 for s in (PENDING, PROCESSING, SENT, FAILED, SUPERSEDED)}
+    for status, n in db.execute(
+        select(IntegrationOutbox.status, func.count()).group_by(IntegrationOutbox.status)
+    ):
+        counts[status] = n
+    oldest = db.execute(
+        select(func.min(IntegrationOutbox.created_at)).where(IntegrationOutbox.status.in_((PENDING, PROCESSING)))
+    ).scalar()
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    return {
+        "counts": counts,
+        "oldestOpenAgeSeconds": round((_now() - oldest).total_seconds(), 3) if oldest else None,
+        "dispatcher": outbox_dispatcher.running,
+        "leader": outbox_dispatcher.leader,
+    }
+
+
+# ============================================================
+# Envio (Service Layer)
+# ============================================================
+
+def sap_status_patch(payload: dict[str, Any]) -> dict[str, Any]:
+    """Corpo do PATCH: UDFs de status do WMS no pedido de venda (ver `docs/INTEGRATION_GUIDE.md`)."""
+    return {
+        "U_WMS_STATUS": payload["status"],
+        "U_WMS_ORDERID": payload["orderId"],
+        "U_WMS_LAST_EVENT": payload["eventType"],
+        "U_WMS_LAST_TS": payload["occurredAt"],
+        "U_WMS_CORR_ID": payload.get("correlationId"),
+    }
+
+
+class SapWriter:
+    """Sessão do Service Layer (cookie B1SESSION) compartilhada pelos envios concorrentes."""
+
+    def __init__(self, base_url: str = SAP_BASE_URL) -> None:
+        if httpx is None:
+            raise RuntimeError("O dispatcher da outbox SAP precisa do pacote httpx.")
+        self.base_url = base_url
+        # uma conexão keep-alive por envio simultâneo: sem reabrir TCP/TLS a cada PATCH
+        size = max(1, SAP_OUTBOX_CONCURRENCY)
+        self._client = httpx.AsyncClient(
+            timeout=SAP_OUTBOX_TIMEOUT_SECONDS,
+            verify=SAP_VERIFY_TLS,
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+        )
+        self._login_lock = asyncio.Lock()
+        self._session = 0  # geração da sessão: só um envio refaz o login após um 401
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def _login(self, seen: int) -> None:
+        async with self._login_lock:
+            if self._session != seen:
+                return  # outro envio já renovou a sessão
+            res = await self._client.post(f"{self.base_url}/Login", json={
+                "CompanyDB": SAP_COMPANY_DB, "UserName": SAP_USERNAME, "Password": SAP_PASSWORD,
+            })
+            if res.status_code != 200:
+                raise RuntimeError(f"Falha no login do Service Layer (status {res.status_code}).")
+            self._session += 1
+
+    async def send(self, c: Claimed) -> Outcome:
+        payload = c.payload
+        headers = {"X-Correlation-Id": payload.get("correlationId") or payload["eventId"]}
+        try:
+            if self._session == 0:
+                await self._login(0)
+            for _ in range(2):
+                seen = self._session
+                res = await self._client.patch(
+                    f"{self.base_url}/Orders({int(payload['docEntry'])})", json=sap_status_patch(payload), headers=headers
+                )
+                if res.status_code != 401:
+                    break
+                await self._login(seen)
+        except (httpx.HTTPError, RuntimeError) as exc:
+            return Outcome(c.outbox_id, "retry", f"{type(exc).__name__}: {exc}")
+        if res.is_success:
+            return Outcome(c.outbox_id, "sent")
+        error = f"HTTP {res.status_code}: {res.text[:400]}"
+        if res.status_code in _RETRYABLE or res.status_code == 401:
+            retry_after = res.headers.get("Retry-After")
+            return Outcome(
+                c.outbox_id, "retry", error,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        return Outcome(c.outbox_id, "failed", error)
+
+
+# ============================================================
+# Dispatcher
+# ============================================================
+
+class OutboxDispatcher:
+    """
+    Drena a outbox em lotes: claim numa transação, envios concorrentes (até
+    `SAP_OUTBOX_CONCURRENCY`) e resultado numa transação. Um commit com mensagem nova acorda o
+    dispatcher na hora (`notify`, chamável de qualquer thread); sem aviso, confere a cada
+    `SAP_OUTBOX_POLL_SECONDS` (mensagens de outros workers e retentativas vencidas).
+
+    Só um dispatcher drena por vez: cada lote espera todos os PATCHes antes do próximo claim,
+    então a ordem por pedido vale dentro dele, mas não entre dispatchers de workers diferentes.
+    No PostgreSQL, a liderança é um `pg_try_advisory_lock` de sessão numa conexão mantida pelo
+    líder; os demais tentam de novo a cada poll e assumem se ela cair. Nos outros bancos não há
+    eleição (SQLite: um worker só).
+    """
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._writer: SapWriter | None = None
+        self._last_sweep = 0.0
+        self._leader_conn: Connection | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def leader(self) -> bool:
+        """Este processo é o que drena a outbox."""
+        return self.running and (engine.dialect.name != "postgresql" or self._leader_conn is not None)
+
+    async def start(self, base_url: str = SAP_BASE_URL) -> None:
+        if not base_url or not SAP_OUTBOX_ENABLED:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._writer = SapWriter(base_url)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await run_in_threadpool(self._resign)
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
+        self._loop = self._wake = None
+
+    def notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            wake.set()
+        else:
+            loop.call_soon_threadsafe(wake.set)
+
+    def _lead(self) -> bool:
+        """Confirma (ou tenta assumir) a liderança. Síncrono: rodar no threadpool."""
+        if engine.dialect.name != "postgresql":
+            return True
+        if self._leader_conn is not None:
+            try:
+                self._leader_conn.execute(text("SELECT 1"))
+                return True
+            except Exception:  # noqa: BLE001
+                # conexão caiu: o lock foi junto e outro worker pode ter assumido
+                log.warning("Conexão da liderança da outbox caiu; disputando de novo.")
+                self._leader_conn.invalidate()
+                self._leader_conn.close()
+                self._leader_conn = None
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            won = conn.execute(
+                text("SELECT pg_try_advisory_lock(:k)"), {"k": advisory_lock_key("outbox-dispatcher")}
+            ).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not won:
+            conn.close()
+            return False
+        self._leader_conn = conn
+        log.info("Este worker assumiu o dispatcher da outbox SAP.")
+        return True
+
+    def _resign(self) -> None:
+        conn, self._leader_conn = self._leader_conn, None
+        if conn is None:
+            return
+        try:
+            # lock de sessão sobrevive à devolução ao pool: solta antes
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": advisory_lock_key("outbox-dispatcher")})
+        except Exception:  # noqa: BLE001
+            conn.invalidate()
+        conn.close()
+
+    @staticmethod
+    def _claim() -> list[Claimed]:
+        with SessionLocal() as db:
+            return claim_batch(db)
+
+    @staticmethod
+    def _record(claimed: list[Claimed], outcomes: list[Outcome]) -> None:
+        with SessionLocal() as db:
+            record_outcomes(db, claimed, outcomes)
+
+    @staticmethod
+    def _sweep() -> int:
+        with SessionLocal() as db:
+            return sweep_outbox(db)
+
+    async def drain_once(self) -> int:
+        """Um lote: claim, envio e resultado. Retorna quantas mensagens foram tentadas."""
+        assert self._writer is not None
+        claimed = await run_in_threadpool(self._claim)
+        if not claimed:
+            return 0
+        limit = asyncio.Semaphore(max(1, SAP_OUTBOX_CONCURRENCY))
+        writer = self._writer
+
+        async def send(c: Claimed) -> Outcome:
+            async with limit:
+                return await writer.send(c)
+
+        outcomes = await asyncio.gather(*(send(c) for c in claimed))
+        await run_in_threadpool(self._record, claimed, list(outcomes))
+        return len(claimed)
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            # limpa antes de drenar: um aviso que chega durante a drenagem não se perde
+            self._wake.clear()
+            try:
+                if not await run_in_threadpool(self._lead):
+                    await asyncio.sleep(SAP_OUTBOX_POLL_SECONDS)
+                    continue
+                tried = await self.drain_once()
+                if time.monotonic() - self._last_sweep > _SWEEP_INTERVAL_SECONDS:
+                    self._last_sweep = time.monotonic()
+                    removed = await run_in_threadpool(self._sweep)
+                    if removed:
+                        log.info("Mensagens antigas da outbox removidas.", extra={"removed": removed})
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                log.exception("Falha ao drenar a outbox SAP.")
+                tried = 0
+            if tried >= SAP_OUTBOX_BATCH:
+                continue  # backlog: emenda o próximo lote
+            try:
+                await asyncio.wait_for(self._wake.wait(), SAP_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dispatcher da outbox SAP (processo à parte da API).")
+    parser.add_argument("command", choices=("run", "stats", "retry-failed"))
+    args = parser.parse_args()
+    if args.command == "stats":
+        with SessionLocal() as db:
+            print(json.dumps(outbox_stats(db), indent=2))
+    elif args.command == "retry-failed":
+        with SessionLocal() as db:
+            print(f"mensagens reenfileiradas: {requeue_failed(db)}")
+    else:
+        if not SAP_BASE_URL:
+            raise SystemExit("SAP_BASE_URL não configurada.")
+
+        async def run() -> None:
+            await outbox_dispatcher.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await outbox_dispatcher.stop()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import base64
+import json
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Literal
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Select, func, text, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+
+CountMode = Literal["exact", "approximate", "none"]
+
+MAX_PAGE_SIZE = 200
+
+
+def page_size(limit: int) -> int:
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+# ========================================
+# Contagem
+# ========================================
+
+def _estimate_postgresql(db: Session, base: Select) -> int | None:
+    if base.whereclause is None:
+        table = base.get_final_froms()[0]
+        est = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+            {"t": table.name},
+        ).scalar()
+        # reltuples = -1 enquanto a tabela nunca foi analisada (VACUUM/ANALYZE)
+        return int(est) if est is not None and est >= 0 else None
+
+    conn = db.connection()
+    compiled = base.compile(dialect=conn.dialect)
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_total(db: Session, base: Select, mode: CountMode = "exact") -> int | None:
+    """
+    Total de linhas de `base` (select filtrado, sem ordenação/paginação), calculado no SQL.
+
+    - `exact`: `SELECT count(*)` com os mesmos filtros da listagem.
+    - `approximate`: no PostgreSQL usa `pg_class.reltuples` (sem filtros) ou a estimativa
+      do planner (`EXPLAIN`); nos demais dialetos cai para `exact`.
+    - `none`: não conta (retorna `None`).
+    """
+    if mode == "none":
+        return None
+    if mode == "approximate" and db.get_bind().dialect.name == "postgresql":
+        est = _estimate_postgresql(db, base)
+        if est is not None:
+            return est
+    stmt = base.with_only_columns(func.count(), maintain_column_froms=True).order_by(None)
+    return int(db.execute(stmt).scalar_one())
+
+
+# ========================================
+# Keyset (cursor)
+# ========================================
+
+def _invalid_cursor() -> HTTPException:
+    exc = HTTPException(status_code=400, detail="Cursor inválido.")
+    setattr(exc, "error_code", "WMS-PAG-001")
+    return exc
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _cursor_value(key: InstrumentedAttribute, value: Any) -> Any:
+    """Valor do cursor para a chave: só escalar do tipo Python da coluna (nunca lista, dict ou bool)."""
+    if value is None:
+        if key.expression.nullable:
+            return None
+        raise ValueError("nulo")
+    if isinstance(key.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError("data")
+        return datetime.fromisoformat(value)
+    try:
+        expected = key.type.python_type
+    except NotImplementedError:
+        expected = str
+    if expected is float:
+        expected = (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise ValueError("tipo")
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence[InstrumentedAttribute]) -> list[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("tamanho")
+        return [_cursor_value(k, v) for k, v in zip(keys, values)]
+    except ValueError as e:  # inclui JSONDecodeError / binascii.Error
+        raise _invalid_cursor() from e
+
+
+def _fetch(db: Session, q: Select) -> list[Any]:
+    """Entidades para `select(Model)`; `Row`s para projeções de colunas."""
+    result = db.execute(q)
+    described = q.column_descriptions
+    if len(described) == 1 and described[0]["expr"] is described[0]["entity"]:
+        return list(result.scalars().all())
+    return list(result.all())
+
+
+def paginate(
+    db: Session,
+    q: Select,
+    keys: Sequence[InstrumentedAttribute],
+    limit: int,
+    offset: int = 0,
+    cursor: str | None = None,
+    descending: bool = False,
+) -> tuple[list[Any], str | None]:
+    """
+    Executa a página de `q` ordenada por `keys` (a última chave deve ser única).
+
+    Com `cursor`, usa keyset (`WHERE (k1, k2) > (:v1, :v2)`) e ignora `offset`; sem ele, usa
+    `OFFSET`. Em ambos os casos devolve `nextCursor` para a página seguinte (ou `None` no fim).
+    """
+    size = page_size(limit)
+    q = q.order_by(*[k.desc() if descending else k.asc() for k in keys])
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        row_key = tuple_(*keys)
+        q = q.where(row_key < tuple(values) if descending else row_key > tuple(values))
+    elif offset:
+        q = q.offset(offset)
+
+    rows = _fetch(db, q.limit(size + 1))
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, k.key) for k in keys])
+    return rows, next_cursor
+
+
+# ========================================
+# Relevância (offset no cursor)
+# ========================================
+
+def paginate_ranked(
+    db: Session,
+    q: Select,
+    order_by: Sequence[Any],
+    limit: int,
+    offset: int = 0,
+    cursor: str | None = None,
+) -> tuple[list[Any], str | None]:
+    """
+    Página de `q` ordenada por expressões de relevância (`order_by`, terminando numa chave única).
+
+    O score não é coluna da linha, então não há keyset: o cursor carrega o offset da próxima
+    página, no mesmo formato opaco dos demais cursores.
+    """
+    size = page_size(limit)
+    if cursor:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not (
+                isinstance(values, list) and len(values) == 2 and values[0] == "o"
+                and isinstance(values[1], int) and not isinstance(values[1], bool)
+            ):
+                raise ValueError("formato")
+            offset = max(values[1], 0)
+        except ValueError as e:
+            raise _invalid_cursor() from e
+
+    rows = _fetch(db, q.order_by(*order_by).offset(offset).limit(size + 1))
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(["o", offset + size])
+    return rows, next_cursor
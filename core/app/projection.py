@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+from .availability import AvailabilityDelta
+from .db import SessionLocal, engine
+from .event_archive import ArchiveUnavailable, _utc, read_archived_rows
+from .models import Order as DbOrder, OrderEvent as DbOrderEvent, OrderEventArchive
+from .order_counters import rebuild_order_counters
+from .state_machine import order_sm
+
+
+# pedidos por lote (cada lote: uma consulta de pedidos, uma de eventos, uma de arquivo frio)
+PROJECTION_CHECK_CHUNK = int(os.getenv("PROJECTION_CHECK_CHUNK", "2000"))
+# partições processadas em paralelo (uma sessão cada); 0 = 1 no SQLite (um arquivo, sem ganho
+# com threads) e 4 nos demais bancos
+PROJECTION_CHECK_PARTITIONS = int(os.getenv("PROJECTION_CHECK_PARTITIONS", "0"))
+# divergências detalhadas no relatório (as contagens cobrem todas)
+PROJECTION_REPORT_LIMIT = int(os.getenv("PROJECTION_REPORT_LIMIT", "1000"))
+
+_HEX = "0123456789abcdef"
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def partition_bounds(partitions: int) -> list[tuple[str | None, str | None]]:
+    """
+    Faixas de `order_id` ([início, fim)) que dividem o espaço de chaves em `partitions` partes.
+    Os ids são UUID4 (hex aleatório), então a faixa equivale a um hash do pedido e ainda usa a
+    PK: cada partição lê `orders` em keyset sem varrer as outras. Ids fora do padrão caem na
+    primeira ou na última faixa.
+    """
+    partitions = max(1, min(partitions, 256))
+    cuts = [f"{_HEX[(i * 256 // partitions) // 16]}{_HEX[(i * 256 // partitions) % 16]}" for i in range(1, partitions)]
+    bounds = [None, *cuts, None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+@dataclass
+class Fold:
+    """Projeção de um pedido calculada a partir dos eventos."""
+
+    status: str = order_sm.initial_state
+    version: int = 0
+    invalid: list[dict[str, Any]] = field(default_factory=list)
+    unchained: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _flow_position(status: str) -> int:
+    return order_sm.state_code.get(status, len(order_sm.states))
+
+
+def _event_dict(event: tuple[str, str, str, str]) -> dict[str, Any]:
+    event_id, event_type, from_status, to_status = event
+    return {"eventId": event_id, "type": event_type, "from": from_status, "to": to_status}
+
+
+def fold_events(events: list[tuple[str, str, str, str]]) -> Fold:
+    """
+    Reaplica os eventos `(event_id, type, from, to)` seguindo a cadeia gravada: a partir do
+    estado inicial, o próximo evento é o que sai do status corrente (`from`). O `occurred_at`
+    vem do cliente e não diz em que ordem o CAS aplicou os eventos; a ordem recebida só desempata
+    eventos com o mesmo `from` (máquina com ciclos). `version` é o número de eventos, como no CAS.
+
+    Evento da cadeia que a máquina não aceita fica em `invalid`; o fold segue pelo `to` gravado
+    (o log é a fonte da verdade). Evento que a cadeia não alcança fica em `unchained`: o log do
+    pedido não forma uma sequência única e o status dele não é confiável.
+    """
+    out = Fold(version=len(events))
+    # caso comum: a ordem recebida já encadeia, sem montar a fila por status de origem
+    start = 0
+    for event in events:
+        _, event_type, from_status, to_status = event
+        if from_status != out.status:
+            break
+        if order_sm.next_state(from_status, event_type) != to_status:
+            out.invalid.append(_event_dict(event))
+        out.status = to_status
+        start += 1
+    else:
+        return out
+    pending: defaultdict[str, deque[tuple[int, tuple[str, str, str, str]]]] = defaultdict(deque)
+    for i in range(start, len(events)):
+        pending[events[i][2]].append((i, events[i]))
+    while pending.get(out.status):
+        _, event = pending[out.status].popleft()
+        _, event_type, from_status, to_status = event
+        if order_sm.next_state(from_status, event_type) != to_status:
+            out.invalid.append(_event_dict(event))
+        out.status = to_status
+    out.unchained = [_event_dict(event) for _, event in sorted(e for q in pending.values() for e in q)]
+    return out
+
+
+@dataclass
+class _Report:
+    repair: bool
+    orders: int = 0
+    events: int = 0
+    archived_orders: int = 0
+    mismatches: int = 0
+    invalid_events: int = 0
+    unchained: int = 0
+    repaired: int = 0
+    skipped: int = 0
+    archive_unavailable: int = 0
+    flagged: int = 0  # pedidos divergentes, com evento inválido ou fora da cadeia, ou sem o arquivo frio
+    samples: list[dict[str, Any]] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def merge(self, chunk: _Report) -> None:
+        with self.lock:
+            self.orders += chunk.orders
+            self.events += chunk.events
+            self.archived_orders += chunk.archived_orders
+            self.mismatches += chunk.mismatches
+            self.invalid_events += chunk.invalid_events
+            self.unchained += chunk.unchained
+            self.repaired += chunk.repaired
+            self.skipped += chunk.skipped
+            self.archive_unavailable += chunk.archive_unavailable
+            self.flagged += chunk.flagged
+            room = PROJECTION_REPORT_LIMIT - len(self.samples)
+            if room > 0:
+                self.samples.extend(chunk.samples[:room])
+
+
+def _chunk_events(db: Session, order_ids: list[str]) -> tuple[dict[str, list[tuple]], int, set[str]]:
+    """
+    Eventos dos pedidos do lote, na ordem que desempata o fold (`occurred_at`, depois status de
+    origem na ordem do fluxo): `order_events` já ordenado no SQL (sem trazer `occurred_at`) mais
+    o arquivo frio, ordenado aqui (um arquivo lido uma vez por lote).
+    Também devolve os pedidos cujo arquivo frio não está no disco (histórico incompleto).
+    """
+    events: defaultdict[str, list[tuple]] = defaultdict(list)
+    flow = case(order_sm.state_code, value=DbOrderEvent.from_status, else_=len(order_sm.states))
+    for order_id, *event in db.execute(
+        select(
+            DbOrderEvent.order_id, DbOrderEvent.event_id, DbOrderEvent.type,
+            DbOrderEvent.from_status, DbOrderEvent.to_status,
+        )
+        .where(DbOrderEvent.order_id.in_(order_ids))
+        .order_by(DbOrderEvent.order_id, DbOrderEvent.occurred_at, flow)
+    ):
+        events[order_id].append(tuple(event))
+
+    by_path: defaultdict[str, set[str]] = defaultdict(set)
+    for order_id, path in db.execute(
+        select(OrderEventArchive.order_id, OrderEventArchive.path).where(OrderEventArchive.order_id.in_(order_ids))
+    ):
+        by_path[path].add(order_id)
+    archived: defaultdict[str, list[dict[str, Any]]] = defaultdict(list)
+    unavailable: set[str] = set()
+    for path, ids in by_path.items():
+        try:
+            rows = read_archived_rows(path, ids)
+        except ArchiveUnavailable:
+            log.error("Arquivo frio indisponível na conferência de projeção.", extra={"path": path, "orders": len(ids)})
+            unavailable.update(ids)
+            continue
+        for r in rows:
+            archived[r["order_id"]].append(r)
+    # pedido arquivado que ainda tem eventos no banco (correção manual): junta pelo horário
+    mixed = [oid for oid in archived if oid in events]
+    if mixed:
+        for r in db.execute(select(DbOrderEvent.__table__).where(DbOrderEvent.order_id.in_(mixed))).mappings():
+            archived[r["order_id"]].append(dict(r))
+    for order_id, rows in archived.items():
+        rows.sort(key=lambda r: (_utc(r["occurred_at"]), _flow_position(r["from_status"])))
+        events[order_id] = [(r["event_id"], r["type"], r["from_status"], r["to_status"]) for r in rows]
+    return events, sum(len(ids) for ids in by_path.values()), unavailable
+
+
+def _check_chunk(db: Session, rows: list[Any], repair: bool) -> _Report:
+    out = _Report(repair=repair)
+    events, out.archived_orders, unavailable = _chunk_events(db, [r.order_id for r in rows])
+    out.orders = len(rows)
+    demand = AvailabilityDelta()
+    now = datetime.now(timezone.utc)
+    for r in rows:
+        if r.order_id in unavailable:
+            # sem o arquivo não há como reconstruir: relata e nunca corrige
+            out.archive_unavailable += 1
+            out.flagged += 1
+            if len(out.samples) < PROJECTION_REPORT_LIMIT:
+                out.samples.append({"orderId": r.order_id, "status": r.status, "version": r.version, "archiveUnavailable": True})
+            continue
+        order_events = events.get(r.order_id, [])
+        out.events += len(order_events)
+        fold = fold_events(order_events)
+        out.invalid_events += len(fold.invalid)
+        if fold.unchained:
+            # eventos que não encadeiam: não há status esperado confiável, relata e nunca corrige
+            out.unchained += 1
+            out.flagged += 1
+            if len(out.samples) < PROJECTION_REPORT_LIMIT:
+                out.samples.append({
+                    "orderId": r.order_id,
+                    "status": r.status,
+                    "version": r.version,
+                    "events": len(order_events),
+                    "unchainedEvents": fold.unchained,
+                })
+            continue
+        if fold.status == r.status and fold.version == r.version and not fold.invalid:
+            continue
+        out.flagged += 1
+        diverged = fold.status != r.status or fold.version != r.version
+        out.mismatches += diverged
+        fixed = False
+        if repair and diverged:
+            # CAS no que foi lido: se uma transição concorrente mudou o pedido, não sobrescreve
+            res = db.execute(
+                update(DbOrder)
+                .where(DbOrder.order_id == r.order_id, DbOrder.version == r.version, DbOrder.status == r.status)
+                .values(status=fold.status, version=fold.version, updated_at=now)
+            )
+            if res.rowcount == 1:
+                fixed = True
+                out.repaired += 1
+                demand.move(r.order_id, r.status, fold.status)
+            else:
+                out.skipped += 1
+        if len(out.samples) < PROJECTION_REPORT_LIMIT:
+            sample: dict[str, Any] = {
+                "orderId": r.order_id,
+                "status": r.status,
+                "expectedStatus": fold.status,
+                "version": r.version,
+                "expectedVersion": fold.version,
+                "events": len(order_events),
+            }
+            if fold.invalid:
+                sample["invalidEvents"] = fold.invalid
+            if repair and diverged:
+                sample["repaired"] = fixed
+            out.samples.append(sample)
+    if out.repaired:
+        db.commit()
+        demand.publish(db)
+    else:
+        db.rollback()  # encerra a transação de leitura do lote
+    return out
+
+
+def _check_partition(lo: str | None, hi: str | None, repair: bool, chunk_size: int, report: _Report) -> None:
+    last = lo
+    first = True
+    with SessionLocal() as db:
+        while True:
+            q = select(
+                DbOrder.order_id, DbOrder.status, DbOrder.version, DbOrder.customer_id, DbOrder.created_at,
+            ).order_by(DbOrder.order_id).limit(chunk_size)
+            if last is not None:
+                # o início da faixa é inclusivo só no primeiro lote; depois, keyset estrito
+                q = q.where(DbOrder.order_id >= last if first else DbOrder.order_id > last)
+            if hi is not None:
+                q = q.where(DbOrder.order_id < hi)
+            rows = db.execute(q).all()
+            if not rows:
+                return
+            report.merge(_check_chunk(db, rows, repair))
+            if len(rows) < chunk_size:
+                return
+            last, first = rows[-1].order_id, False
+
+
+def verify_order_projections(
+    repair: bool = False,
+    partitions: int | None = None,
+    chunk_size: int = PROJECTION_CHECK_CHUNK,
+) -> dict[str, Any]:
+    """
+    Confere `orders.status`/`orders.version` contra o fold de `order_events` (inclusive o
+    arquivo frio). Cada partição de `order_id` roda numa thread com sessão própria, em lotes de
+    `chunk_size` pedidos: a memória fica limitada a um lote por partição, seja qual for o
+    tamanho da tabela. Com `repair`, corrige as divergências (CAS por pedido, commit por lote),
+    atualiza o índice de disponibilidade e, no fim, recalcula os contadores de status; sem
+    `repair`, só relata.
+    """
+    started = time.perf_counter()
+    report = _Report(repair=repair)
+    partitions = partitions or PROJECTION_CHECK_PARTITIONS or (1 if engine.dialect.name == "sqlite" else 4)
+    bounds = partition_bounds(partitions)
+    with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="projection") as pool:
+        for f in [pool.submit(_check_partition, lo, hi, repair, max(1, chunk_size), report) for lo, hi in bounds]:
+            f.result()
+    if report.repaired:
+        # a divergência pode ter vindo de uma escrita que também não passou pelos contadores:
+        # em vez de mover a partir do status errado, recalcula tudo de `orders`
+        with SessionLocal() as db:
+            rebuild_order_counters(db)
+            db.commit()
+    out = {
+        "mode": "repair" if repair else "check",
+        "partitions": len(bounds),
+        "orders": report.orders,
+        "events": report.events,
+        "archivedOrders": report.archived_orders,
+        "mismatches": report.mismatches,
+        "invalidEvents": report.invalid_events,
+        "unchained": report.unchained,
+        "repaired": report.repaired,
+        "skipped": report.skipped,
+        "archiveUnavailable": report.archive_unavailable,
+        "elapsedMs": round((time.perf_counter() - started) * 1000, 1),
+        "samples": report.samples,
+        "samplesTruncated": report.flagged > len(report.samples),
+    }
+    log.info(
+        "Projeção de pedidos conferida.",
+        extra={k: out[k] for k in (
+            "mode", "orders", "events", "mismatches", "invalidEvents", "unchained", "repaired", "skipped",
+            "archiveUnavailable",
+        )},
+    )
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Confere (ou corrige) orders.status/version contra order_events.")
+    parser.add_argument("--repair", action="store_true", help="corrige as divergências (padrão: só relata)")
+    parser.add_argument("--partitions", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=PROJECTION_CHECK_CHUNK)
+    args = parser.parse_args()
+    report = verify_order_projections(args.repair, args.partitions, args.chunk_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
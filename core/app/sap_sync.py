@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import logging
+import os
+import uuid
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+
+from .availability import AvailabilityDelta
+from .models import Order as DbOrder, OrderItem as DbOrderItem
+from .order_counters import CounterDelta
+from .order_feed import ORDER_CREATED, ORDER_SAP_UPDATED, order_feed
+from .schemas import SapOrder, SapOrderLine, SapOrdersSyncChunkResult
+from .state_machine import order_sm
+
+
+SAP_SYNC_CHUNK_SIZE = int(os.getenv("SAP_SYNC_CHUNK_SIZE", "500"))
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+def _unchanged(existing: DbOrder, o: SapOrder) -> bool:
+    # O SAP atualiza UpdateDate/UpdateTime a cada alteração do documento.
+    return (
+        o.UpdateDate is not None
+        and o.UpdateTime is not None
+        and existing.sap_update_date == o.UpdateDate
+        and existing.sap_update_time == o.UpdateTime
+        and existing.sap_doc_entry == o.DocEntry
+    )
+
+
+def _sync_lines(order: DbOrder, lines: Sequence[SapOrderLine]) -> bool:
+    """
+    Reconcilia `order.items` com as linhas do documento por posição (ordem de LineNum),
+    alterando apenas o que mudou. Retorna True se algo foi alterado.
+    """
+    incoming = sorted(lines, key=lambda line: line.LineNum)
+    current = sorted(order.items, key=lambda it: it.order_item_id or 0)
+    changed = False
+
+    for item, line in zip(current, incoming):
+        if (
+            item.sku != line.ItemCode
+            or float(item.quantity) != float(line.Quantity)
+            or item.warehouse_code != line.WarehouseCode
+        ):
+            item.sku = line.ItemCode
+            item.quantity = line.Quantity
+            item.warehouse_code = line.WarehouseCode
+            changed = True
+    for line in incoming[len(current):]:
+        order.items.append(DbOrderItem(
+            order_id=order.order_id, sku=line.ItemCode, quantity=line.Quantity, warehouse_code=line.WarehouseCode
+        ))
+        changed = True
+    for item in current[len(incoming):]:
+        order.items.remove(item)
+        changed = True
+    return changed
+
+
+def _prefetch(db: Session, chunk: Sequence[SapOrder]) -> tuple[dict[int, DbOrder], dict[str, DbOrder]]:
+    by_entry: dict[int, DbOrder] = {}
+    by_external: dict[str, DbOrder] = {}
+
+    entries = {o.DocEntry for o in chunk if o.DocEntry is not None}
+    if entries:
+        for order in db.execute(
+            select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.sap_doc_entry.in_(entries))
+        ).scalars():
+            by_entry[order.sap_doc_entry] = order
+
+    externals = {str(o.DocNum) for o in chunk if o.DocEntry not in by_entry}
+    if externals:
+        for order in db.execute(
+            select(DbOrder).options(selectinload(DbOrder.items)).where(DbOrder.external_order_id.in_(externals))
+        ).scalars():
+            by_external[order.external_order_id] = order
+    return by_entry, by_external
+
+
+def _apply_chunk(
+    db: Session,
+    chunk: Sequence[SapOrder],
+    result: SapOrdersSyncChunkResult,
+    changes: list[dict],
+    demand: AvailabilityDelta,
+) -> None:
+    by_entry, by_external = _prefetch(db, chunk)
+    counters = CounterDelta()
+
+    for o in chunk:
+        external_id = str(o.DocNum)
+        existing = by_entry.get(o.DocEntry) or by_external.get(external_id)
+
+        if not existing:
+            oid = str(uuid.uuid4())
+            now = datetime.now(timezone.utc)
+            order = DbOrder(
+                order_id=oid,
+                external_order_id=external_id,
+                customer_id=o.CardCode,
+                status=order_sm.initial_state,
+                created_at=now,
+                updated_at=now,
+                version=0,
+                sap_doc_entry=o.DocEntry,
+                sap_doc_num=o.DocNum,
+                sap_doc_status=o.DocStatus,
+                sap_update_date=o.UpdateDate,
+                sap_update_time=o.UpdateTime,
+            )
+            for line in sorted(o.DocumentLines or [], key=lambda line: line.LineNum):
+                order.items.append(DbOrderItem(
+                    order_id=oid, sku=line.ItemCode, quantity=line.Quantity, warehouse_code=line.WarehouseCode
+                ))
+            db.add(order)
+            counters.add(order.status, order.customer_id, now)
+            demand.lines(oid, order.items)
+            # o mesmo documento pode vir repetido no lote
+            by_entry[o.DocEntry] = order
+            by_external[external_id] = order
+            result.created += 1
+            changes.append(order_feed.message(ORDER_CREATED, oid, status=order.status, version=0, sapDocEntry=o.DocEntry))
+            continue
+
+        if _unchanged(existing, o):
+            result.skipped += 1
+            continue
+
+        # Atualiza snapshot SAP
+        existing.sap_doc_entry = o.DocEntry
+        existing.sap_doc_num = o.DocNum
+        existing.sap_doc_status = o.DocStatus
+        existing.sap_update_date = o.UpdateDate
+        existing.sap_update_time = o.UpdateTime
+        if not existing.external_order_id:
+            existing.external_order_id = external_id
+
+        # Atualiza itens apenas antes de iniciar separação
+        if existing.status == "A_SEPARAR":
+            if existing.customer_id != o.CardCode:
+                counters.add(existing.status, existing.customer_id, existing.created_at, -1)
+                counters.add(existing.status, o.CardCode, existing.created_at)
+            existing.customer_id = o.CardCode
+            if _sync_lines(existing, o.DocumentLines or []):
+                demand.lines(existing.order_id, existing.items)
+            # cliente/itens podem ter mudado: move ETag/Last-Modified das listas e o corte do export.
+            # Nos demais status só o snapshot SAP muda, e `updated_at` segue sendo a última
+            # transição (permanência e `openBreaches` dependem disso).
+            existing.updated_at = datetime.now(timezone.utc)
+        result.updated += 1
+        changes.append(order_feed.message(
+            ORDER_SAP_UPDATED, existing.order_id, status=existing.status, version=existing.version, sapDocEntry=o.DocEntry
+        ))
+    # contadores na mesma transação do chunk
+    counters.apply(db)
+
+
+def sync_orders_batched(
+    db: Session,
+    orders: Sequence[SapOrder],
+    chunk_size: int | None = None,
+    correlation_id: str | None = None,
+) -> list[SapOrdersSyncChunkResult]:
+    """
+    Sync SAP -> Core em lotes: cada chunk faz uma consulta `IN` por chave (DocEntry e DocNum),
+    aplica as mudanças e faz commit próprio. Falha em um chunk faz rollback só dele e é
+    reportada no resultado; os demais seguem.
+    """
+    size = max(1, chunk_size or SAP_SYNC_CHUNK_SIZE)
+    results: list[SapOrdersSyncChunkResult] = []
+
+    for index, start in enumerate(range(0, len(orders), size)):
+        chunk = orders[start : start + size]
+        result = SapOrdersSyncChunkResult(index=index, received=len(chunk))
+        changes: list[dict] = []
+        demand = AvailabilityDelta()
+        try:
+            _apply_chunk(db, chunk, result, changes, demand)
+            order_feed.stage(db, changes)
+            db.commit()
+            order_feed.publish_many(changes)
+            demand.publish(db)
+        except SQLAlchemyError as exc:
+            db.rollback()
+            log.exception("Falha no chunk do sync SAP.", extra={"correlationId": correlation_id})
+            result = SapOrdersSyncChunkResult(
+                index=index, received=len(chunk), error=f"{type(exc).__name__}: {str(exc)[:200]}"
+            )
+        results.append(result)
+    return results
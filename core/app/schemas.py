@@ -3,7 +3,9 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
+
+from .state_machine import order_sm
 
 
 OrderStatus = Literal[
@@ -47,6 +49,12 @@ class Order(BaseModel):
     createdAt: datetime
     updatedAt: datetime
 
+    @computed_field
+    @property
+    def allowedEvents(self) -> list[OrderEventType]:
+        """Eventos aceitos no status atual: o cliente não precisa tentar e levar 409."""
+        return list(order_sm.allowed_events(self.status))
+
 
 class OrderEventActor(BaseModel):
     kind: Literal["USER", "SYSTEM", "INTEGRATION"]
@@ -77,6 +85,58 @@ class OrderEventResult(BaseModel):
     applied: bool
     event: OrderEvent
 
+    @computed_field
+    @property
+    def allowedEvents(self) -> list[OrderEventType]:
+        """Próximos eventos aceitos (a partir de `currentStatus`)."""
+        return list(order_sm.allowed_events(self.currentStatus))
+
+
+class OrderEventBatchItem(BaseModel):
+    orderId: str
+    type: OrderEventType
+    idempotencyKey: str | None = None
+    occurredAt: datetime | None = None
+    actor: OrderEventActor | None = None
+    reason: str | None = None
+
+
+class OrderEventBatchRequest(BaseModel):
+    actor: OrderEventActor
+    events: list[OrderEventBatchItem] = Field(min_length=1, max_length=1000)
+
+
+class OrderEventBatchItemResult(BaseModel):
+    index: int
+    orderId: str
+    ok: bool
+    result: OrderEventResult | None = None
+    errorCode: str | None = None
+    message: str | None = None
+
+
+class OrderEventBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: list[OrderEventBatchItemResult]
+
+
+class WavePlanRequest(BaseModel):
+    maxLines: int | None = Field(default=None, gt=0)
+    maxUnits: float | None = Field(default=None, gt=0)
+    maxOrders: int | None = Field(default=None, gt=0, le=1000)
+    limit: int | None = Field(default=None, gt=0)  # ondas devolvidas (o resumo cobre o backlog todo)
+
+
+class WaveStartRequest(BaseModel):
+    actor: OrderEventActor
+    orderIds: list[str] = Field(min_length=1, max_length=1000)
+    waveId: str | None = Field(default=None, max_length=100)  # vira `wave:{waveId}` em idempotency_key (128)
+
+
+class WaveStartResponse(OrderEventBatchResponse):
+    waveId: str
+
 
 class OrderHistoryResponse(BaseModel):
     orderId: str
@@ -112,8 +172,20 @@ class SapOrdersSyncRequest(BaseModel):
     orders: list[SapOrder]
 
 
+class SapOrdersSyncChunkResult(BaseModel):
+    index: int
+    received: int
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    error: str | None = None
+
+
 class SapOrdersSyncResponse(BaseModel):
     upserted: int
     created: int
     updated: int
+    skipped: int = 0
+    failed: int = 0
+    chunks: list[SapOrdersSyncChunkResult] = []
 
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import Select, case, column, func, literal_column, or_, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .db import advisory_lock_key
+from .models import Customer as DbCustomer, Product as DbProduct
+
+
+# auto: índice se disponível | indexed: exige índice (falha no startup sem ele) | scan: ILIKE sem índice
+SEARCH_MODE = os.getenv("SEARCH_MODE", "auto").lower()
+# trigramas: termos menores não usam o índice e caem no ILIKE
+SEARCH_MIN_INDEXED_LENGTH = 3
+
+log = logging.getLogger(os.getenv("SERVICE_NAME", "wms-core"))
+
+
+@dataclass(frozen=True)
+class SearchSpec:
+    model: type
+    # substring, mesmas colunas no índice e no ILIKE '%termo%' do modo scan (o resultado não
+    # depende do modo nem do tamanho do termo)
+    text_cols: tuple[str, ...]
+    # código lido por scanner/digitado: igualdade e prefixo sobem no ranking
+    code_cols: tuple[str, ...]
+
+    @property
+    def table(self) -> str:
+        return self.model.__tablename__
+
+    @property
+    def fts_table(self) -> str:
+        return f"{self.table}_fts"
+
+
+PRODUCT_SEARCH = SearchSpec(DbProduct, ("sku", "ean", "description"), ("sku", "ean"))
+CUSTOMER_SEARCH = SearchSpec(DbCustomer, ("card_code", "card_name"), ("card_code",))
+SEARCH_SPECS = (PRODUCT_SEARCH, CUSTOMER_SEARCH)
+
+# backend de índice disponível por dialeto, preenchido por `ensure_search_indexes`
+_indexed: dict[str, bool] = {}
+
+
+# ============================================================
+# Índices
+# ============================================================
+
+def _ensure_postgresql(engine: Engine) -> bool:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # todos os workers chegam aqui no startup: um cria, os outros esperam e encontram pronto
+        # (CREATE INDEX CONCURRENTLY não roda em transação, então o lock é de sessão)
+        key = advisory_lock_key("search-indexes")
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": key})
+        try:
+            try:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            except Exception:  # noqa: BLE001
+                log.warning("pg_trgm indisponível; busca segue em modo scan.")
+                return False
+            for spec in SEARCH_SPECS:
+                for col in spec.text_cols:
+                    # GIN de trigramas atende ILIKE '%x%' e 'x%'; CONCURRENTLY não bloqueia escrita
+                    conn.execute(text(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{spec.table}_{col}_trgm "
+                        f"ON {spec.table} USING gin ({col} gin_trgm_ops)"
+                    ))
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+    return True
+
+
+def _ensure_sqlite(engine: Engine) -> bool:
+    with engine.begin() as conn:
+        try:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x, tokenize='trigram')"))
+            conn.execute(text("DROP TABLE temp._fts5_probe"))
+        except Exception:  # noqa: BLE001
+            log.warning("FTS5 com tokenizer trigram indisponível (SQLite >= 3.34); busca segue em modo scan.")
+            return False
+
+        for spec in SEARCH_SPECS:
+            fts, table, cols = spec.fts_table, spec.table, spec.text_cols
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": fts}
+            ).first()
+            if exists:
+                continue
+            col_list = ", ".join(cols)
+            new_vals = ", ".join(f"new.{c}" for c in cols)
+            old_vals = ", ".join(f"old.{c}" for c in cols)
+            # tabela de conteúdo externo: o FTS guarda só o índice; triggers o mantêm em dia
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({col_list}, content='{table}', content_rowid='id', tokenize='trigram')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_vals}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals}); "
+                f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_vals}); END"
+            ))
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    return True
+
+
+def ensure_search_indexes(engine: Engine) -> None:
+    """Cria (se faltarem) os índices de busca do dialeto. Chamar no startup, após o `create_all`."""
+    dialect = engine.dialect.name
+    if SEARCH_MODE == "scan":
+        _indexed[dialect] = False
+        return
+    if dialect == "postgresql":
+        _indexed[dialect] = _ensure_postgresql(engine)
+    elif dialect == "sqlite":
+        _indexed[dialect] = _ensure_sqlite(engine)
+    else:
+        _indexed[dialect] = False
+    if SEARCH_MODE == "indexed" and not _indexed[dialect]:
+        raise RuntimeError(f"SEARCH_MODE=indexed, mas não há índice de busca para {dialect}.")
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _code_rank(spec: SearchSpec, term: str) -> Any:
+    """0 = código igual ao termo, 1 = código começa com o termo, 2 = demais (só texto)."""
+    cols = [getattr(spec.model, c) for c in spec.code_cols]
+    prefix = f"{_escape_like(term)}%"
+    return case(
+        (or_(*[func.lower(c) == term.lower() for c in cols]), 0),
+        (or_(*[c.ilike(prefix, escape="\\") for c in cols]), 1),
+        else_=2,
+    )
+
+
+def apply_search(db: Session, q: Select, spec: SearchSpec, term: str) -> tuple[Select, list[Any] | None]:
+    """
+    Aplica o filtro de busca em `q`. Retorna `(consulta, ordenação por relevância)`; a ordenação
+    é `None` no modo scan (a listagem mantém a paginação keyset original).
+    """
+    term = term.strip()
+    dialect = db.get_bind().dialect.name
+    if not term or not _indexed.get(dialect) or len(term) < SEARCH_MIN_INDEXED_LENGTH:
+        pattern = f"%{_escape_like(term)}%"
+        return q.where(or_(*[getattr(spec.model, c).ilike(pattern, escape="\\") for c in spec.text_cols])), None
+
+    tie = getattr(spec.model, spec.code_cols[0])
+    if dialect == "postgresql":
+        cols = [getattr(spec.model, c) for c in spec.text_cols]
+        pattern = f"%{_escape_like(term)}%"
+        score = func.greatest(*[func.similarity(c, term) for c in cols]) if len(cols) > 1 else func.similarity(cols[0], term)
+        q = q.where(or_(*[c.ilike(pattern, escape="\\") for c in cols]))
+        return q, [_code_rank(spec, term), score.desc(), tie]
+
+    # SQLite FTS5 (trigram): a frase casa como substring em qualquer coluna indexada
+    fts = table(spec.fts_table, column("rowid"))
+    fts_ref = literal_column(spec.fts_table)  # MATCH e bm25() recebem a própria tabela
+    phrase = '"' + term.replace('"', '""') + '"'
+    q = q.join(fts, fts.c.rowid == spec.model.id).where(fts_ref.op("MATCH")(phrase))
+    return q, [_code_rank(spec, term), func.bm25(fts_ref), tie]
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import Float, case, cast, select
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from .models import (
+    Customer as DbCustomer,
+    InventoryStock as DbInventoryStock,
+    Order as DbOrder,
+    OrderEvent as DbOrderEvent,
+    OrderItem as DbOrderItem,
+    Product as DbProduct,
+)
+from .state_machine import order_sm
+
+try:  # encoder rápido opcional
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# auto: orjson se instalado | orjson | json
+RESPONSE_JSON_ENCODER = os.getenv("RESPONSE_JSON_ENCODER", "auto").lower()
+if RESPONSE_JSON_ENCODER == "orjson" and orjson is None:
+    raise RuntimeError("RESPONSE_JSON_ENCODER=orjson, mas o pacote orjson não está instalado.")
+_USE_ORJSON = RESPONSE_JSON_ENCODER != "json" and orjson is not None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"{type(obj).__name__} não é serializável em JSON")
+
+
+def _default_stdlib(utc_z: bool):
+    def default(obj: Any) -> Any:
+        if isinstance(obj, datetime):
+            text = obj.isoformat()
+            if utc_z and obj.utcoffset() == timezone.utc.utcoffset(None):
+                text = text[:-6] + "Z"
+            return text
+        return _default(obj)
+    return default
+
+
+def dumps(content: Any, utc_z: bool = False) -> bytes:
+    """
+    Serializa direto para bytes, sem `jsonable_encoder` nem modelo Pydantic. Datetimes saem em
+    ISO 8601 como `isoformat()`; com `utc_z`, UTC vira `Z` (mesmo formato do Pydantic).
+    """
+    if _USE_ORJSON:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z if utc_z else 0)
+    return json.dumps(
+        content, default=_default_stdlib(utc_z), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """`JSONResponse` que aceita datetime/Decimal no conteúdo e serializa com orjson se disponível."""
+
+    utc_z = False
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content, self.utc_z)
+
+
+class ApiJSONResponse(FastJSONResponse):
+    """Para conteúdo que substitui um `response_model` Pydantic (datetime UTC com `Z`)."""
+
+    utc_z = True
+
+
+def json_body(body: bytes, headers: dict[str, str] | None = None) -> Response:
+    """Resposta com corpo já serializado (ex.: página guardada no cache de leitura)."""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ============================================================
+# Projeções: só as colunas da resposta, sem entidades ORM
+# ============================================================
+
+# Numeric → float no próprio SQL: o driver já entrega float (nem Decimal, nem int do SQLite)
+def _float(col: Any) -> Any:
+    return cast(col, Float)
+
+
+ORDER_COLUMNS = (
+    DbOrder.order_id,
+    DbOrder.external_order_id,
+    DbOrder.customer_id,
+    DbOrder.status,
+    DbOrder.created_at,
+    DbOrder.updated_at,
+)
+
+PRODUCT_COLUMNS = (
+    DbProduct.id,
+    DbProduct.sku,
+    DbProduct.description,
+    DbProduct.ean,
+    DbProduct.category,
+    DbProduct.unit_of_measure,
+    DbProduct.is_active,
+    DbProduct.is_inventory_item,
+    DbProduct.is_sales_item,
+    DbProduct.sap_item_code,
+    DbProduct.created_at,
+    DbProduct.updated_at,
+)
+
+CUSTOMER_COLUMNS = (
+    DbCustomer.id,
+    DbCustomer.card_code,
+    DbCustomer.card_name,
+    DbCustomer.card_type,
+    DbCustomer.phone,
+    DbCustomer.email,
+    DbCustomer.address,
+    DbCustomer.city,
+    DbCustomer.state,
+    DbCustomer.is_active,
+    DbCustomer.created_at,
+    DbCustomer.updated_at,
+)
+
+# quantidades já como float; sku/id mantêm o nome da coluna (chaves do cursor)
+INVENTORY_COLUMNS = (
+    DbInventoryStock.id,
+    DbInventoryStock.sku,
+    DbInventoryStock.warehouse_code,
+    _float(DbInventoryStock.on_hand).label("quantity_available"),
+    _float(DbInventoryStock.committed).label("quantity_reserved"),
+    _float(case(
+        (DbInventoryStock.on_hand > DbInventoryStock.committed, DbInventoryStock.on_hand - DbInventoryStock.committed),
+        else_=0,
+    )).label("quantity_free"),
+    _float(DbInventoryStock.ordered).label("quantity_on_order"),
+    DbInventoryStock.sap_update_date,
+    DbInventoryStock.updated_at,
+)
+
+
+def inventory_row(r: Any) -> dict[str, Any]:
+    return {
+        "id": r.id,
+        "product_id": r.sku,
+        "warehouse_id": r.warehouse_code,
+        "quantity_available": r.quantity_available,
+        "quantity_reserved": r.quantity_reserved,
+        "quantity_free": r.quantity_free,
+        "quantity_on_order": r.quantity_on_order,
+        "sap_update_date": r.sap_update_date,
+        "updated_at": r.updated_at,
+    }
+
+
+def order_items(db: Session, order_ids: list[str]) -> dict[str, list[dict[str, Any]]]:
+    """Itens de vários pedidos numa consulta (em vez do `selectinload` com entidades)."""
+    items: defaultdict[str, list[dict[str, Any]]] = defaultdict(list)
+    if not order_ids:
+        return items
+    rows = db.execute(
+        select(DbOrderItem.order_id, DbOrderItem.sku, _float(DbOrderItem.quantity))
+        .where(DbOrderItem.order_id.in_(order_ids))
+        .order_by(DbOrderItem.order_id, DbOrderItem.order_item_id)
+    )
+    for order_id, sku, quantity in rows:
+        items[order_id].append({"sku": sku, "quantity": quantity})
+    return items
+
+
+def order_row(r: Any, items: list[dict[str, Any]]) -> dict[str, Any]:
+    """Mesmo JSON do schema `Order` (inclusive `allowedEvents`), montado da linha projetada."""
+    return {
+        "orderId": r.order_id,
+        "externalOrderId": r.external_order_id,
+        "customerId": r.customer_id,
+        "status": r.status,
+        "items": items,
+        "createdAt": r.created_at,
+        "updatedAt": r.updated_at,
+        "allowedEvents": order_sm.allowed_events(r.status),
+    }
+
+
+def order_rows(db: Session, rows: list[Any]) -> list[dict[str, Any]]:
+    items = order_items(db, [r.order_id for r in rows])
+    return [order_row(r, items.get(r.order_id, [])) for r in rows]
+
+
+def event_row(e: DbOrderEvent) -> dict[str, Any]:
+    """Mesmo JSON do schema `OrderEvent`."""
+    return {
+        "eventId": e.event_id,
+        "type": e.type,
+        "from": e.from_status,
+        "to": e.to_status,
+        "occurredAt": e.occurred_at,
+        "actor": {"kind": e.actor_kind, "id": e.actor_id},
+        "idempotencyKey": e.idempotency_key,
+    }
@@ -1,7 +1,9 @@
 import json
+from collections import deque
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Any, Dict, List, Tuple
 
 
 @dataclass(frozen=True)
@@ -11,28 +13,140 @@ class Transition:
     to_state: str
 
 
+NO_TRANSITION = -1
+
+
 class OrderStateMachine:
-    def __init__(self, transitions: list[Transition], initial_state: str, final_states: list[str]):
+    """
+    Máquina de estados compilada: estados e eventos viram inteiros (posição na ordem declarada)
+    e a transição é uma tabela `[estado][evento] -> estado` (`NO_TRANSITION` = inválida).
+    Eventos permitidos, alcançabilidade e caminhos mínimos por estado são calculados na carga;
+    em runtime só há consultas a listas e dicts.
+    """
+
+    def __init__(
+        self,
+        transitions: list[Transition],
+        initial_state: str,
+        final_states: list[str],
+        states: list[str] | None = None,
+        events: list[dict[str, Any]] | None = None,
+        name: str = "",
+        version: str = "",
+    ):
+        self.name = name
+        self.version = version
         self.initial_state = initial_state
         self.final_states = set(final_states)
-        self._next: Dict[Tuple[str, str], str] = {}
+        # ordem do fluxo (como declarada); sem `states`, a ordem em que aparecem nas transições
+        seen = [initial_state, *(s for t in transitions for s in (t.from_state, t.to_state))]
+        self.states: list[str] = list(dict.fromkeys([*(states or []), *seen]))
+        self.event_descriptions: Dict[str, str] = {e["type"]: e.get("description", "") for e in events or []}
+        self.events: list[str] = list(dict.fromkeys([*self.event_descriptions, *(t.event_type for t in transitions)]))
+
+        self.state_code: Dict[str, int] = {s: i for i, s in enumerate(self.states)}
+        self.event_code: Dict[str, int] = {e: i for i, e in enumerate(self.events)}
+        self._final = [s in self.final_states for s in self.states]
+        self._table: List[List[int]] = [[NO_TRANSITION] * len(self.events) for _ in self.states]
         for t in transitions:
-            self._next[(t.from_state, t.event_type)] = t.to_state
+            self._table[self.state_code[t.from_state]][self.event_code[t.event_type]] = self.state_code[t.to_state]
+
+        # estado final não aceita eventos (WMS-SM-003), mesmo que haja transição declarada
+        self._allowed: List[Tuple[str, ...]] = [
+            () if self._final[s] else tuple(self.events[e] for e, to in enumerate(row) if to != NO_TRANSITION)
+            for s, row in enumerate(self._table)
+        ]
+        self._paths: List[Dict[int, Tuple[int, ...]]] = [self._bfs(s) for s in range(len(self.states))]
+
+    def _bfs(self, source: int) -> Dict[int, Tuple[int, ...]]:
+        """Caminho mínimo (em eventos) de `source` para cada estado alcançável."""
+        paths: Dict[int, Tuple[int, ...]] = {source: ()}
+        queue = deque([source])
+        while queue:
+            state = queue.popleft()
+            if self._final[state]:
+                continue
+            for event, to in enumerate(self._table[state]):
+                if to != NO_TRANSITION and to not in paths:
+                    paths[to] = paths[state] + (event,)
+                    queue.append(to)
+        return paths
 
     def is_final(self, state: str) -> bool:
         return state in self.final_states
 
     def next_state(self, state: str, event_type: str) -> str | None:
-        return self._next.get((state, event_type))
+        s = self.state_code.get(state)
+        e = self.event_code.get(event_type)
+        if s is None or e is None:
+            return None
+        to = self._table[s][e]
+        return None if to == NO_TRANSITION else self.states[to]
+
+    def allowed_events(self, state: str) -> Tuple[str, ...]:
+        s = self.state_code.get(state)
+        return () if s is None else self._allowed[s]
 
+    def reachable(self, state: str) -> list[str]:
+        s = self.state_code.get(state)
+        return [] if s is None else [self.states[t] for t in sorted(self._paths[s]) if t != s]
 
-def load_state_machine() -> OrderStateMachine:
+    def shortest_path(self, from_state: str, to_state: str) -> list[str] | None:
+        """Eventos do caminho mínimo entre dois estados (`None` se inalcançável)."""
+        s, t = self.state_code.get(from_state), self.state_code.get(to_state)
+        if s is None or t is None or t not in self._paths[s]:
+            return None
+        return [self.events[e] for e in self._paths[s][t]]
+
+    def describe(self) -> dict[str, Any]:
+        """Representação pública (GET /v1/state-machine)."""
+        return {
+            "name": self.name,
+            "version": self.version,
+            "initialState": self.initial_state,
+            "finalStates": [s for s in self.states if self.is_final(s)],
+            "events": [
+                {"code": i, "type": e, "description": self.event_descriptions.get(e, "")}
+                for i, e in enumerate(self.events)
+            ],
+            "states": [
+                {
+                    "code": i,
+                    "name": s,
+                    "final": self._final[i],
+                    "allowedEvents": list(self._allowed[i]),
+                    "transitions": {
+                        self.events[e]: self.states[to]
+                        for e, to in enumerate(self._table[i])
+                        if to != NO_TRANSITION and not self._final[i]
+                    },
+                    "reachable": self.reachable(s),
+                    "shortestPaths": {
+                        self.states[t]: [self.events[e] for e in path]
+                        for t, path in sorted(self._paths[i].items())
+                        if t != i
+                    },
+                }
+                for i, s in enumerate(self.states)
+            ],
+            # tabela compilada: linha = código do estado, coluna = código do evento, -1 = inválida
+            "table": [list(row) for row in self._table],
+        }
+
+
+def _default_path() -> Path:
     # No container, copiamos STATE_MACHINE.json para /app/STATE_MACHINE.json
     path = Path(__file__).resolve().parent.parent / "STATE_MACHINE.json"
     if not path.exists():
         # fallback: /app/STATE_MACHINE.json
         path = Path("/app/STATE_MACHINE.json")
-    data = json.loads(path.read_text(encoding="utf-8"))
+    return path
+
+
+@lru_cache(maxsize=None)
+def load_state_machine(path: Path | None = None) -> OrderStateMachine:
+    """Lê e compila o JSON uma vez por caminho (cacheado)."""
+    data = json.loads((path or _default_path()).read_text(encoding="utf-8"))
     transitions = [
         Transition(from_state=t["from"], event_type=t["eventType"], to_state=t["to"])
         for t in data.get("transitions", [])
@@ -41,8 +155,11 @@ def load_state_machine() -> OrderStateMachine:
         transitions=transitions,
         initial_state=data["initialState"],
         final_states=data.get("finalStates", []),
+        states=data.get("states"),
+        events=data.get("events"),
+        name=data.get("name", ""),
+        version=data.get("version", ""),
     )
 
 
 order_sm = load_state_machine()
-
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .availability import Line, availability_index, order_lines
+from .models import Order as DbOrder
+from .state_machine import order_sm
+
+
+# limites padrão de uma onda (carrinho/rota de separação)
+WAVE_MAX_LINES = int(os.getenv("WAVE_MAX_LINES", "200"))
+WAVE_MAX_UNITS = float(os.getenv("WAVE_MAX_UNITS", "2000"))
+WAVE_MAX_ORDERS = int(os.getenv("WAVE_MAX_ORDERS", "50"))
+
+# candidatos avaliados por SKU a cada passo (mais antigos primeiro)
+_WINDOW = 32
+# pedidos mais antigos testados para semear de novo uma onda que ainda tem espaço
+_RESEED_TRIES = 64
+
+
+@dataclass
+class _Wave:
+    orders: list[int] = field(default_factory=list)
+    skus: set[int] = field(default_factory=set)
+    lines: int = 0
+    units: float = 0.0
+
+
+def wave_id(order_ids: Sequence[str]) -> str:
+    """Id determinístico da onda (mesmos pedidos → mesmo id): base das chaves de idempotência do início."""
+    digest = hashlib.sha1("\n".join(sorted(order_ids)).encode("utf-8")).hexdigest()
+    return f"W-{digest[:16]}"
+
+
+def load_backlog(db: Session) -> list[tuple[str, Sequence[Line]]]:
+    """
+    Pedidos em `A_SEPARAR` (mais antigos primeiro) com as linhas do índice de disponibilidade;
+    só os que o índice ainda não tem (criados por outro worker há segundos) vão ao banco.
+    """
+    order_ids = db.execute(
+        select(DbOrder.order_id)
+        .where(DbOrder.status == order_sm.initial_state)
+        .order_by(DbOrder.created_at, DbOrder.order_id)
+    ).scalars().all()
+    lines: dict[str, Sequence[Line]] = availability_index.lines(order_ids)
+    missing = [oid for oid in order_ids if oid not in lines]
+    if missing:
+        lines.update(order_lines(db, missing))
+    return [(oid, lines[oid]) for oid in order_ids if lines.get(oid)]
+
+
+def _fifo_pick_faces(skus: list[tuple[int, ...]], line_counts: list[int], units: list[float],
+                     max_lines: int, max_units: float, max_orders: int) -> int:
+    """Referência: ondas na ordem de chegada, sem agrupar por SKU (soma de SKUs distintos por onda)."""
+    faces = 0
+    wave: set[int] = set()
+    lines = orders = 0
+    total_units = 0.0
+    for i, order_skus in enumerate(skus):
+        if orders and (lines + line_counts[i] > max_lines or total_units + units[i] > max_units or orders >= max_orders):
+            faces += len(wave)
+            wave, lines, orders, total_units = set(), 0, 0, 0.0
+        wave.update(order_skus)
+        lines += line_counts[i]
+        total_units += units[i]
+        orders += 1
+    return faces + len(wave)
+
+
+def plan_waves(
+    backlog: Sequence[tuple[str, Sequence[Line]]],
+    max_lines: int = WAVE_MAX_LINES,
+    max_units: float = WAVE_MAX_UNITS,
+    max_orders: int = WAVE_MAX_ORDERS,
+) -> dict[str, Any]:
+    """
+    Agrupa o backlog em ondas maximizando SKUs em comum, dentro dos limites de linhas,
+    unidades e pedidos.
+
+    Matriz de incidência esparsa pedido × SKU (SKUs do pedido + lista invertida de pedidos por
+    SKU, em ordem de chegada) e guloso: a onda nasce do pedido mais antigo ainda livre (nenhum
+    pedido fica para trás) e cresce pelos SKUs que já contém, dos mais demandados para os
+    menos. A cada passo avalia até `_WINDOW` pedidos livres do SKU e entra quem tem mais SKUs
+    já presentes na onda. Cada lista invertida tem um ponteiro que pula os pedidos já
+    alocados, então o custo total fica perto de linear no número de linhas.
+    """
+    sku_ids: dict[str, int] = {}
+    skus: list[tuple[int, ...]] = []
+    line_counts: list[int] = []
+    units: list[float] = []
+    for _order_id, lines in backlog:
+        skus.append(tuple({sku_ids.setdefault(sku, len(sku_ids)): None for sku, _wh, _q in lines}))
+        line_counts.append(len(lines))
+        units.append(sum(q for _sku, _wh, q in lines))
+
+    inverted: list[list[int]] = [[] for _ in sku_ids]
+    for i, order_skus in enumerate(skus):
+        for s in order_skus:
+            inverted[s].append(i)
+    ptr = [0] * len(sku_ids)
+    assigned = bytearray(len(skus))
+
+    def fits(wave: _Wave, i: int) -> bool:
+        return (
+            wave.lines + line_counts[i] <= max_lines
+            and wave.units + units[i] <= max_units
+            and len(wave.orders) < max_orders
+        )
+
+    def full(wave: _Wave) -> bool:
+        return wave.lines >= max_lines or wave.units >= max_units or len(wave.orders) >= max_orders
+
+    def add(wave: _Wave, i: int, frontier: list[tuple[int, int]]) -> None:
+        assigned[i] = 1
+        wave.orders.append(i)
+        wave.lines += line_counts[i]
+        wave.units += units[i]
+        for s in skus[i]:
+            if s not in wave.skus:
+                wave.skus.add(s)
+                heapq.heappush(frontier, (ptr[s] - len(inverted[s]), s))
+
+    waves: list[_Wave] = []
+    seed = 0
+    while True:
+        while seed < len(skus) and assigned[seed]:
+            seed += 1
+        if seed >= len(skus):
+            break
+        wave = _Wave()
+        frontier: list[tuple[int, int]] = []
+        # o mais antigo entra mesmo se sozinho estourar os limites (onda própria)
+        add(wave, seed, frontier)
+
+        while not full(wave):
+            if not frontier:
+                # sem SKU em comum que caiba: semeia com o próximo pedido antigo que caiba
+                j, tries = seed, 0
+                while j < len(skus) and tries < _RESEED_TRIES:
+                    if not assigned[j]:
+                        tries += 1
+                        if fits(wave, j):
+                            add(wave, j, frontier)
+                            break
+                    j += 1
+                else:
+                    break
+                continue
+
+            _, s = heapq.heappop(frontier)
+            orders_with_sku = inverted[s]
+            k = ptr[s]
+            while k < len(orders_with_sku) and assigned[orders_with_sku[k]]:
+                k += 1
+            ptr[s] = k
+            candidates = []
+            while k < len(orders_with_sku) and len(candidates) < _WINDOW:
+                i = orders_with_sku[k]
+                if not assigned[i] and fits(wave, i):
+                    overlap = sum(1 for t in skus[i] if t in wave.skus)
+                    # mais SKUs em comum, menos SKUs novos, mais antigo
+                    candidates.append((-overlap, len(skus[i]) - overlap, i))
+                k += 1
+            if not candidates:
+                continue
+            candidates.sort()
+            added = False
+            for _neg_overlap, _new, i in candidates:
+                if fits(wave, i):
+                    add(wave, i, frontier)
+                    added = True
+            if added and k < len(orders_with_sku):
+                heapq.heappush(frontier, (ptr[s] - len(orders_with_sku), s))
+        waves.append(wave)
+
+    order_ids = [oid for oid, _ in backlog]
+    pick_faces = sum(len(w.skus) for w in waves)
+    out_waves = []
+    for w in waves:
+        ids = [order_ids[i] for i in w.orders]
+        out_waves.append({
+            "waveId": wave_id(ids),
+            "orderIds": ids,
+            "orders": len(ids),
+            "lines": w.lines,
+            "units": round(w.units, 6),
+            "skus": len(w.skus),
+        })
+    return {
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "limits": {"maxLines": max_lines, "maxUnits": max_units, "maxOrders": max_orders},
+        "backlog": {"orders": len(skus), "lines": sum(line_counts), "units": round(sum(units), 6), "skus": len(sku_ids)},
+        "summary": {
+            "waves": len(waves),
+            # paradas em posição de SKU somadas nas ondas; referência: ondas por ordem de chegada
+            "pickFaces": pick_faces,
+            "pickFacesFifo": _fifo_pick_faces(skus, line_counts, units, max_lines, max_units, max_orders),
+        },
+        "waves": out_waves,
+    }
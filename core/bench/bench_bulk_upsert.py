@@ -0,0 +1,68 @@
+"""
+Benchmark do upsert em massa de produtos (`/v1/catalog/items/bulk`).
+
+Compara o caminho antigo (um SELECT por linha + flush ORM) com `app.bulk.bulk_upsert`.
+Uso (a partir de `core/`):
+
+    DATABASE_URL=sqlite+pysqlite:///./bench.db python -m bench.bench_bulk_upsert 1000 10000 100000
+"""
+from __future__ import annotations
+
+import sys
+import time
+
+from sqlalchemy import delete, select
+
+from app.bulk import bulk_upsert
+from app.db import Base, SessionLocal, engine
+from app.main import BulkProductItem, now_utc
+from app.models import Product
+
+
+def make_items(n: int, gen: int) -> list[BulkProductItem]:
+    return [BulkProductItem(sku=f"SKU-{i:07d}", description=f"Produto {i} v{gen}", ean=f"789{i:010d}") for i in range(n)]
+
+
+def legacy_upsert(db, items: list[BulkProductItem]) -> None:
+    for item in items:
+        existing = db.execute(select(Product).where(Product.sku == item.sku)).scalar_one_or_none()
+        now = now_utc()
+        if existing:
+            for k, v in item.model_dump().items():
+                setattr(existing, k, v)
+            existing.updated_at = now
+        else:
+            db.add(Product(**item.model_dump(), created_at=now, updated_at=now))
+    db.commit()
+
+
+def set_based_upsert(db, items: list[BulkProductItem]) -> None:
+    bulk_upsert(db, Product, (i.model_dump() for i in items), key_cols=("sku",), now=now_utc())
+    db.commit()
+
+
+def run(fn, n: int) -> tuple[float, float]:
+    with SessionLocal() as db:
+        db.execute(delete(Product))
+        db.commit()
+        t0 = time.perf_counter()
+        fn(db, make_items(n, 1))  # só inserts
+        t_insert = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fn(db, make_items(n, 2))  # só updates
+        t_update = time.perf_counter() - t0
+    return n / t_insert, n / t_update
+
+
+def main(sizes: list[int]) -> None:
+    Base.metadata.create_all(bind=engine)
+    print(f"dialect={engine.dialect.name}")
+    print(f"{'rows':>8} | {'legacy ins/s':>12} | {'legacy upd/s':>12} | {'bulk ins/s':>12} | {'bulk upd/s':>12}")
+    for n in sizes:
+        legacy = run(legacy_upsert, n) if n <= 10_000 else (float("nan"), float("nan"))
+        bulk = run(set_based_upsert, n)
+        print(f"{n:>8} | {legacy[0]:>12.0f} | {legacy[1]:>12.0f} | {bulk[0]:>12.0f} | {bulk[1]:>12.0f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000])
@@ -0,0 +1,102 @@
+"""
+Benchmark do dispatcher da outbox SAP contra o mock do Service Layer (`bench.sap_mock`).
+
+Enfileira N mensagens (pedidos distintos, com DocEntry), drena com o dispatcher e mede a vazão
+por limite de concorrência, com latência simulada por PATCH. Mede também a latência de ponta a
+ponta de um evento isolado (commit → PATCH no SAP) com o dispatcher ocioso.
+Uso (a partir de `core/`, banco descartável):
+
+    DATABASE_URL=sqlite+pysqlite:///./bench.db python -m bench.bench_outbox 2000 0.02 1 8 32
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+from app import outbox
+from app.db import Base, SessionLocal, engine
+from app.models import IntegrationOutbox, Order, OrderEvent
+from app.outbox import OutboxDispatcher, enqueue_order_events
+from bench.sap_mock import MockSap
+
+
+def _event(order_id: str) -> OrderEvent:
+    return OrderEvent(
+        event_id=str(uuid.uuid4()), order_id=order_id, type="DESPACHAR", from_status="AGUARDANDO_COLETA",
+        to_status="DESPACHADO", occurred_at=datetime.now(timezone.utc), actor_kind="SYSTEM", actor_id="bench",
+    )
+
+
+def seed(n: int) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(IntegrationOutbox))
+        enqueue_order_events(db, [(_event(str(uuid.uuid4())), 1000 + i) for i in range(n)])
+        db.commit()
+
+
+async def drain(sap: MockSap, n: int, concurrency: int) -> float:
+    outbox.SAP_OUTBOX_CONCURRENCY = concurrency
+    dispatcher = OutboxDispatcher()
+    await dispatcher.start(sap.base_url)
+    started = time.perf_counter()
+    while len(sap.patches) < n:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    return elapsed
+
+
+async def single_latency(sap: MockSap, samples: int = 20) -> float:
+    dispatcher = OutboxDispatcher()
+    await dispatcher.start(sap.base_url)
+    await asyncio.sleep(0.2)  # ocioso, esperando o próximo aviso/poll
+    total = 0.0
+    for i in range(samples):
+        before = len(sap.patches)
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            enqueue_order_events(db, [(_event(str(uuid.uuid4())), 90000 + i)])
+            db.commit()
+        dispatcher.notify()
+        while len(sap.patches) == before:
+            await asyncio.sleep(0.001)
+        total += time.perf_counter() - started
+    await dispatcher.stop()
+    return total / samples
+
+
+def main(n: int, latency: float, concurrency: list[int]) -> None:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.execute(delete(OrderEvent))
+        db.execute(delete(Order))
+        db.commit()
+    sap = MockSap(latency).start()
+    outbox.SAP_OUTBOX_ENABLED = True  # o padrão segue SAP_BASE_URL, que o bench não define
+    print(f"dialect={engine.dialect.name} mensagens={n} latência SAP={latency * 1000:.0f} ms lote={outbox.SAP_OUTBOX_BATCH}")
+    print(f"{'concorrência':>12} | {'tempo':>8} | {'msgs/s':>8} | {'pico simultâneo':>15}")
+    for c in concurrency:
+        seed(n)
+        sap.patches.clear()
+        sap.peak_in_flight = 0
+        elapsed = asyncio.run(drain(sap, n, c))
+        print(f"{c:>12} | {elapsed:>6.2f} s | {n / elapsed:>8.0f} | {sap.peak_in_flight:>15}")
+    with SessionLocal() as db:
+        db.execute(delete(IntegrationOutbox))
+        db.commit()
+    print(f"evento isolado, commit → PATCH: {asyncio.run(single_latency(sap)) * 1000:.1f} ms")
+    sap.stop()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 2000,
+        float(args[1]) if len(args) > 1 else 0.02,
+        [int(a) for a in args[2:]] or [1, 8, 32],
+    )
@@ -0,0 +1,86 @@
+"""
+Benchmark da conferência de projeção (`projection.verify_order_projections`).
+
+Semeia pedidos com eventos consistentes (caminho feliz até um status aleatório), corrompe uma
+fração e mede a conferência por número de partições, com o pico de memória Python
+(`tracemalloc`, em passada separada), que deve depender do lote e não do tamanho da tabela.
+Uso (a partir de `core/`, banco descartável):
+
+    DATABASE_URL=sqlite+pysqlite:///./bench.db python -m bench.bench_projection 200000 1 4
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, update
+
+from app.db import Base, SessionLocal, engine
+from app.models import Order, OrderEvent
+from app.projection import verify_order_projections
+from app.state_machine import order_sm
+
+CORRUPT_EVERY = 1000
+
+
+def seed(n: int) -> int:
+    flow = order_sm.shortest_path(order_sm.initial_state, "DESPACHADO") or []
+    rng = random.Random(7)
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    total = 0
+    with SessionLocal() as db:
+        db.execute(delete(OrderEvent))
+        db.execute(delete(Order))
+        for base in range(0, n, 10000):
+            orders, events = [], []
+            for i in range(base, min(n, base + 10000)):
+                oid = str(uuid.uuid4())
+                at = start + timedelta(seconds=i)
+                status = order_sm.initial_state
+                steps = rng.randrange(len(flow) + 1)
+                for k, ev in enumerate(flow[:steps]):
+                    nxt = order_sm.next_state(status, ev)
+                    events.append({
+                        "event_id": str(uuid.uuid4()), "order_id": oid, "type": ev, "from_status": status,
+                        "to_status": nxt, "occurred_at": at + timedelta(minutes=k + 1), "actor_kind": "SYSTEM", "actor_id": "bench",
+                    })
+                    status = nxt
+                orders.append({
+                    "order_id": oid, "customer_id": f"C{i % 97:03d}", "status": status,
+                    "created_at": at, "updated_at": at, "version": steps,
+                })
+            db.execute(insert(Order), orders)
+            db.execute(insert(OrderEvent), events)
+            total += len(events)
+        db.commit()
+        ids = [r for r in db.execute(Order.__table__.select().with_only_columns(Order.order_id)).scalars()]
+        for oid in ids[::CORRUPT_EVERY]:
+            db.execute(update(Order).where(Order.order_id == oid).values(version=Order.version + 1))
+        db.commit()
+    return total
+
+
+def main(n: int, partitions: list[int]) -> None:
+    Base.metadata.create_all(bind=engine)
+    t0 = time.perf_counter()
+    events = seed(n)
+    print(f"dialect={engine.dialect.name} pedidos={n} eventos={events} carga={time.perf_counter() - t0:.1f} s")
+    print(f"{'partições':>9} | {'tempo':>8} | {'eventos/s':>10} | {'divergências':>12} | {'pico MiB':>8}")
+    for p in partitions:
+        report = verify_order_projections(repair=False, partitions=p)
+        # pico medido numa segunda passada: o tracemalloc deixa a conferência várias vezes mais lenta
+        tracemalloc.start()
+        verify_order_projections(repair=False, partitions=p)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        secs = report["elapsedMs"] / 1000
+        print(f"{p:>9} | {secs:>6.2f} s | {report['events'] / secs:>10.0f} | {report['mismatches']:>12} | {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(args[0] if args else 200000, args[1:] or [1, 4])
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark da serialização de páginas de pedidos (`/orders`, `/v1/orders`).
+
+Compara, por linha, o caminho antigo (entidades ORM com `selectinload`, `db_order_to_schema`,
+`jsonable_encoder` e `json.dumps`) com o novo (projeção de colunas, `order_row` e
+`serialization.dumps`). Mede a leitura + serialização e só a serialização.
+Uso (a partir de `core/`):
+
+    DATABASE_URL=sqlite+pysqlite:///./bench.db python -m bench.bench_serialization 50 200 1000
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import selectinload
+
+from app.db import Base, SessionLocal, engine
+from app.main import db_order_to_schema
+from app.models import Order, OrderItem
+from app.serialization import ORDER_COLUMNS, _USE_ORJSON, dumps, order_items, order_row
+
+ITEMS_PER_ORDER = 3
+
+
+def seed(n: int) -> None:
+    now = datetime.now(timezone.utc)
+    orders, items = [], []
+    for i in range(n):
+        oid = str(uuid.uuid4())
+        at = now - timedelta(seconds=i)
+        orders.append({
+            "order_id": oid, "external_order_id": f"DOC-{i}", "customer_id": f"C{i % 97:03d}",
+            "status": "A_SEPARAR", "created_at": at, "updated_at": at, "version": 0,
+        })
+        items += [{"order_id": oid, "sku": f"SKU-{j:05d}", "quantity": 1 + j} for j in range(ITEMS_PER_ORDER)]
+    with SessionLocal() as db:
+        db.execute(delete(OrderItem))
+        db.execute(delete(Order))
+        db.execute(insert(Order), orders)
+        db.execute(insert(OrderItem), items)
+        db.commit()
+
+
+def legacy_page(db, n: int) -> tuple[list, float]:
+    rows = db.execute(
+        select(Order).options(selectinload(Order.items)).order_by(Order.updated_at.desc(), Order.order_id.desc()).limit(n)
+    ).scalars().all()
+    t0 = time.perf_counter()
+    body = json.dumps(
+        jsonable_encoder({"items": [db_order_to_schema(o) for o in rows], "nextCursor": None}),
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+    return body, time.perf_counter() - t0
+
+
+def projected_page(db, n: int) -> tuple[bytes, float]:
+    rows = db.execute(
+        select(*ORDER_COLUMNS).order_by(Order.updated_at.desc(), Order.order_id.desc()).limit(n)
+    ).all()
+    items = order_items(db, [r.order_id for r in rows])
+    t0 = time.perf_counter()
+    body = dumps({"items": [order_row(r, items.get(r.order_id, [])) for r in rows], "nextCursor": None}, utc_z=True)
+    return body, time.perf_counter() - t0
+
+
+def measure(fn, n: int, repeat: int) -> tuple[float, float]:
+    """Microssegundos por linha: (leitura + serialização, só serialização)."""
+    total = ser = 0.0
+    for _ in range(repeat):
+        with SessionLocal() as db:
+            t0 = time.perf_counter()
+            _, s = fn(db, n)
+            total += time.perf_counter() - t0
+            ser += s
+    per = 1e6 / (n * repeat)
+    return total * per, ser * per
+
+
+def main(sizes: list[int]) -> None:
+    Base.metadata.create_all(bind=engine)
+    seed(max(sizes))
+    print(f"dialect={engine.dialect.name} orjson={_USE_ORJSON} itens/pedido={ITEMS_PER_ORDER}")
+    print(f"{'rows':>6} | {'legado µs/linha':>15} | {'legado ser.':>11} | {'novo µs/linha':>13} | {'novo ser.':>9}")
+    for n in sizes:
+        repeat = max(3, 2000 // n)
+        measure(legacy_page, n, 1)  # aquece
+        measure(projected_page, n, 1)
+        legacy = measure(legacy_page, n, repeat)
+        fast = measure(projected_page, n, repeat)
+        print(f"{n:>6} | {legacy[0]:>15.1f} | {legacy[1]:>11.1f} | {fast[0]:>13.1f} | {fast[1]:>9.1f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [50, 200, 1000])
@@ -0,0 +1,47 @@
+"""
+Benchmark do planejador de ondas (`waves.plan_waves`) sobre o backlog `A_SEPARAR`.
+
+Mede a carga do backlog (consulta de status + linhas do índice de disponibilidade) e o
+planejamento, e compara as paradas em posição de SKU com ondas por ordem de chegada.
+Uso (a partir de `core/`, com pedidos já no banco):
+
+    DATABASE_URL=sqlite+pysqlite:///./bench.db python -m bench.bench_waves 200 2000 50
+"""
+from __future__ import annotations
+
+import sys
+import time
+
+from app.availability import availability_index
+from app.db import SessionLocal
+from app.waves import load_backlog, plan_waves
+
+
+def main(max_lines: int, max_units: float, max_orders: int) -> None:
+    with SessionLocal() as db:
+        t0 = time.perf_counter()
+        availability_index.rebuild(db)
+        print(f"índice de disponibilidade: {time.perf_counter() - t0:.2f} s")
+        t0 = time.perf_counter()
+        backlog = load_backlog(db)
+        load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    plan = plan_waves(backlog, max_lines, max_units, max_orders)
+    elapsed = time.perf_counter() - t0
+    summary, totals = plan["summary"], plan["backlog"]
+    print(f"backlog: {totals['orders']} pedidos, {totals['lines']} linhas, {totals['skus']} SKUs")
+    print(f"carga do backlog: {load * 1000:.0f} ms | planejamento: {elapsed * 1000:.0f} ms")
+    print(
+        f"ondas: {summary['waves']} | paradas por SKU: {summary['pickFaces']}"
+        f" (ordem de chegada: {summary['pickFacesFifo']},"
+        f" {1 - summary['pickFaces'] / max(1, summary['pickFacesFifo']):.1%} a menos)"
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 200,
+        float(args[1]) if len(args) > 1 else 2000,
+        int(args[2]) if len(args) > 2 else 50,
+    )
@@ -0,0 +1,128 @@
+"""
+Service Layer do SAP B1 mínimo, para testar o write-back da outbox sem SAP de verdade.
+
+`POST /b1s/v1/Login` devolve o cookie `B1SESSION`; `PATCH /b1s/v1/Orders(N)` grava os UDFs
+recebidos (204), responde 401 sem sessão válida e pode simular latência e falhas por DocEntry.
+Uso (a partir de `core/`), apontando a API com `SAP_BASE_URL=http://127.0.0.1:50000/b1s/v1`:
+
+    python -m bench.sap_mock --port 50000 --latency 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class MockSap:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.session = 0
+        self.patches: list[tuple[int, dict[str, Any], float]] = []
+        # DocEntry -> status HTTP fixo, ou lista consumida a cada chamada (ex.: [503, 503])
+        self.fail: dict[int, int | list[int]] = {}
+        self.in_flight = self.peak_in_flight = 0
+        self.lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        assert self._server is not None
+        return f"http://127.0.0.1:{self._server.server_address[1]}/b1s/v1"
+
+    def expire_session(self) -> None:
+        with self.lock:
+            self.session += 1
+
+    def start(self, port: int = 0) -> MockSap:
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _handler(sap: MockSap) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _reply(self, status: int, body: bytes = b"", headers: dict[str, str] | None = None) -> None:
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            if body:
+                self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self) -> Any:
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"null")
+
+        def do_POST(self) -> None:
+            self._json()
+            if self.path != "/b1s/v1/Login":
+                self._reply(404)
+                return
+            with sap.lock:
+                sap.session += 1
+                cookie = f"B1SESSION=s{sap.session}; Path=/"
+            self._reply(200, b'{"SessionTimeout":30}', {"Set-Cookie": cookie})
+
+        def do_PATCH(self) -> None:
+            body = self._json()
+            with sap.lock:
+                sap.in_flight += 1
+                sap.peak_in_flight = max(sap.peak_in_flight, sap.in_flight)
+            try:
+                if f"B1SESSION=s{sap.session}" not in (self.headers.get("Cookie") or ""):
+                    self._reply(401, b'{"error":{"code":301,"message":"Invalid session."}}')
+                    return
+                if sap.latency:
+                    time.sleep(sap.latency)
+                doc_entry = int(self.path.split("(", 1)[1].rstrip(")"))
+                with sap.lock:
+                    code = sap.fail.get(doc_entry)
+                    if isinstance(code, list):
+                        code = code.pop(0) if code else None
+                if code:
+                    self._reply(code, b'{"error":{"code":-1,"message":"mock"}}')
+                    return
+                with sap.lock:
+                    sap.patches.append((doc_entry, body, time.time()))
+                self._reply(204)
+            finally:
+                with sap.lock:
+                    sap.in_flight -= 1
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock do Service Layer (Login + PATCH Orders).")
+    parser.add_argument("--port", type=int, default=50000)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por PATCH")
+    args = parser.parse_args()
+    sap = MockSap(args.latency).start(args.port)
+    print(f"mock SAP em {sap.base_url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"PATCHes recebidos: {len(sap.patches)}")
+    except KeyboardInterrupt:
+        sap.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Testes da API do core contra um SQLite descartável.
+
+As variáveis precisam estar definidas antes do primeiro `import app...`: `app.db` cria o engine
+na importação. Rode a partir de `core/`: `python -m pytest -q`.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+
+_DB_DIR = Path(tempfile.mkdtemp(prefix="wms-core-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite+pysqlite:///{_DB_DIR / 'core.db'}"
+os.environ.setdefault("INTERNAL_SHARED_SECRET", "test-secret")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+ACTOR = {"kind": "USER", "id": "tester"}
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture()
+def internal_headers() -> dict[str, str]:
+    return {"X-Internal-Secret": os.environ["INTERNAL_SHARED_SECRET"]}
+
+
+def create_order(client: TestClient, sku: str = "SKU-1", quantity: float = 1) -> str:
+    r = client.post("/orders", json={"customerId": "C1", "items": [{"sku": sku, "quantity": quantity}]})
+    assert r.status_code == 201, r.text
+    return r.json()["orderId"]
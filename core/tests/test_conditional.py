@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+from .conftest import ACTOR, create_order
+
+
+def test_order_list_etag_round_trip(client):
+    create_order(client)
+    r = client.get("/orders", params={"limit": 5})
+    etag = r.headers["ETag"]
+    again = client.get("/orders", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+
+def test_order_list_etag_moves_with_backdated_transition(client):
+    order_id = create_order(client)
+    etag = client.get("/orders", params={"limit": 200}).headers["ETag"]
+    client.post(
+        f"/orders/{order_id}/events",
+        json={"type": "INICIAR_SEPARACAO", "actor": ACTOR, "occurredAt": "2020-01-01T00:00:00Z"},
+    )
+    r = client.get("/orders", params={"limit": 200}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+
+
+def test_row_leaving_filter_is_not_hidden_by_if_modified_since(client):
+    order_id = create_order(client)
+    params = {"status": "A_SEPARAR", "limit": 200}
+    first = client.get("/v1/orders", params=params)
+    assert order_id in {o["orderId"] for o in first.json()["items"]}
+    # sai do filtro com um occurredAt antigo: nenhum updated_at da página anda
+    client.post(
+        f"/orders/{order_id}/events",
+        json={"type": "INICIAR_SEPARACAO", "actor": ACTOR, "occurredAt": "2020-01-01T00:00:00Z"},
+    )
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(days=1), usegmt=True)
+    r = client.get("/v1/orders", params=params, headers={"If-Modified-Since": future})
+    assert r.status_code == 200
+    assert order_id not in {o["orderId"] for o in r.json()["items"]}
+    r = client.get("/v1/orders", params=params, headers={"If-None-Match": first.headers["ETag"]})
+    assert r.status_code == 200
+
+
+def test_catalog_list_uses_etag_only(client):
+    r = client.get("/v1/catalog/items")
+    assert client.get("/v1/catalog/items", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(days=1), usegmt=True)
+    assert client.get("/v1/catalog/items", headers={"If-Modified-Since": future}).status_code == 200
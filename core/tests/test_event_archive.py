@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.event_archive import ensure_event_schema
+from app.models import OrderEvent as DbOrderEvent
+
+
+def test_schema_upgrade_adds_recorded_at_and_timeline_index(tmp_path):
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    # tabela como era antes de `recorded_at` e do índice (order_id, occurred_at)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE order_events (event_id VARCHAR(64), order_id VARCHAR(64), type VARCHAR(64), "
+            "from_status VARCHAR(64), to_status VARCHAR(64), occurred_at DATETIME, actor_kind VARCHAR(32), "
+            "actor_id VARCHAR(128), idempotency_key VARCHAR(128), correlation_id VARCHAR(128), "
+            "request_id VARCHAR(128), PRIMARY KEY (event_id, occurred_at))"
+        ))
+        conn.execute(text("CREATE INDEX ix_order_events_order_id ON order_events (order_id)"))
+        conn.execute(text(
+            "INSERT INTO order_events (event_id, order_id, type, from_status, to_status, occurred_at, actor_kind, actor_id) "
+            "VALUES ('e1', 'o1', 'INICIAR_SEPARACAO', 'A_SEPARAR', 'EM_SEPARACAO', '2026-01-01 00:00:00', 'USER', 'u')"
+        ))
+
+    ensure_event_schema(engine)
+    ensure_event_schema(engine)  # segunda chamada não faz nada
+
+    insp = inspect(engine)
+    assert "ix_order_events_order_id_occurred_at" in {i["name"] for i in insp.get_indexes(DbOrderEvent.__tablename__)}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT recorded_at FROM order_events")).scalar_one() == "2026-01-01 00:00:00"
+
+
+def test_schema_upgrade_adds_missing_timeline_index_only(tmp_path):
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'partial.db'}")
+    DbOrderEvent.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_order_events_order_id_occurred_at"))
+
+    ensure_event_schema(engine)
+
+    assert "ix_order_events_order_id_occurred_at" in {i["name"] for i in inspect(engine).get_indexes(DbOrderEvent.__tablename__)}
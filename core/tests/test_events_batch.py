@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from .conftest import ACTOR, create_order
+
+_TO_DISPATCH = ["INICIAR_SEPARACAO", "FINALIZAR_SEPARACAO", "SOLICITAR_COTACAO", "CONFIRMAR_COTACAO"]
+
+
+def _batch(client, *events: dict) -> dict:
+    r = client.post("/v1/orders/events:batch", json={"actor": ACTOR, "events": list(events)})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _advance(client, order_id: str, event_types: list[str]) -> None:
+    for event_type in event_types:
+        r = client.post(f"/orders/{order_id}/events", json={"type": event_type, "actor": ACTOR})
+        assert r.status_code == 200, r.text
+
+
+def test_replay_of_final_transition_is_idempotent(client):
+    oid = create_order(client)
+    _advance(client, oid, _TO_DISPATCH)
+    item = {"orderId": oid, "type": "DESPACHAR", "idempotencyKey": f"{oid}-d1"}
+
+    first = _batch(client, item)
+    assert (first["applied"], first["failed"]) == (1, 0)
+    replay = _batch(client, item)
+    assert (replay["applied"], replay["failed"]) == (0, 0)
+    assert replay["results"][0]["result"]["event"]["eventId"] == first["results"][0]["result"]["event"]["eventId"]
+
+    # sem a mesma chave, o pedido final continua recusando
+    other = _batch(client, {**item, "idempotencyKey": f"{oid}-d2"})
+    assert other["failed"] == 1 and other["results"][0]["errorCode"] == "WMS-SM-003"
+
+
+def test_wave_start_replay_after_order_reached_final_state(client):
+    oid = create_order(client)
+    body = {"actor": ACTOR, "orderIds": [oid], "waveId": f"w-{oid}"}
+    r = client.post("/v1/waves:start", json=body)
+    assert r.status_code == 200 and r.json()["applied"] == 1, r.text
+    _advance(client, oid, _TO_DISPATCH[1:] + ["DESPACHAR"])
+
+    r = client.post("/v1/waves:start", json=body)
+    assert r.status_code == 200, r.text
+    assert (r.json()["applied"], r.json()["failed"]) == (0, 0)
+    assert r.json()["results"][0]["result"]["currentStatus"] == "EM_SEPARACAO"
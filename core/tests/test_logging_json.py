@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import json
+import logging
+import sys
+
+from app.logging_json import JsonFormatter
+
+
+def _format(extra: dict, exc_info=None) -> dict:
+    logger = logging.getLogger("test.logging_json")
+    record = logger.makeRecord(logger.name, logging.ERROR, __file__, 0, "Falhou.", None, exc_info, extra=extra)
+    return json.loads(JsonFormatter(encoder="json").format(record))
+
+
+def test_error_extra_is_kept():
+    line = _format(extra={"orderId": "o-1", "error": "arquivo ausente"})
+    assert line["orderId"] == "o-1"
+    assert line["error"] == "arquivo ausente"
+
+
+def test_traceback_wins_over_error_extra():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        line = _format(exc_info=sys.exc_info(), extra={"error": "curto"})
+    assert "ValueError: boom" in line["error"]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import time
+
+from app.order_feed import ORDER_CREATED, ORDER_STATUS_CHANGED, order_feed
+
+from .conftest import ACTOR, create_order
+
+
+def _feed_for(order_id: str, expected: int) -> list[dict]:
+    # a entrega em memória passa pelo loop do app (call_soon_threadsafe)
+    deadline = time.monotonic() + 2
+    while True:
+        messages = [m for m in list(order_feed._buffer) if m.get("orderId") == order_id]
+        if len(messages) >= expected or time.monotonic() > deadline:
+            return messages
+        time.sleep(0.01)
+
+
+def test_feed_receives_create_single_and_batch_transitions(client):
+    oid = create_order(client)
+    r = client.post(f"/orders/{oid}/events", json={"type": "INICIAR_SEPARACAO", "actor": ACTOR})
+    assert r.status_code == 200, r.text
+    r = client.post(
+        "/v1/orders/events:batch",
+        json={"actor": ACTOR, "events": [{"orderId": oid, "type": "FINALIZAR_SEPARACAO", "idempotencyKey": f"{oid}-f"}]},
+    )
+    assert r.status_code == 200 and r.json()["applied"] == 1, r.text
+
+    messages = _feed_for(oid, 3)
+    assert [(m["type"], m.get("status")) for m in messages] == [
+        (ORDER_CREATED, "A_SEPARAR"),
+        (ORDER_STATUS_CHANGED, "EM_SEPARACAO"),
+        (ORDER_STATUS_CHANGED, "CONFERIDO"),
+    ]
+
+
+def test_feed_skips_idempotent_replays(client):
+    oid = create_order(client)
+    body = {"actor": ACTOR, "events": [{"orderId": oid, "type": "INICIAR_SEPARACAO", "idempotencyKey": f"{oid}-i"}]}
+    assert client.post("/v1/orders/events:batch", json=body).json()["applied"] == 1
+    assert client.post("/v1/orders/events:batch", json=body).json()["applied"] == 0
+
+    time.sleep(0.05)
+    assert len(_feed_for(oid, 2)) == 2
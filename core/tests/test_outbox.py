@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.mark.parametrize("method, path", [("GET", "/v1/outbox/stats"), ("POST", "/internal/outbox:retry-failed")])
+def test_outbox_routes_require_internal_secret(client, method, path):
+    assert client.request(method, path).status_code == 403
+    assert client.request(method, path, headers={"X-Internal-Secret": "wrong"}).status_code == 403
+
+
+def test_outbox_stats(client, internal_headers):
+    r = client.get("/v1/outbox/stats", headers=internal_headers)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert set(body["counts"]) == {"PENDING", "PROCESSING", "SENT", "FAILED", "SUPERSEDED"}
+    # sem SAP_BASE_URL o dispatcher não sobe, então também não lidera
+    assert (body["dispatcher"], body["leader"]) == (False, False)
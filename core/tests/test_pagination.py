@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import base64
+import json
+
+import pytest
+
+from .conftest import create_order
+
+
+def _cursor(values: object) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# (rota, cursor adulterado): valores fora do tipo da chave não podem chegar ao SQL
+TAMPERED = [
+    ("/orders", ["2026-01-01T00:00:00", {"a": 1}]),
+    ("/orders", [{"a": 1}, "x"]),
+    ("/orders", ["2026-01-01T00:00:00", True]),
+    ("/v1/orders", ["2026-01-01T00:00:00", ["x"]]),
+    ("/v1/orders", [1, "x"]),
+    ("/v1/orders", [None, "x"]),
+    ("/v1/inventory", ["SKU-1", {"a": 1}]),
+    ("/v1/inventory", ["SKU-1", True]),
+    ("/v1/inventory", ["SKU-1", "1"]),
+    ("/v1/inventory", [["SKU-1"], 1]),
+    ("/v1/catalog/items", [{"a": 1}]),
+    ("/v1/catalog/items", [1]),
+    ("/v1/catalog/items?search=abc", ["o", True]),
+    ("/v1/catalog/items?search=abc", ["o", {"a": 1}]),
+    ("/v1/customers", ["Nome", {"a": 1}]),
+    ("/v1/customers", [1.5, 1]),
+    ("/v1/customers?search=abc", ["o", "1"]),
+]
+
+
+@pytest.mark.parametrize(("path", "values"), TAMPERED)
+def test_tampered_cursor_is_rejected(client, path, values):
+    create_order(client)
+    sep = "&" if "?" in path else "?"
+    r = client.get(f"{path}{sep}cursor={_cursor(values)}")
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"] == "Cursor inválido."
+
+
+@pytest.mark.parametrize("path", ["/orders", "/v1/orders", "/v1/inventory", "/v1/catalog/items", "/v1/customers"])
+@pytest.mark.parametrize("cursor", ["%%%", _cursor([]), _cursor({"a": 1}), _cursor("x")])
+def test_malformed_cursor_is_rejected(client, path, cursor):
+    r = client.get(path, params={"cursor": cursor})
+    assert r.status_code == 400, r.text
+
+
+def test_cursor_round_trip(client):
+    for _ in range(3):
+        create_order(client)
+    first = client.get("/orders", params={"limit": 1}).json()
+    assert first["nextCursor"]
+    second = client.get("/orders", params={"limit": 1, "cursor": first["nextCursor"]})
+    assert second.status_code == 200
+    assert second.json()["items"][0]["orderId"] != first["items"][0]["orderId"]
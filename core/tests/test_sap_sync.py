@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import itertools
+import random
+
+from .conftest import ACTOR
+
+_doc_entries = itertools.count(random.randint(10_000, 1_000_000))
+
+
+def _sap_order(doc_entry: int, update_time: str, quantity: float = 1) -> dict:
+    return {
+        "DocEntry": doc_entry,
+        "DocNum": doc_entry,
+        "CardCode": "C1",
+        "DocStatus": "bost_Open",
+        "UpdateDate": "2026-01-01",
+        "UpdateTime": update_time,
+        "DocumentLines": [{"LineNum": 0, "ItemCode": "SKU-SAP", "Quantity": quantity}],
+    }
+
+
+def _sync(client, internal_headers, *orders: dict) -> dict:
+    r = client.post("/internal/sap/orders", json={"orders": list(orders)}, headers=internal_headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _order_by_doc(client, doc_entry: int) -> dict:
+    items = client.get("/orders", params={"externalOrderId": str(doc_entry), "limit": 200}).json()["items"]
+    return next(o for o in items if o["externalOrderId"] == str(doc_entry))
+
+
+def test_sap_update_moves_updated_at_only_before_picking(client, internal_headers):
+    waiting, picking = next(_doc_entries), next(_doc_entries)
+    _sync(client, internal_headers, _sap_order(waiting, "10:00"), _sap_order(picking, "10:00"))
+    picking_id = _order_by_doc(client, picking)["orderId"]
+    r = client.post(f"/orders/{picking_id}/events", json={"type": "INICIAR_SEPARACAO", "actor": ACTOR})
+    assert r.status_code == 200, r.text
+
+    before = {doc: _order_by_doc(client, doc)["updatedAt"] for doc in (waiting, picking)}
+    out = _sync(client, internal_headers, _sap_order(waiting, "11:00", 2), _sap_order(picking, "11:00", 2))
+
+    # os dois documentos mudaram no SAP e contam em `updated`
+    assert out["updated"] == 2
+    # só o pedido ainda em A_SEPARAR tem `updated_at` movido; o outro mantém a hora da transição
+    assert _order_by_doc(client, waiting)["updatedAt"] != before[waiting]
+    assert _order_by_doc(client, picking)["updatedAt"] == before[picking]
+
+
+def test_unchanged_document_is_skipped(client, internal_headers):
+    doc = next(_doc_entries)
+    _sync(client, internal_headers, _sap_order(doc, "10:00"))
+    out = _sync(client, internal_headers, _sap_order(doc, "10:00"))
+    assert out["updated"] == 0
+    assert out["skipped"] == 1
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import Customer as DbCustomer
+
+
+@pytest.fixture(scope="module")
+def customers() -> str:
+    tag = uuid.uuid4().hex[:6].upper()
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        for code, name in ((f"{tag}-1", "Loja 50% Centro"), (f"{tag}-2", "Loja 500 Norte"), (f"{tag}-3", "LOJA_SUL")):
+            db.add(DbCustomer(card_code=code, card_name=name, created_at=now, updated_at=now))
+        db.commit()
+    return tag
+
+
+@pytest.mark.parametrize("term, names", [
+    # termos curtos vão pelo ILIKE (scan); curinga do LIKE no termo é literal
+    ("_", {"LOJA_SUL"}),
+    ("%", {"Loja 50% Centro"}),
+    ("0%", {"Loja 50% Centro"}),
+    # índice (FTS5/pg_trgm)
+    ("a_s", {"LOJA_SUL"}),
+    ("50%", {"Loja 50% Centro"}),
+])
+def test_like_wildcards_in_search_are_literal(client, customers, term, names):
+    r = client.get("/v1/customers", params={"search": term, "limit": 200})
+    assert r.status_code == 200, r.text
+    found = {c["card_name"] for c in r.json()["data"] if c["card_code"].startswith(customers)}
+    assert found == names